@@ -1,5 +1,6 @@
 from datetime import date, datetime
 from globeqa import tools
+from globeqa.categories import popcount
 
 # Download and parse one month of observations.
 filepath = tools.download_from_api(["sky_conditions"], date(2019, 5, 1), date(2019, 5, 31))
@@ -20,10 +21,13 @@ print("   {:6.2%} ({:5}) are between 7 May 2019 and 10 May 2019.".format(len(obs
 obs_observer = [ob for ob in obs if ob.is_from_observer]
 print("   {:6.2%} ({:5}) are from the GLOBE Observer app.".format(len(obs_observer) / total, len(obs_observer)))
 
-obs_3photos = [ob for ob in obs if len(ob.photo_urls) >= 3]
+# Photo directions and obscurations are stored as bitmasks, so they can be counted for every observation at once.
+num_photos = popcount(tools.get_photo_masks(obs))
+obs_3photos = [ob for ob, n in zip(obs, num_photos) if n >= 3]
 print("   {:6.2%} ({:5}) have at least 3 photos.".format(len(obs_3photos) / total, len(obs_3photos)))
 
-obs_3obscurations = [ob for ob in obs if len(ob.obscurations) >= 3]
+num_obscurations = popcount(tools.get_obscuration_masks(obs))
+obs_3obscurations = [ob for ob, n in zip(obs, num_obscurations) if n >= 3]
 print("   {:6.2%} ({:5}) report at least 3 obscurations.".format(len(obs_3obscurations) / total, len(obs_3obscurations)))
 
 obs_arctic = [ob for ob in obs if ob.lat >= 66.5]
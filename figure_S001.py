@@ -4,7 +4,9 @@ fp = tools.download_from_api(["sky_conditions"], datetime(2017, 1, 1), datetime(
 obs = tools.parse_json(fp)
 
 # Histogram observations by number of obscurations.
-histo, xedges = np.histogram([len(ob.obscurations) for ob in obs if ob.tcc == "obscured"], bins=np.arange(-0.5, 11.5, 1.))
+obscured = np.array([ob.tcc == "obscured" for ob in obs])
+num_obscurations = popcount(tools.get_obscuration_masks(obs))[obscured]
+histo, xedges = np.histogram(num_obscurations, bins=np.arange(-0.5, 11.5, 1.))
 
 fig = plt.figure(figsize=(7, 6))
 ax = fig.add_subplot(111)
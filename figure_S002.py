@@ -4,21 +4,16 @@ fp = tools.download_from_api(["sky_conditions"], datetime(2017, 1, 1), datetime(
 obs = tools.parse_json(fp)
 
 for loop in range(2):
-    # Prepare dict to collect plotted values.
-    vals = {"0 photos": 0, "1 photo": 0, "2 photos": 0, "3 photos": 0, "4 photos": 0, "5 photos": 0, "6 photos": 0}
-    vals_2 = {"North": 0, "East": 0, "South": 0, "West": 0, "Upward": 0, "Downward": 0}
-
-    # For each observation...
-    for ob in tqdm(obs, desc="Sifting observations"):
-        # Count how many photos are included.
-        photos = len(ob.photo_urls)
-
-        vals["{} photo{}".format(photos, "s" if photos != 1 else "")] += 1
-
-        if photos == 5:
-            for direction in vals_2.keys():
-                if direction not in ob.photo_urls.keys():
-                    vals_2[direction] += 1
+    # Count how many photos are included in each observation.
+    photo_masks = tools.get_photo_masks(obs)
+    photos = popcount(photo_masks)
+    counts = np.bincount(photos, minlength=7)
+    vals = {"{} photo{}".format(n, "s" if n != 1 else ""): int(counts[n]) for n in range(7)}
+
+    # Of the observations with 5 photos, count how many omit each direction.
+    omitted = bit_counts(~photo_masks[photos == 5], len(Observation._photo_directions))
+    vals_2 = {direction: int(omitted[Observation._photo_directions.index(direction)])
+              for direction in ["North", "East", "South", "West", "Upward", "Downward"]}
 
     # Find total number of observations for calculating percentages for slice labels.
     total = sum(vals[k] for k in vals)
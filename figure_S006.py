@@ -3,7 +3,7 @@ from figure_common import *
 fp = tools.download_from_api(["sky_conditions"], datetime(2017, 1, 1), datetime(2019, 5, 31))
 obs = tools.parse_json(fp)
 # Do QC, to include land geometry detection.
-tools.do_quality_check(obs, tools.prepare_earth_geometry())
+tools.do_quality_check(obs, tools.prepare_land_mask())
 
 # This dictionary is flag=count pairs.
 flags = tools.get_flag_counts(obs)
@@ -11,11 +11,13 @@ while day <= date(2019, 5, 31):
     day += timedelta(days=1)
 
 # Histogram observations by their measured date.
-counts, bin_edges = np.histogram([ob.measured_dt.date() for ob in obs], dates)
+measured = tools.get_measured_datetimes(obs)
+days = measured[~np.isnat(measured)].astype("datetime64[D]").astype(np.int64)
+counts, _ = np.histogram(days, np.array(dates, dtype="datetime64[D]").astype(np.int64))
 
 fig = plt.figure(figsize=(11, 3.5))
 ax = fig.add_subplot(111)
-ax.stackplot(bin_edges[:-1], counts)
+ax.stackplot(dates[:-1], counts)
 ax.set_xlabel("Date (UTC)")
 ax.set_ylabel("Observations per day")
 ax.set_xlim(date(2017, 1, 1), date(2019, 5, 31))
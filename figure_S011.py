@@ -2,7 +2,7 @@ from figure_common import *
 
 fp = tools.download_from_api(["sky_conditions"], datetime(2017, 1, 1), datetime(2019, 5, 31))
 obs = tools.parse_json(fp)
-tools.do_quality_check(obs, tools.prepare_earth_geometry())
+tools.do_quality_check(obs, tools.prepare_land_mask())
 obs = tools.filter_by_flag_sets(obs, all_of=["LW"])
 
 # Create lists of x and y points for the observations of interest.
@@ -2,7 +2,7 @@ from figure_common import *
 
 obs = tools.parse_json("/Users/mjstarke/PycharmProjects/GLOBE/globeqa/examples/"
                        "land_covers__mosquito_habitat_mapper__tree_heights_20170101_20190531.json")
-tools.do_quality_check(obs, tools.prepare_earth_geometry())
+tools.do_quality_check(obs, tools.prepare_land_mask())
 obs = tools.filter_by_flag_sets(obs, all_of=["LW"])
 
 # Create a figure and axis with cartopy projection.
@@ -3,10 +3,12 @@ from figure_common import *
 fp = tools.download_from_api(["sky_conditions"], datetime(2017, 1, 1), datetime(2019, 5, 31))
 obs = tools.parse_json(fp)
 
-times = [60 * ob.measured_dt.hour + ob.measured_dt.minute for ob in obs]
+measured = tools.get_measured_datetimes(obs)
+measured = measured[~np.isnat(measured)]
+times = (measured - measured.astype("datetime64[D]")).astype("timedelta64[m]").astype(np.int64)
 
 histo, bin_lefts = np.histogram(times, np.arange(0, 1441, 15))
-zeros = sum(1 for ob in obs if ob.measured_dt.hour == ob.measured_dt.minute == 0)
+zeros = np.count_nonzero(times == 0)
 
 fig = plt.figure(figsize=(11, 5))
 ax = fig.add_subplot(111)
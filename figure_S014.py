@@ -2,17 +2,10 @@ from figure_common import *
 
 obs = tools.parse_csv(fp_obs_with_satellite_matches_2018)
 
-globe_categories = [None, "none", "few", "isolated", "scattered", "broken", "overcast", "obscured"]
-globe_labels = ["null", "none", "few", "isolated", "scattered", "broken", "overcast", "obscured"]
-satellite_categories = ["none", "few", "isolated", "scattered", "broken", "overcast"]
-satellite_labels = ["none", "few", "isolated", "scattered", "broken", "overcast"]
 
-
-data = np.zeros((6, 8))
-for ob in [ob for ob in obs if ob.tcc_aqua is not None]:
-    x = satellite_categories.index(ob.tcc_aqua_cat)
-    y = globe_categories.index(ob.tcc)
-    data[x, y] += 1
+matched = [ob for ob in obs if ob.tcc_aqua is not None]
+data = contingency_table([ob.tcc_aqua_code for ob in matched], [ob.tcc_code for ob in matched],
+                         satellite_codes, globe_codes)
 
 ax = plotters.plot_annotated_heatmap(data, satellite_labels, globe_labels, text_formatter="{:.0f}", figsize=(6, 7), text_color_threshold=1250)
 ax.set_xlabel("Aqua total cloud cover")
@@ -39,11 +32,9 @@ plt.tight_layout()
 plt.savefig("img/S014_Jan2018-Dec2018_global_GLOBE-SCvAqua_coincidence_cloud-cover-columnwise.png")
 
 
-data = np.zeros((6, 8))
-for ob in [ob for ob in obs if ob.tcc_terra is not None]:
-    x = satellite_categories.index(ob.tcc_terra_cat)
-    y = globe_categories.index(ob.tcc)
-    data[x, y] += 1
+matched = [ob for ob in obs if ob.tcc_terra is not None]
+data = contingency_table([ob.tcc_terra_code for ob in matched], [ob.tcc_code for ob in matched],
+                         satellite_codes, globe_codes)
 
 ax = plotters.plot_annotated_heatmap(data, satellite_labels, globe_labels, text_formatter="{:.0f}", figsize=(6, 7), text_color_threshold=1300)
 ax.set_xlabel("Terra total cloud cover")
@@ -70,11 +61,9 @@ plt.tight_layout()
 plt.savefig("img/S014_Jan2018-Dec2018_global_GLOBE-SCvTerra_coincidence_cloud-cover-columnwise.png")
 
 
-data = np.zeros((6, 8))
-for ob in [ob for ob in obs if ob.tcc_geo is not None]:
-    x = satellite_categories.index(ob.tcc_geo_cat)
-    y = globe_categories.index(ob.tcc)
-    data[x, y] += 1
+matched = [ob for ob in obs if ob.tcc_geo is not None]
+data = contingency_table([ob.tcc_geo_code for ob in matched], [ob.tcc_code for ob in matched],
+                         satellite_codes, globe_codes)
 
 ax = plotters.plot_annotated_heatmap(data, satellite_labels, globe_labels, text_formatter="{:.0f}", figsize=(6, 7), text_color_threshold=8000)
 ax.set_xlabel("GEO total cloud cover")
@@ -28,17 +28,20 @@ for loop in loops:
 
     tools.patch_obs(obs, "geos_coincident.csv", "tcc_geos", float)
 
+    # Construct the arrays used for scattering once; each sample only indexes into them.
+    pop_x = np.array([ob.lon for ob in obs])
+    pop_y = np.array([ob.lat for ob in obs])
+    pop_geos = np.array([ob["tcc_geos"] for ob in obs])
+    pop_globe = tcc_midpoints(tcc_codes([ob.tcc for ob in obs]))
+
     sample_average_heatmaps = []
 
     for _ in tqdm(range(num_samples), desc="Sampling observations"):
-        sample = np.random.choice(obs, int(len(obs) / 20), False)
+        sample = np.random.choice(len(obs), int(len(obs) / 20), False)
 
-        # Construct lists used for scattering.
-        x = [ob.lon for ob in sample]
-        y = [ob.lat for ob in sample]
-        geos = np.array([ob["tcc_geos"] for ob in sample])
-        globe = np.array([category_to_midpoint[ob.tcc] for ob in sample])
-        sample_diff = globe - geos
+        x = pop_x[sample]
+        y = pop_y[sample]
+        sample_diff = pop_globe[sample] - pop_geos[sample]
 
         # Count observations in each bin.
         sample_counting_heatmap = np.histogram2d(x, y, [lons, lats])[0]
@@ -53,13 +56,9 @@ for loop in loops:
     xx, yy = np.meshgrid(lons, lats)
 
     # Calculate population average difference.
-    x = [ob.lon for ob in obs]
-    y = [ob.lat for ob in obs]
-    geos = np.array([ob["tcc_geos"] for ob in obs])
-    globe = np.array([category_to_midpoint[ob.tcc] for ob in obs])
-    pop_diff = globe - geos
-    pop_counting_heatmap = np.histogram2d(x, y, [lons, lats])[0]
-    pop_weighted_heatmap = np.histogram2d(x, y, [lons, lats], weights=pop_diff)[0]
+    pop_diff = pop_globe - pop_geos
+    pop_counting_heatmap = np.histogram2d(pop_x, pop_y, [lons, lats])[0]
+    pop_weighted_heatmap = np.histogram2d(pop_x, pop_y, [lons, lats], weights=pop_diff)[0]
     pop_average_heatmap = pop_weighted_heatmap / pop_counting_heatmap
 
     # Calculate SEM.
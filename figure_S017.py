@@ -2,11 +2,6 @@ from figure_common import *
 
 sample_count = 1000
 
-globe_categories = [None, "none", "few", "isolated", "scattered", "broken", "overcast", "obscured"]
-globe_labels = ["null", "none", "few", "isolated", "scattered", "broken", "overcast", "obscured"]
-geos_categories = ["none", "few", "isolated", "scattered", "broken", "overcast"]
-geos_labels = ["none", "few", "isolated", "scattered", "broken", "overcast"]
-
 obs = tools.parse_csv(fp_obs_with_satellite_matches_2017_Dec)
 obs.extend(tools.parse_csv(fp_obs_with_satellite_matches_2018))
 cdf1, cdf2 = Dataset(fp_GEOS_Dec), Dataset(fp_GEOS_Jan)
@@ -21,31 +16,24 @@ obs_summer = tools.filter_by_datetime(obs,
                                       earliest=tools.get_cdf_datetime(cdf3, 0) - timedelta(minutes=30),
                                       latest=tools.get_cdf_datetime(cdf4, -1) + timedelta(minutes=30))
 
+# Encode the categories once; tallies are then made by indexing the code arrays.
+geos_winter = tcc_codes([ob["tcc_geos_cat"] for ob in obs_winter])
+globe_winter = np.array([ob.tcc_code for ob in obs_winter])
+geos_summer = tcc_codes([ob["tcc_geos_cat"] for ob in obs_summer])
+globe_summer = np.array([ob.tcc_code for ob in obs_summer])
+
 ########################################################################################################################
-population_winter = np.zeros((6, 8))
-for ob in obs_winter:
-    x = geos_categories.index(ob["tcc_geos_cat"])
-    y = globe_categories.index(ob.tcc)
-    population_winter[x, y] += 1
-
-population_summer = np.zeros((6, 8))
-for ob in obs_summer:
-    x = geos_categories.index(ob["tcc_geos_cat"])
-    y = globe_categories.index(ob.tcc)
-    population_summer[x, y] += 1
+population_winter = contingency_table(geos_winter, globe_winter, satellite_codes, globe_codes)
+population_summer = contingency_table(geos_summer, globe_summer, satellite_codes, globe_codes)
 
 ########################################################################################################################
 rowwise_samples_winter = []
 columnwise_samples_winter = []
 
 for _ in tqdm(range(sample_count), desc="Sampling observations (winter)"):
-    sample = np.random.choice(obs_winter, int(len(obs_winter) / 20), False)
+    sample = np.random.choice(len(obs_winter), int(len(obs_winter) / 20), False)
 
-    data = np.zeros((6, 8))
-    for ob in sample:
-        x = geos_categories.index(ob["tcc_geos_cat"])
-        y = globe_categories.index(ob.tcc)
-        data[x, y] += 1
+    data = contingency_table(geos_winter[sample], globe_winter[sample], satellite_codes, globe_codes)
     rowwise_samples_winter.append(data / data.sum(axis=0, keepdims=True))
     columnwise_samples_winter.append(data / data.sum(axis=1, keepdims=True))
 
@@ -54,19 +42,15 @@ rowwise_samples_summer = []
 columnwise_samples_summer = []
 
 for _ in tqdm(range(sample_count), desc="Sampling observations (summer)"):
-    sample = np.random.choice(obs_summer, int(len(obs_summer) / 20), False)
+    sample = np.random.choice(len(obs_summer), int(len(obs_summer) / 20), False)
 
-    data = np.zeros((6, 8))
-    for ob in sample:
-        x = geos_categories.index(ob["tcc_geos_cat"])
-        y = globe_categories.index(ob.tcc)
-        data[x, y] += 1
+    data = contingency_table(geos_summer[sample], globe_summer[sample], satellite_codes, globe_codes)
     rowwise_samples_summer.append(data / data.sum(axis=0, keepdims=True))
     columnwise_samples_summer.append(data / data.sum(axis=1, keepdims=True))
 
 ########################################################################################################################
 # WINTER POPULATION
-ax = plotters.plot_annotated_heatmap(population_winter, geos_labels, globe_labels, text_color_threshold=2000,
+ax = plotters.plot_annotated_heatmap(population_winter, satellite_labels, globe_labels, text_color_threshold=2000,
                                      figsize=(6, 8))
 ax.set_xlabel("GEOS total cloud cover")
 ax.set_ylabel("GLOBE total cloud cover")
@@ -86,7 +70,7 @@ for i in range(columnwise_mean_winter.shape[0]):
         columnwise_labels_winter[i][j] = "{:.2%}\n±{:.2%}".format(columnwise_mean_winter[i, j],
                                                                   columnwise_sem_winter[i, j])
 
-ax = plotters.plot_annotated_heatmap(columnwise_mean_winter, geos_labels, globe_labels, text_color_threshold=0.5,
+ax = plotters.plot_annotated_heatmap(columnwise_mean_winter, satellite_labels, globe_labels, text_color_threshold=0.5,
                                      figsize=(6, 8), labels=columnwise_labels_winter)
 ax.set_xlabel("GEOS total cloud cover")
 ax.set_ylabel("GLOBE total cloud cover")
@@ -105,7 +89,7 @@ for i in range(rowwise_mean_winter.shape[0]):
     for j in range(rowwise_mean_winter.shape[1]):
         rowwise_labels_winter[i][j] = "{:.2%}\n±{:.2%}".format(rowwise_mean_winter[i, j], rowwise_sem_winter[i, j])
 
-ax = plotters.plot_annotated_heatmap(rowwise_mean_winter, geos_labels, globe_labels, text_color_threshold=0.5,
+ax = plotters.plot_annotated_heatmap(rowwise_mean_winter, satellite_labels, globe_labels, text_color_threshold=0.5,
                                      figsize=(6, 8), labels=rowwise_labels_winter)
 ax.set_xlabel("GEOS total cloud cover")
 ax.set_ylabel("GLOBE total cloud cover")
@@ -116,7 +100,7 @@ plt.savefig("img/S017_Dec2017-Jan2018_global_GLOBE-SCvGEOS_coincidence_total-clo
 
 ########################################################################################################################
 # SUMMER POPULATION
-ax = plotters.plot_annotated_heatmap(population_summer, geos_labels, globe_labels, text_color_threshold=2000,
+ax = plotters.plot_annotated_heatmap(population_summer, satellite_labels, globe_labels, text_color_threshold=2000,
                                      figsize=(6, 8))
 ax.set_xlabel("GEOS total cloud cover")
 ax.set_ylabel("GLOBE total cloud cover")
@@ -136,7 +120,7 @@ for i in range(columnwise_mean_summer.shape[0]):
         columnwise_labels_summer[i][j] = "{:.2%}\n±{:.2%}".format(columnwise_mean_summer[i, j],
                                                                   columnwise_sem_summer[i, j])
 
-ax = plotters.plot_annotated_heatmap(columnwise_mean_summer, geos_labels, globe_labels, text_color_threshold=0.5,
+ax = plotters.plot_annotated_heatmap(columnwise_mean_summer, satellite_labels, globe_labels, text_color_threshold=0.5,
                                      figsize=(6, 8), labels=columnwise_labels_summer)
 ax.set_xlabel("GEOS total cloud cover")
 ax.set_ylabel("GLOBE total cloud cover")
@@ -155,7 +139,7 @@ for i in range(rowwise_mean_summer.shape[0]):
     for j in range(rowwise_mean_summer.shape[1]):
         rowwise_labels_summer[i][j] = "{:.2%}\n±{:.2%}".format(rowwise_mean_summer[i, j], rowwise_sem_summer[i, j])
 
-ax = plotters.plot_annotated_heatmap(rowwise_mean_summer, geos_labels, globe_labels, text_color_threshold=0.5,
+ax = plotters.plot_annotated_heatmap(rowwise_mean_summer, satellite_labels, globe_labels, text_color_threshold=0.5,
                                      figsize=(6, 8), labels=rowwise_labels_summer)
 ax.set_xlabel("GEOS total cloud cover")
 ax.set_ylabel("GLOBE total cloud cover")
@@ -166,7 +150,7 @@ plt.savefig("img/S017_Jun2018-Jul2018_global_GLOBE-SCvGEOS_coincidence_total-clo
 
 ########################################################################################################################
 # DIFF POPULATION
-ax = plotters.plot_annotated_heatmap(population_summer - population_winter, geos_labels, globe_labels,
+ax = plotters.plot_annotated_heatmap(population_summer - population_winter, satellite_labels, globe_labels,
                                      text_color_threshold=-1e9, figsize=(6, 8), cmap="bwr", vmin=-1000., vmax=1000.)
 ax.set_xlabel("GEOS total cloud cover")
 ax.set_ylabel("GLOBE total cloud cover")
@@ -186,7 +170,7 @@ for i in range(columnwise_mean_diff.shape[0]):
     for j in range(columnwise_mean_diff.shape[1]):
         columnwise_labels_diff[i][j] = "{:.2%}\n±{:.2%}".format(columnwise_mean_diff[i, j], columnwise_sem_diff[i, j])
 
-ax = plotters.plot_annotated_heatmap(columnwise_mean_diff, geos_labels, globe_labels, text_color_threshold=-5,
+ax = plotters.plot_annotated_heatmap(columnwise_mean_diff, satellite_labels, globe_labels, text_color_threshold=-5,
                                      figsize=(6, 8), labels=columnwise_labels_diff, cmap="bwr", vmin=-.3, vmax=.3)
 ax.set_xlabel("GEOS total cloud cover")
 ax.set_ylabel("GLOBE total cloud cover")
@@ -207,7 +191,7 @@ for i in range(rowwise_mean_diff.shape[0]):
     for j in range(rowwise_mean_diff.shape[1]):
         rowwise_labels_diff[i][j] = "{:.2%}\n±{:.2%}".format(rowwise_mean_diff[i, j], rowwise_sem_diff[i, j])
 
-ax = plotters.plot_annotated_heatmap(rowwise_mean_diff, geos_labels, globe_labels, text_color_threshold=-.3,
+ax = plotters.plot_annotated_heatmap(rowwise_mean_diff, satellite_labels, globe_labels, text_color_threshold=-.3,
                                      figsize=(6, 8),
                                      labels=rowwise_labels_diff, cmap="bwr", vmin=-.3, vmax=.3)
 ax.set_xlabel("GEOS total cloud cover")
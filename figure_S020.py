@@ -14,6 +14,17 @@ loops = [
 ]
 
 
+def tally(codes: np.ndarray) -> np.ndarray:
+    """
+    :param codes: Cloud cover category codes.
+    :return: The proportion of the codes in each category from none to overcast, counting obscured as overcast.
+    """
+    counts = np.bincount(codes, minlength=len(GLOBE_TCC_CATEGORIES))
+    proportions = counts[satellite_codes].astype(float)
+    proportions[-1] += counts[tcc_code("obscured")]
+    return proportions / proportions.sum()
+
+
 for loop in loops:
     cdf1, cdf2, date_range, geostationary_satellites = loop
 
@@ -30,28 +41,20 @@ for loop in loops:
                (ob.tcc_geo is not None) and
                (ob.tcc_aquaterra is not None)]
 
-        cats = {"none": 0, "few": 1, "isolated": 2, "scattered": 3, "broken": 4, "overcast": 5, "obscured": 5}
+        # Encode the categories once; tallies are then made by indexing the code arrays.
+        globe = np.array([ob.tcc_code for ob in obs])
+        geos = tcc_codes([ob["tcc_geos_cat"] for ob in obs])
+        aquaterra = np.array([ob.tcc_aquaterra_code for ob in obs])
+        geostationary = np.array([ob.tcc_geo_code for ob in obs])
 
-        pop_obscured = sum(1 for ob in obs if ob.tcc == "obscured")
+        pop_obscured = np.count_nonzero(globe == tcc_code("obscured")) / len(globe)
 
         #################################################
-        # Prepare population tally.
-        pop_tally_globe = np.zeros(6)
-        pop_tally_geos = np.zeros(6)
-        pop_tally_aquaterra = np.zeros(6)
-        pop_tally_geostationary = np.zeros(6)
-        # Tally.
-        for ob in obs:
-            pop_tally_globe[cats[ob.tcc]] += 1
-            pop_tally_geos[cats[ob["tcc_geos_cat"]]] += 1
-            pop_tally_aquaterra[cats[ob.tcc_aquaterra_cat]] += 1
-            pop_tally_geostationary[cats[ob.tcc_geo_cat]] += 1
-        # Divide by total for proportions.
-        pop_obscured /= pop_tally_globe.sum()
-        pop_tally_globe /= pop_tally_globe.sum()
-        pop_tally_geos /= pop_tally_geos.sum()
-        pop_tally_aquaterra /= pop_tally_aquaterra.sum()
-        pop_tally_geostationary /= pop_tally_geostationary.sum()
+        # Tally the population, as proportions.
+        pop_tally_globe = tally(globe)
+        pop_tally_geos = tally(geos)
+        pop_tally_aquaterra = tally(aquaterra)
+        pop_tally_geostationary = tally(geostationary)
 
         #################################################
         # Prepare sample tallies.
@@ -61,29 +64,13 @@ for loop in loops:
         sample_tallies_geostationary = []
 
         for _ in tqdm(range(num_samples), desc="Sampling observations"):
-            sample = np.random.choice(obs, int(len(obs) / 20))
-
-            # Prepare a sample tally.
-            sample_tally_globe = np.zeros(6)
-            sample_tally_geos = np.zeros(6)
-            sample_tally_aquaterra = np.zeros(6)
-            sample_tally_geostationary = np.zeros(6)
-            # Tally.
-            for ob in sample:
-                sample_tally_globe[cats[ob.tcc]] += 1
-                sample_tally_geos[cats[ob["tcc_geos_cat"]]] += 1
-                sample_tally_aquaterra[cats[ob.tcc_aquaterra_cat]] += 1
-                sample_tally_geostationary[cats[ob.tcc_geo_cat]] += 1
-            # Divide by total for proportions.
-            sample_tally_globe /= sample_tally_globe.sum()
-            sample_tally_geos /= sample_tally_geos.sum()
-            sample_tally_aquaterra /= sample_tally_aquaterra.sum()
-            sample_tally_geostationary /= sample_tally_geostationary.sum()
-            # Add to tally list.
-            sample_tallies_globe.append(sample_tally_globe)
-            sample_tallies_geos.append(sample_tally_geos)
-            sample_tallies_aquaterra.append(sample_tally_aquaterra)
-            sample_tallies_geostationary.append(sample_tally_geostationary)
+            sample = np.random.choice(len(obs), int(len(obs) / 20))
+
+            # Tally the sample, as proportions.
+            sample_tallies_globe.append(tally(globe[sample]))
+            sample_tallies_geos.append(tally(geos[sample]))
+            sample_tallies_aquaterra.append(tally(aquaterra[sample]))
+            sample_tallies_geostationary.append(tally(geostationary[sample]))
 
         # Get SEMs.
         sample_globe_sem = np.std(sample_tallies_globe, axis=0, ddof=1) / np.sqrt(num_samples)
@@ -3,6 +3,11 @@ from figure_common import *
 fp = tools.download_from_api(["sky_conditions"], datetime(2017, 1, 1), datetime(2019, 5, 31))
 obs = tools.parse_json(fp)
 
+measured = tools.get_measured_datetimes(obs)
+minute_of_hour = (measured - measured.astype("datetime64[h]")).astype("timedelta64[m]").astype(np.int64)
+valid = ~np.isnat(measured)
+obs_sources = np.array([ob.source for ob in obs])
+
 bottom = np.zeros(60)
 artists = []
 sources = ["GLOBE Observer App", "GLOBE Data Entry Web Forms", "GLOBE Data Entry App"]
@@ -12,7 +17,7 @@ ax = fig.add_subplot(111)
 
 for source in sources:
 
-    minutes = [ob.measured_dt.minute for ob in obs if ob.source == source]
+    minutes = minute_of_hour[valid & (obs_sources == source)]
 
     histo, bin_lefts = np.histogram(minutes, np.arange(0, 61, 1))
 
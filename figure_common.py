@@ -17,6 +17,8 @@ import numpy as np
 from operator import itemgetter
 from os.path import isfile, join
 from globeqa import plotters, tools
+from globeqa.categories import (GLOBE_TCC_CATEGORIES, SATELLITE_TCC_CODES, TCC_MIDPOINTS, bit_counts,
+                                 contingency_table, popcount, tcc_code, tcc_codes, tcc_labels, tcc_midpoints)
 from globeqa.observation import Observation
 import shapely.geometry as sgeom
 from shapely.ops import unary_union
@@ -88,14 +90,13 @@ std_colors = {
     "METEOSAT-11": "#cc4444",
 }
 
-# Converts a GLOBE cloud cover category to a real number (the midpoint of the category's range).
-category_to_midpoint = dict(
-    none=0.00,
-    clear=0.05,
-    few=0.05,
-    isolated=0.175,
-    scattered=0.375,
-    broken=0.70,
-    overcast=0.95,
-    obscured=0.95
-)
\ No newline at end of file
+# Converts a GLOBE cloud cover category to a real number (the midpoint of the category's range).  For whole lists of
+# categories, tcc_midpoints(tcc_codes(categories)) is faster.
+category_to_midpoint = {category: float(mid) for category, mid in zip(GLOBE_TCC_CATEGORIES[1:], TCC_MIDPOINTS[1:])}
+
+# The cloud cover category codes (see globeqa.categories) shown on the axes of contingency tables, and their labels.
+# GLOBE categories run from null to obscured; satellite and model categories from none to overcast.
+globe_codes = np.arange(0, 8)
+globe_labels = tcc_labels(globe_codes)
+satellite_codes = SATELLITE_TCC_CODES
+satellite_labels = tcc_labels(satellite_codes)
\ No newline at end of file
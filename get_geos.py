@@ -3,6 +3,7 @@ Gets all coincident output from the NetCDF4 files for the observations given.
 """
 
 from figure_common import *
+from globeqa.categories import bin_cloud_fractions, tcc_categories
 
 obs = tools.parse_csv(fp_obs_with_satellite_matches_2017_Dec)
 obs.extend(tools.parse_csv(fp_obs_with_satellite_matches_2018))
@@ -24,22 +25,21 @@ for cdf in cdfs:
     filtered_obs = tools.filter_by_datetime_cdf(obs, cdf, timedelta(minutes=30))
     # For each of those obs, find the coincident value.
     for ob in tqdm(filtered_obs, desc="Finding GEOS coincidents"):
-        ob.coincident = cdf[cdf_variable][tools.find_closest_gridbox(cdf, ob.measured_dt, ob.lat, ob.lon)]
+        ob["coincident"] = cdf[cdf_variable][tools.find_closest_gridbox(cdf, ob.measured_dt, ob.lat, ob.lon)]
 
 # Save a file with raw cloud cover values.
 with open("geos_coincident.csv", "w") as f:
     for ob in tqdm(obs, "Writing to file"):
         try:
-            f.write("{},{}\n".format(ob.id, ob.coincident))
-        except AttributeError:
+            f.write("{},{}\n".format(ob.id, ob["coincident"]))
+        except KeyError:
             pass
     f.close()
 
-# Save a file with cloud cover categories.
+# Save a file with cloud cover categories, binning every coincident value at once.
+matched = [ob for ob in obs if "coincident" in ob]
+cats = tcc_categories(bin_cloud_fractions([ob["coincident"] for ob in matched]))
 with open("geos_coincident_cat.csv", "w") as f:
-    for ob in tqdm(obs, "Writing to file"):
-        try:
-            f.write("{},{}\n".format(ob.id, tools.bin_cloud_fraction(ob.coincident)))
-        except AttributeError:
-            pass
+    for ob, cat in tqdm(zip(matched, cats), "Writing to file", total=len(matched)):
+        f.write("{},{}\n".format(ob.id, cat))
     f.close()
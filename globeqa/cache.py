@@ -0,0 +1,228 @@
+"""
+An on-disk cache of parsed observation tables.  Each snapshot is a directory of memory-mappable .npy columns plus the
+raw records packed into a single buffer, and is keyed on the path, size, modification time, and content hash of the
+file it was parsed from.  Other arrays derived from a source file, such as feature indexes (see globeqa.index), are
+cached the same way with save_arrays() and load_arrays().
+"""
+
+from globeqa.categories import Vocabulary
+from globeqa.table import ObservationTable, PackedRecords
+from hashlib import blake2b
+import json
+import numpy as np
+import os
+from os.path import abspath, dirname, getsize, isdir, isfile, join
+from shutil import rmtree
+import time
+from typing import Dict, Optional, Tuple
+
+
+# Bump whenever the layout of a snapshot or the columns of ObservationTable change, so that old snapshots are rebuilt.
+SNAPSHOT_VERSION = 5
+
+# The default limit on the total size of a cache directory.
+DEFAULT_MAX_BYTES = 4 << 30
+
+
+def default_cache_dir(fp: str) -> str:
+    """
+    :param fp: The path to a source file.
+    :return: The cache directory used for that file when none is given explicitly: '.globeqa_cache' in the same folder.
+    """
+    return join(dirname(abspath(fp)), ".globeqa_cache")
+
+
+def content_hash(fp: str) -> str:
+    """
+    :param fp: The path to a file.
+    :return: A hex digest of the file's contents.
+    """
+    h = blake2b(digest_size=20)
+    with open(fp, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _snapshot_dir(fp: str, variant: str, cache_dir: Optional[str]) -> str:
+    """
+    :param fp: The path to the source file.
+    :param variant: A string describing the parse options that produced the table.
+    :param cache_dir: The cache directory, or None for the default.
+    :return: The directory in which the snapshot of fp parsed with the given options lives.
+    """
+    name = blake2b("{}|{}".format(abspath(fp), variant).encode("utf8"), digest_size=12).hexdigest()
+    return join(cache_dir if cache_dir is not None else default_cache_dir(fp), name)
+
+
+def load_snapshot(fp: str, variant: str, cache_dir: Optional[str] = None) -> Optional[ObservationTable]:
+    """
+    Loads the cached table for a source file, if there is a current one (see load_arrays()).
+    :param fp: The path to the source file.
+    :param variant: A string describing the parse options that produced the table.
+    :param cache_dir: The cache directory.  Default None, which uses default_cache_dir(fp).
+    :return: The table, with memory-mapped columns and lazily-decoded records, or None if there is no current snapshot.
+    """
+    loaded = load_arrays(fp, variant, cache_dir)
+    if loaded is None:
+        return None
+    arrays, manifest = loaded
+
+    columns = {name: arrays[name] for name in manifest["columns"]}
+    vocabularies = {name: Vocabulary(values[1:], frozen=(name in ObservationTable._tcc_columns))
+                    for name, values in manifest["vocabularies"].items()}
+    records = PackedRecords(arrays["records"], arrays["starts"], arrays["ends"])
+
+    print("--  Loaded cached observations for {}.".format(fp))
+    return ObservationTable(columns, vocabularies, records)
+
+
+def save_snapshot(fp: str, variant: str, table: ObservationTable, cache_dir: Optional[str] = None,
+                  max_bytes: int = DEFAULT_MAX_BYTES):
+    """
+    Saves a table parsed from a source file to the cache (see save_arrays()).
+    :param fp: The path to the source file.
+    :param variant: A string describing the parse options that produced the table.
+    :param table: The table.
+    :param cache_dir: The cache directory.  Default None, which uses default_cache_dir(fp).
+    :param max_bytes: The size limit of the cache directory.  Default DEFAULT_MAX_BYTES (4 GiB).
+    """
+    arrays = {name: np.asarray(table[name]) for name in table.columns}
+
+    records = table.records
+    if not isinstance(records, PackedRecords):
+        records = PackedRecords.pack(records)
+    # Re-pack so that the saved buffer holds exactly the selected records, in order.
+    blob = b"".join(records.raw(i) for i in range(len(records)))
+    lengths = records.ends - records.starts
+    ends = np.cumsum(lengths, dtype=np.int64)
+    arrays.update(records=np.frombuffer(blob, dtype=np.uint8), starts=ends - lengths, ends=ends)
+
+    save_arrays(fp, variant, arrays, cache_dir, max_bytes,
+                columns=table.columns,
+                vocabularies={name: list(table.vocabulary(name)) for name in ObservationTable._encoded_columns})
+
+
+def load_arrays(fp: str, variant: str, cache_dir: Optional[str] = None) -> Optional[Tuple[Dict[str, np.ndarray], dict]]:
+    """
+    Loads the arrays cached for a source file, if they are current.  They are current if the file's size and
+    modification time are unchanged; if only the modification time changed, the contents are hashed and the arrays are
+    still used if they are identical.  Stale entries are deleted.
+    :param fp: The path to the source file.
+    :param variant: A string describing what the arrays hold and the options that produced them.
+    :param cache_dir: The cache directory.  Default None, which uses default_cache_dir(fp).
+    :return: The memory-mapped arrays by name and the manifest (including any extra fields given to save_arrays()), or
+    None if there is no current entry.
+    """
+    directory = _snapshot_dir(fp, variant, cache_dir)
+    manifest_path = join(directory, "manifest.json")
+    if not isfile(manifest_path):
+        return None
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    stat = os.stat(fp)
+    current = (manifest["version"] == SNAPSHOT_VERSION and manifest["variant"] == variant and
+               manifest["size"] == stat.st_size)
+    if current and manifest["mtime_ns"] != stat.st_mtime_ns:
+        # The file was touched (for instance, downloaded again).  Only reuse the entry if the contents are the same.
+        current = manifest["content_hash"] == content_hash(fp)
+        manifest["mtime_ns"] = stat.st_mtime_ns
+    if not current:
+        rmtree(directory, ignore_errors=True)
+        return None
+
+    arrays = {name: np.load(join(directory, name + ".npy"), mmap_mode="r") for name in manifest["arrays"]}
+
+    # Record the use, for least-recently-used eviction.
+    manifest["last_used"] = time.time()
+    _write_manifest(directory, manifest)
+    return arrays, manifest
+
+
+def save_arrays(fp: str, variant: str, arrays: Dict[str, np.ndarray], cache_dir: Optional[str] = None,
+                max_bytes: int = DEFAULT_MAX_BYTES, **extra):
+    """
+    Saves arrays derived from a source file to the cache, then evicts the least recently used entries until the cache
+    directory is no larger than max_bytes.
+    :param fp: The path to the source file.
+    :param variant: A string describing what the arrays hold and the options that produced them.
+    :param arrays: The arrays by name.  They are saved as .npy files, so they must not have an object dtype.
+    :param cache_dir: The cache directory.  Default None, which uses default_cache_dir(fp).
+    :param max_bytes: The size limit of the cache directory.  The entry just saved is never evicted, even if it alone
+    exceeds the limit.  Default DEFAULT_MAX_BYTES (4 GiB).
+    :param extra: Further JSON-serializable fields to store in the manifest.
+    """
+    directory = _snapshot_dir(fp, variant, cache_dir)
+    # Write to a temporary directory first, so that an interrupted save never leaves a partial entry behind.
+    temporary = "{}.tmp{}".format(directory, os.getpid())
+    rmtree(temporary, ignore_errors=True)
+    os.makedirs(temporary)
+
+    stat = os.stat(fp)
+    for name, array in arrays.items():
+        np.save(join(temporary, name + ".npy"), array)
+
+    manifest = dict(
+        version=SNAPSHOT_VERSION,
+        source=abspath(fp),
+        variant=variant,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        content_hash=content_hash(fp),
+        arrays=list(arrays.keys()),
+        last_used=time.time(),
+    )
+    manifest.update(extra)
+    _write_manifest(temporary, manifest)
+
+    rmtree(directory, ignore_errors=True)
+    os.replace(temporary, directory)
+    evict(dirname(directory), max_bytes, keep=directory)
+
+
+def evict(cache_dir: str, max_bytes: int = DEFAULT_MAX_BYTES, keep: Optional[str] = None):
+    """
+    Deletes the least recently used snapshots in a cache directory until its total size is no more than max_bytes.
+    :param cache_dir: The cache directory.
+    :param max_bytes: The size limit.  Default DEFAULT_MAX_BYTES (4 GiB).
+    :param keep: A snapshot directory that must not be evicted.  Default None.
+    """
+    snapshots = []
+    for name in os.listdir(cache_dir):
+        directory = join(cache_dir, name)
+        manifest_path = join(directory, "manifest.json")
+        if not isfile(manifest_path):
+            continue
+        try:
+            with open(manifest_path, "r") as f:
+                last_used = json.load(f)["last_used"]
+        except (ValueError, KeyError):
+            last_used = 0.
+        size = sum(getsize(join(directory, n)) for n in os.listdir(directory))
+        snapshots.append((last_used, size, directory))
+
+    total = sum(size for _, size, _ in snapshots)
+    for _, size, directory in sorted(snapshots):
+        if total <= max_bytes:
+            break
+        if keep is not None and abspath(directory) == abspath(keep):
+            continue
+        rmtree(directory, ignore_errors=True)
+        total -= size
+
+
+def _write_manifest(directory: str, manifest: dict):
+    """
+    Atomically writes a snapshot's manifest.
+    :param directory: The snapshot directory.
+    :param manifest: The manifest.
+    """
+    if not isdir(directory):
+        return
+    # Each process writes its own temporary file, since several may load the same snapshot at once.
+    temporary = join(directory, "manifest.json.tmp{}".format(os.getpid()))
+    with open(temporary, "w") as f:
+        json.dump(manifest, f)
+    os.replace(temporary, join(directory, "manifest.json"))
@@ -0,0 +1,261 @@
+from bisect import bisect_left
+import numpy as np
+from typing import Dict, Hashable, Iterable, List, Optional, Sequence
+
+
+# The GLOBE total cloud cover categories, in the order used for integer codes.  Code 0 is reserved for a missing or
+# invalid cloud cover.  "clear" is accepted by Observation.tcc but is not a current GLOBE category, so it is kept last
+# to leave the codes of the standard categories unchanged.
+GLOBE_TCC_CATEGORIES = (None, "none", "few", "isolated", "scattered", "broken", "overcast", "obscured", "clear")
+
+# The highest cloud fraction (inclusive) of each category from "none" to "broken"; higher fractions are "overcast".
+TCC_THRESHOLDS = np.array([0.00, 0.10, 0.25, 0.50, 0.90])
+
+# The midpoint of the range of cloud fractions of each category, indexed by code.  NaN for a missing cloud cover.
+TCC_MIDPOINTS = np.array([np.nan, 0.00, 0.05, 0.175, 0.375, 0.70, 0.95, 0.95, 0.05])
+
+# The codes of the categories that satellite and model cloud fractions are binned into ("none" to "overcast").
+SATELLITE_TCC_CODES = np.arange(1, 7)
+
+_tcc_codes = {category: code for code, category in enumerate(GLOBE_TCC_CATEGORIES)}
+_tcc_categories = np.array(GLOBE_TCC_CATEGORIES, dtype=object)
+_tcc_threshold_list = TCC_THRESHOLDS.tolist()
+
+
+def bin_cloud_fraction(fraction: Optional[float]) -> Optional[str]:
+    """
+    Bins a cloud fraction into a GLOBE cloud cover category.
+    :param fraction: The cloud fraction, from 0.0 (clear) to 1.0 (overcast).  Values outside this range are clipped to
+    be within the range.
+    :return: The category: one of [none, few, isolated, scattered, broken, overcast], or None if fraction is None or NaN
+    (as Observation.bin_cloud_fraction() always returned for NaN).
+    """
+    if fraction is None or fraction != fraction:
+        return None
+    return GLOBE_TCC_CATEGORIES[bisect_left(_tcc_threshold_list, min(max(fraction, 0.0), 1.0)) + 1]
+
+
+def bin_cloud_fractions(fractions: Iterable[float]) -> np.ndarray:
+    """
+    Bins cloud fractions into GLOBE cloud cover categories.
+    :param fractions: The cloud fractions, from 0.0 (clear) to 1.0 (overcast).  Values outside this range are clipped
+    to be within the range.  NaN stands for a missing cloud fraction.
+    :return: The code of each fraction's category (an index into GLOBE_TCC_CATEGORIES), as a uint8 array.  Code 0 for
+    a NaN fraction.
+    """
+    fractions = np.asarray(fractions, dtype=float)
+    codes = np.digitize(np.clip(fractions, 0.0, 1.0), TCC_THRESHOLDS, right=True) + 1
+    codes[np.isnan(fractions)] = 0
+    return codes.astype(np.uint8)
+
+
+def tcc_code(category: Optional[str]) -> int:
+    """
+    :param category: A GLOBE cloud cover category, or None for a missing cloud cover.
+    :return: The code of the category (its index in GLOBE_TCC_CATEGORIES).
+    :raises ValueError: If category is not a GLOBE cloud cover category.
+    """
+    try:
+        return _tcc_codes[category]
+    except KeyError:
+        raise ValueError("'{}' does not represent a valid cloud cover category.".format(category)) from None
+
+
+def tcc_codes(categories: Iterable[Optional[str]]) -> np.ndarray:
+    """
+    Encodes GLOBE cloud cover categories as integer codes.
+    :param categories: The categories, or None for a missing cloud cover.
+    :return: The code of each category (an index into GLOBE_TCC_CATEGORIES), as a uint8 array.
+    :raises ValueError: If a category is not a GLOBE cloud cover category.
+    """
+    try:
+        return np.array([_tcc_codes[category] for category in categories], dtype=np.uint8)
+    except KeyError as e:
+        raise ValueError("'{}' does not represent a valid cloud cover category.".format(e.args[0])) from None
+
+
+def tcc_midpoint(category: str) -> float:
+    """
+    :param category: A GLOBE cloud cover category.
+    :return: The midpoint of the category's range of cloud fractions.
+    :raises ValueError: If category is not a GLOBE cloud cover category.
+    """
+    code = _tcc_codes.get(category, 0)
+    if code == 0:
+        raise ValueError("'{}' does not represent a valid cloud cover category.".format(category))
+    return float(TCC_MIDPOINTS[code])
+
+
+def tcc_categories(codes: Iterable[int]) -> np.ndarray:
+    """
+    :param codes: Cloud cover category codes, as returned by tcc_codes() or bin_cloud_fractions().
+    :return: The category of each code, as an object array (None for code 0).
+    """
+    return _tcc_categories[np.asarray(codes, dtype=np.intp)]
+
+
+def tcc_midpoints(codes: Iterable[int]) -> np.ndarray:
+    """
+    :param codes: Cloud cover category codes, as returned by tcc_codes() or bin_cloud_fractions().
+    :return: The midpoint of the range of cloud fractions of each code's category (NaN for code 0).
+    """
+    return TCC_MIDPOINTS[np.asarray(codes, dtype=np.intp)]
+
+
+class Vocabulary:
+    def __init__(self, values: Iterable[Hashable] = (), frozen: bool = False):
+        """
+        A Vocabulary maps categorical values to small integer codes (dictionary encoding).  Code 0 always stands for
+        None, and every other value is assigned the next free code the first time it is seen.
+        :param values: Values to assign codes to up front, in order.  Default ().
+        :param frozen: Whether to refuse values that are not already in the vocabulary.  Default False.
+        """
+        self._values = [None]
+        self._codes = {None: 0}  # type: Dict[Hashable, int]
+        self.frozen = False
+        for value in values:
+            self.code(value)
+        self.frozen = frozen
+
+    def __len__(self):
+        return len(self._values)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __contains__(self, value):
+        return value in self._codes
+
+    def __getitem__(self, code: int):
+        return self._values[code]
+
+    def code(self, value: Optional[Hashable]) -> int:
+        """
+        Gets the code for a value, assigning a new code if needed.
+        :param value: The value to encode.
+        :return: The integer code of the value.
+        :raises ValueError: If the vocabulary is frozen and the value is not in it.
+        """
+        try:
+            return self._codes[value]
+        except KeyError:
+            if self.frozen:
+                raise ValueError("'{}' is not in this vocabulary.".format(value))
+            self._codes[value] = len(self._values)
+            self._values.append(value)
+            return self._codes[value]
+
+    def decode(self, codes: Iterable[int]) -> List[Optional[Hashable]]:
+        """
+        :param codes: The codes to decode.
+        :return: The value for each code.
+        """
+        return [self._values[c] for c in codes]
+
+    @property
+    def values(self) -> Sequence[Optional[Hashable]]:
+        """
+        :return: All values in the vocabulary, indexed by code.
+        """
+        return tuple(self._values)
+
+
+def tcc_labels(codes: Iterable[int]) -> List[str]:
+    """
+    :param codes: Cloud cover category codes.
+    :return: A label for each code, for use in plots: the category, or "null" for code 0.
+    """
+    return ["null" if code == 0 else GLOBE_TCC_CATEGORIES[code] for code in codes]
+
+
+def contingency_table(row_codes: Iterable[int], column_codes: Iterable[int], rows: Optional[Sequence[int]] = None,
+                      columns: Optional[Sequence[int]] = None) -> np.ndarray:
+    """
+    Counts how many times each pair of cloud cover categories occurs, such as a satellite's category and the GLOBE
+    category of the same observation.
+    :param row_codes: The category code of each pair's first member.
+    :param column_codes: The category code of each pair's second member.
+    :param rows: The codes to make rows for, in order.  Default None, which makes a row for every code.
+    :param columns: The codes to make columns for, in order.  Default None, which makes a column for every code.
+    :return: The counts, where element [i, j] is the number of pairs of codes (rows[i], columns[j]).  Pairs with a code
+    that has no row or column are not counted.
+    :raises ValueError: If row_codes and column_codes have different lengths.
+    """
+    row_codes = np.asarray(row_codes, dtype=np.intp)
+    column_codes = np.asarray(column_codes, dtype=np.intp)
+    if row_codes.shape != column_codes.shape:
+        raise ValueError("Arguments 'row_codes' and 'column_codes' must have the same length.")
+
+    n = len(GLOBE_TCC_CATEGORIES)
+    counts = np.bincount(row_codes * n + column_codes, minlength=n * n).reshape(n, n)
+    if rows is not None:
+        counts = counts[np.asarray(rows, dtype=np.intp)]
+    if columns is not None:
+        counts = counts[:, np.asarray(columns, dtype=np.intp)]
+    return counts
+
+
+def pack_names(present: Iterable[str], names: Sequence[str]) -> int:
+    """
+    Packs a set of names into a bitmask, where bit i stands for names[i].
+    :param present: The names to set the bits of.
+    :param names: All names that may be present, in bit order.
+    :return: The bitmask.
+    :raises ValueError: If a name is not in names.
+    """
+    mask = 0
+    for name in present:
+        mask |= 1 << names.index(name)
+    return mask
+
+
+def unpack_names(mask: int, names: Sequence[str]) -> List[str]:
+    """
+    :param mask: A bitmask, where bit i stands for names[i].
+    :param names: All names that may be present, in bit order.
+    :return: The names whose bits are set, in bit order.
+    """
+    return [name for i, name in enumerate(names) if mask >> i & 1]
+
+
+def unpack_bits(masks: Iterable[int], bits: int) -> np.ndarray:
+    """
+    :param masks: Unsigned integer bitmasks.
+    :param bits: The number of low bits to unpack.  At most the width of the masks' dtype.
+    :return: A uint8 array of shape (len(masks), bits), where element [i, j] is bit j of masks[i].
+    """
+    masks = np.asarray(masks)
+    masks = np.ascontiguousarray(masks, dtype=masks.dtype.newbyteorder("<"))
+    size = masks.dtype.itemsize
+    # np.unpackbits() puts the most significant bit of each byte first, so reverse the bits of each byte.
+    unpacked = np.unpackbits(masks.view(np.uint8).reshape(len(masks), size), axis=1)
+    return unpacked.reshape(len(masks), size, 8)[:, :, ::-1].reshape(len(masks), size * 8)[:, :bits]
+
+
+def popcount(masks: Iterable[int]) -> np.ndarray:
+    """
+    :param masks: Unsigned integer bitmasks.
+    :return: The number of bits set in each mask.
+    """
+    masks = np.asarray(masks)
+    return unpack_bits(masks, masks.dtype.itemsize * 8).sum(axis=1)
+
+
+def bit_counts(masks: Iterable[int], bits: int) -> np.ndarray:
+    """
+    :param masks: Unsigned integer bitmasks.
+    :param bits: The number of low bits to count.
+    :return: The number of masks in which each bit is set.
+    """
+    return unpack_bits(masks, bits).sum(axis=0)
+
+
+def co_occurrence(masks: Iterable[int], bits: int) -> np.ndarray:
+    """
+    :param masks: Unsigned integer bitmasks.
+    :param bits: The number of low bits to count.
+    :return: An array of shape (bits, bits), where element [i, j] is the number of masks in which both bits i and j
+    are set.  The diagonal is the same as bit_counts().
+    """
+    unpacked = unpack_bits(masks, bits).astype(np.int64)
+    return unpacked.T @ unpacked
@@ -0,0 +1,247 @@
+"""
+A long-running quality-check service for the daily pipeline.  Starting a fresh process for each day's download pays
+for importing cartopy, shapely and netCDF4 and for preparing the land geometry, which takes far longer than checking a
+few thousand observations.  A QualityDaemon does that once, then watches a drop folder (and, optionally, downloads
+yesterday's observations into it every day) and checks each new file as it arrives.  For each file, it writes a
+summary of the flags raised and a GeoJSON export of the flagged observations.
+
+Run it from the command line with:
+
+    python -m globeqa.daemon DROP_FOLDER OUTPUT_FOLDER [--flag-store flags.db] [--daily-at 01:30]
+"""
+
+import argparse
+from datetime import date, datetime, time as dtime, timedelta
+from globeqa import tools
+from globeqa.flagstore import FlagStore
+from globeqa.observation import Observation
+import json
+import os
+from os.path import basename, getmtime, getsize, isfile, join
+import time
+from typing import Dict, List, Optional
+
+
+# The suffixes of the files in the drop folder that are checked.
+_suffixes = (".json", ".geojson", ".json.gz", ".json.xz", ".geojson.gz", ".geojson.xz")
+
+
+def _quiet(iterable, *_, **__):
+    """
+    A stand-in for tqdm that prints nothing, since a service has no terminal to draw progress bars on.
+    """
+    return iterable
+
+
+class QualityDaemon:
+    def __init__(self, drop_folder: str, output_folder: str, flag_store: Optional[str] = None,
+                 geometry_resolution: str = "50m", shapefile: Optional[str] = None, land_mask: bool = True,
+                 settle: float = 5.):
+        """
+        A QualityDaemon checks the GeoJSON files that appear in a drop folder.  The land geometry is loaded when it is
+        created, and kept for as long as it runs.
+        :param drop_folder: The folder to watch.  It is created if needed.
+        :param output_folder: The folder to write summaries and exports to.  It is created if needed.  It also holds
+        the list of files that have been checked, so that they are not checked again after a restart.
+        :param flag_store: The path of a flag store (see globeqa.flagstore), so that observations that appear in more
+        than one file are only checked once.  Default None, which checks every observation in every file.
+        :param geometry_resolution: The resolution of the NaturalEarth land shapefile to use, if shapefile is None:
+        '10m', '50m' or '110m'.  Default '50m'.
+        :param shapefile: The path to a local land shapefile to use instead of NaturalEarth's.  Default None.
+        :param land_mask: Whether to check land with a land mask (see tools.prepare_land_mask()) rather than the land
+        geometry alone.  The flags are the same either way.  Default True.
+        :param settle: How long (in seconds) a file must go unmodified before it is checked, so that files are not
+        read while they are still being written.  Default 5.
+        """
+        self.drop_folder = drop_folder
+        self.output_folder = output_folder
+        self.settle = settle
+        os.makedirs(drop_folder, exist_ok=True)
+        os.makedirs(output_folder, exist_ok=True)
+
+        if land_mask:
+            self.land = tools.prepare_land_mask(geometry_resolution, shapefile=shapefile, tqdm=_quiet)
+        else:
+            self.land = tools.prepare_earth_geometry(geometry_resolution, shapefile=shapefile)
+        self.store = FlagStore(flag_store) if flag_store is not None else None
+
+        # The size and modification time of each file that has been checked, by name.
+        self._state_path = join(output_folder, "checked.json")
+        self._checked = dict()  # type: Dict[str, List[int]]
+        if isfile(self._state_path):
+            with open(self._state_path, "r") as f:
+                self._checked = json.load(f)
+        self._last_download = None  # type: Optional[date]
+
+    def close(self):
+        """
+        Closes the flag store, if there is one.
+        """
+        if self.store is not None:
+            self.store.close()
+
+    def pending(self) -> List[str]:
+        """
+        :return: The paths of the files in the drop folder that are new or have changed since they were checked, and
+        have not been modified for settle seconds, oldest first.
+        """
+        now = time.time()
+        paths = []
+        for name in os.listdir(self.drop_folder):
+            fp = join(self.drop_folder, name)
+            if not name.endswith(_suffixes) or not isfile(fp):
+                continue
+            if self._checked.get(name) != _signature(fp) and now - getmtime(fp) >= self.settle:
+                paths.append(fp)
+        return sorted(paths, key=getmtime)
+
+    def check_file(self, fp: str) -> dict:
+        """
+        Checks the observations in a file, and writes the summary of the flags raised (<name>.flags.json) and an export
+        of the flagged observations (<name>.flagged.geojson) to the output folder.
+        :param fp: The path to the GeoJSON file.
+        :return: The summary: the file, the number of observations and of flagged observations, the number of each
+        flag raised, and how long it took.
+        """
+        start = time.time()
+        name = basename(fp)
+        signature = _signature(fp)
+        obs = tools.parse_json(fp, tqdm=_quiet)
+        tools.do_quality_check(obs, self.land, tqdm=_quiet, store=self.store)
+
+        flagged = [ob for ob in obs if ob.flag_mask != 0]
+        summary = dict(file=name, checked_at=datetime.now().isoformat(timespec="seconds"), observations=len(obs),
+                       flagged=len(flagged), flags=tools.get_flag_counts(obs))
+
+        stem = name[:-len(next(suffix for suffix in _suffixes if name.endswith(suffix)))]
+        _write_json_atomically(join(self.output_folder, stem + ".flags.json"), summary)
+        _write_json_atomically(join(self.output_folder, stem + ".flagged.geojson"),
+                               dict(type="FeatureCollection", features=[_as_feature(ob) for ob in flagged]))
+
+        self._checked[name] = signature
+        _write_json_atomically(self._state_path, self._checked)
+        summary["seconds"] = round(time.time() - start, 3)
+        print("--  Checked {} observations in {} in {:.3f} s; {} flagged.".format(len(obs), name, summary["seconds"],
+                                                                               len(flagged)))
+        return summary
+
+    def poll(self) -> List[dict]:
+        """
+        Checks every pending file (see pending()).  A file that cannot be checked is reported and skipped until it
+        changes, so that one bad file does not stop the service.
+        :return: The summary of each file checked (see check_file()).
+        """
+        summaries = []
+        for fp in self.pending():
+            # Taken before checking, since a bad file may be removed while it is being checked.
+            signature = _signature(fp)
+            try:
+                summaries.append(self.check_file(fp))
+            except Exception as e:
+                print("--  Could not check {}: {!r}".format(fp, e))
+                self._checked[basename(fp)] = signature
+                _write_json_atomically(self._state_path, self._checked)
+        return summaries
+
+    def download_if_due(self, daily_at: dtime, protocols: Optional[List[str]] = None):
+        """
+        Downloads yesterday's observations into the drop folder, if it is past daily_at and they have not been
+        downloaded today.  A failed download is reported, and tried again the next time.
+        :param daily_at: The time of day after which to download.
+        :param protocols: The protocols to download.  The file is named after them (<protocols>_<date>.json).  Default
+        None, which downloads tools.DAILY_PROTOCOLS.
+        """
+        if protocols is None:
+            protocols = tools.DAILY_PROTOCOLS
+        now = datetime.now()
+        if now.time() < daily_at or self._last_download == now.date():
+            return
+        try:
+            fp = tools.download_from_api(protocols, now.date() - timedelta(1),
+                                         download_dest=join(self.drop_folder, "%P_%S.json"), tqdm=_quiet)
+        except Exception as e:
+            print("--  Could not download observations: {!r}".format(e))
+            return
+        # download_from_api() reports failures instead of raising them, and only creates the file once it succeeds.
+        if isfile(fp) and getsize(fp) > 0:
+            self._last_download = now.date()
+        else:
+            print("--  Could not download observations to {}; trying again later.".format(fp))
+
+    def run(self, interval: float = 60., daily_at: Optional[dtime] = None):
+        """
+        Checks pending files every interval seconds until interrupted.
+        :param interval: The number of seconds between polls of the drop folder.  Default 60.
+        :param daily_at: If given, yesterday's observations are downloaded into the drop folder every day after this
+        time (see download_if_due()).  Default None, which only watches the drop folder.
+        """
+        print("--  Watching {} for observations.".format(self.drop_folder))
+        try:
+            while True:
+                if daily_at is not None:
+                    self.download_if_due(daily_at)
+                self.poll()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("--  Stopped.")
+        finally:
+            self.close()
+
+
+def _signature(fp: str) -> List[int]:
+    """
+    :param fp: The path to a file.
+    :return: The size of the file and the time it was last modified (in nanoseconds), which change when it does.
+    """
+    stat = os.stat(fp)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _as_feature(ob: Observation) -> dict:
+    """
+    :param ob: An observation.
+    :return: The observation as a GeoJSON feature that tools.parse_json() can read, with its flags added as the
+    "flags" property.
+    """
+    properties = ob.as_dict()
+    lat = properties.pop("Observation Latitude", None)
+    lon = properties.pop("Observation Longitude", None)
+    properties["flags"] = ob.flags
+    return dict(type="Feature", geometry=dict(type="Point", coordinates=[lon, lat]), properties=properties)
+
+
+def _write_json_atomically(fp: str, content):
+    """
+    Writes JSON to a file through a temporary file, so that readers never see it half-written.
+    :param fp: The path to the file.
+    :param content: The object to write.
+    """
+    temporary = "{}.tmp{}".format(fp, os.getpid())
+    with open(temporary, "w") as f:
+        json.dump(content, f)
+    os.replace(temporary, fp)
+
+
+def main(args: Optional[List[str]] = None):
+    """
+    Runs a QualityDaemon from the command line.
+    :param args: The command-line arguments.  Default None, which uses sys.argv.
+    """
+    parser = argparse.ArgumentParser(description="Quality checks GLOBE observations as they are downloaded.")
+    parser.add_argument("drop_folder", help="The folder to watch for GeoJSON files.")
+    parser.add_argument("output_folder", help="The folder to write flag summaries and flagged observations to.")
+    parser.add_argument("--flag-store", help="The path of an SQLite flag store, so observations are checked once.")
+    parser.add_argument("--interval", type=float, default=60., help="Seconds between polls.  Default 60.")
+    parser.add_argument("--daily-at", help="Download yesterday's observations every day after this time (HH:MM).")
+    parser.add_argument("--shapefile", help="A local land shapefile to use instead of NaturalEarth's.")
+    parser.add_argument("--resolution", default="50m", help="The NaturalEarth land resolution.  Default 50m.")
+    parsed = parser.parse_args(args)
+
+    daily_at = datetime.strptime(parsed.daily_at, "%H:%M").time() if parsed.daily_at is not None else None
+    daemon = QualityDaemon(parsed.drop_folder, parsed.output_folder, flag_store=parsed.flag_store,
+                           geometry_resolution=parsed.resolution, shapefile=parsed.shapefile)
+    daemon.run(parsed.interval, daily_at)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+Reading and writing the files that observations are stored in: plain or compressed data files, GeoJSON
+FeatureCollections that are streamed one feature at a time, and files downloaded from a URL.
+"""
+
+import codecs
+from contextlib import closing, contextmanager
+import gzip
+import json
+import locale
+import lzma
+import os
+from os.path import isfile
+import re
+from shutil import copyfileobj
+import time
+from typing import Any, BinaryIO, Iterator, Optional
+from urllib.request import urlopen
+
+
+# The formats that files can be compressed in: the suffix of their file names, the magic number that they begin with,
+# and the function that opens them.
+_compression_formats = {
+    "gzip": (".gz", b"\x1f\x8b", gzip.open),
+    "xz": (".xz", b"\xfd7zXZ\x00", lzma.open),
+}
+
+# The size of the buffer used when reading data files.  Large reads keep network-mounted storage busy.
+_read_buffer_size = 1 << 20
+
+
+def compression_of(fp: str) -> Optional[str]:
+    """
+    Determines whether a file is compressed from its first few bytes, regardless of its name.
+    :param fp: The path to the file.
+    :return: The compression format ('gzip' or 'xz'), or None if the file is not compressed.
+    """
+    with open(fp, "rb") as f:
+        head = f.read(8)
+    for name, (_, magic, _) in _compression_formats.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+@contextmanager
+def open_data_file(fp: str) -> Iterator[BinaryIO]:
+    """
+    Opens a data file for reading as bytes, decompressing it on the fly if it is gzip- or xz-compressed.  Only the
+    part of the file that has been read is ever decompressed, so compressed files can be streamed just like plain
+    ones, although they cannot be read from an arbitrary byte offset efficiently.
+    :param fp: The path to the file.
+    :return: A context manager that gives the (decompressed) binary file object.
+    """
+    compression = compression_of(fp)
+    with open(fp, "rb", buffering=_read_buffer_size) as raw:
+        if compression is None:
+            yield raw
+        else:
+            with _compression_formats[compression][2](raw, "rb") as f:
+                yield f
+
+
+def compression_suffix(compression: str) -> str:
+    """
+    :param compression: A compression format: 'gzip' or 'xz'.
+    :return: The suffix of the names of files compressed in that format: '.gz' or '.xz'.
+    :raises ValueError: If the format is not supported.
+    """
+    if compression not in _compression_formats:
+        raise ValueError("Unknown compression '{}'; expected one of {}.".format(
+            compression, ", ".join(sorted(_compression_formats))))
+    return _compression_formats[compression][0]
+
+
+def open_for_writing(fp: str, compression: Optional[str], mode: str, **kwargs):
+    """
+    :param fp: The path to the file.
+    :param compression: The format to compress the file with, or None to write it as is.
+    :param mode: The mode to open the file in: 'wb' or 'wt'.
+    :param kwargs: Further arguments to the opening function, such as the encoding.
+    :return: The file object.
+    """
+    if compression is None:
+        return open(fp, mode, **kwargs)
+    return _compression_formats[compression][2](fp, mode, **kwargs)
+
+
+def detect_encoding(f: BinaryIO) -> str:
+    """
+    Determines the text encoding of a binary file from its first few kilobytes.  A byte-order mark takes precedence;
+    otherwise UTF-8 is assumed unless the sample is not valid UTF-8, in which case the locale's preferred encoding is
+    used.  The file position is restored afterwards.
+    :param f: The binary file object.
+    :return: The name of the codec to decode the file with.
+    """
+    position = f.tell()
+    sample = f.read(1 << 16)
+    f.seek(position)
+
+    for bom, encoding in [(codecs.BOM_UTF8, "utf-8-sig"), (codecs.BOM_UTF16_LE, "utf-16"),
+                          (codecs.BOM_UTF16_BE, "utf-16")]:
+        if sample.startswith(bom):
+            return encoding
+
+    try:
+        # The sample may cut a multi-byte character in half, so decode it as a non-final chunk.
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        return locale.getpreferredencoding(False)
+
+
+class GeoJSONStream:
+    """
+    An incremental reader over a GeoJSON FeatureCollection.  Text is decoded from the underlying binary file in chunks
+    and individual JSON values are decoded with json.JSONDecoder.raw_decode as soon as they are complete, so no more
+    than one chunk plus one feature is buffered at any time.
+    """
+
+    _whitespace = re.compile(r"[ \t\n\r]*")
+
+    def __init__(self, f: BinaryIO, encoding: str = "utf-8", chunk_size: int = 1 << 20, track_offsets: bool = False):
+        """
+        :param f: The binary file object, positioned at the start of the document or at the start of an item in the
+        'features' array.
+        :param encoding: The text encoding of the file.  Default 'utf-8'.
+        :param chunk_size: The number of bytes to read from the file at a time.  Default 1 MiB.
+        :param track_offsets: Whether to keep track of the byte offset in the file that has been read up to (offset),
+        which is needed to read the 'features' array in shards.  Default False.
+        :raises ValueError: If track_offsets is True but the encoding has a variable-length byte-order mark.
+        """
+        self._f = f
+        self._decoder = codecs.getincrementaldecoder(encoding)()
+        self._json = json.JSONDecoder()
+        self._chunk_size = chunk_size
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+        self._track = track_offsets
+        self.offset = f.tell()
+        if track_offsets:
+            name = codecs.lookup(encoding).name
+            if name.startswith("utf-16") or name.startswith("utf-32"):
+                raise ValueError("Byte offsets cannot be tracked in a file encoded with {}.".format(name))
+            # The byte-order mark is dropped by the decoder, so count it here.
+            if name == "utf-8-sig" and self.offset == 0:
+                self.offset = len(codecs.BOM_UTF8)
+            self._length_codec = "utf-8" if name == "utf-8-sig" else name
+
+    def _fill(self) -> bool:
+        """
+        Reads and decodes the next chunk of the file, discarding text that has already been consumed.
+        :return: Whether any more text could be read.
+        """
+        if self._eof:
+            return False
+        chunk = self._f.read(self._chunk_size)
+        self._eof = len(chunk) == 0
+        self._buf = self._buf[self._pos:] + self._decoder.decode(chunk, final=self._eof)
+        self._pos = 0
+        return not self._eof
+
+    def _advance(self, end: int):
+        """
+        Consumes the buffered text up to (but not including) index end.
+        :param end: The index in the buffer to advance to.
+        """
+        if self._track:
+            self.offset += len(self._buf[self._pos:end].encode(self._length_codec))
+        self._pos = end
+
+    def _peek(self) -> str:
+        """
+        Skips whitespace.
+        :return: The next non-whitespace character, or an empty string at the end of the file.
+        """
+        while True:
+            self._advance(self._whitespace.match(self._buf, self._pos).end())
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, *chars: str) -> str:
+        """
+        Consumes the next non-whitespace character.
+        :param chars: The characters that are allowed to appear next.
+        :return: The character that was consumed.
+        :raises ValueError: If the next character is not one of chars.
+        """
+        c = self._peek()
+        if c == "" or c not in chars:
+            raise ValueError("Malformed GeoJSON: expected one of {} but found {!r}.".format(chars, c))
+        self._advance(self._pos + 1)
+        return c
+
+    def _value(self):
+        """
+        Decodes the next complete JSON value, reading more of the file as required.
+        :return: The decoded value.
+        """
+        self._peek()
+        while True:
+            try:
+                value, end = self._json.raw_decode(self._buf, self._pos)
+                # A value that runs to the very end of the buffer (such as a number) might continue in the next chunk.
+                if end < len(self._buf) or self._eof:
+                    self._advance(end)
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def open_features(self) -> bool:
+        """
+        Walks the top level of the document up to the start of the 'features' array, skipping any other members.
+        :return: Whether a 'features' array was found.  If so, the stream is positioned just inside it.
+        """
+        self._expect("{")
+        if self._peek() == "}":
+            return False
+        while True:
+            key = self._value()
+            self._expect(":")
+            if key == "features":
+                self._expect("[")
+                return True
+            self._value()
+            if self._expect(",", "}") == "}":
+                return False
+
+    def items(self, stop: Optional[int] = None, spans: bool = False) -> Iterator[Any]:
+        """
+        Walks the items of the array that the stream is positioned in, up to and including its closing bracket.
+        :param stop: If given (and offsets are tracked), stop before any item that begins at or after this byte offset.
+        After stopping, stopped_at is the byte offset of the first item not read; it is None if the array was read to
+        the end.  Default None.
+        :param spans: Whether to yield (start, end, item) tuples, where start and end are the byte offsets of the item's
+        text in the file.  Offsets must be tracked.  Default False.
+        :return: A generator of the items.
+        """
+        self.stopped_at = None
+        if self._peek() == "]":
+            self._advance(self._pos + 1)
+            return
+        while True:
+            if stop is not None and self._peek() and self.offset >= stop:
+                self.stopped_at = self.offset
+                return
+            if spans:
+                self._peek()
+                start = self.offset
+                value = self._value()
+                yield start, self.offset, value
+            else:
+                yield self._value()
+            if self._expect(",", "]") == "]":
+                return
+
+    def features(self) -> Iterator[dict]:
+        """
+        Walks the document, skipping any top-level members other than 'features'.
+        :return: A generator of the features (as dictionaries) in the 'features' array.
+        """
+        if self.open_features():
+            yield from self.items()
+
+
+def fetch(url: str, dest: str, retries: int = 3, backoff: float = 1., compression: Optional[str] = None):
+    """
+    Downloads a URL to a file, retrying with exponential backoff.  The file is written under a temporary name and
+    renamed once complete, so it only ever exists in full.
+    :param url: The URL.
+    :param dest: The path of the file.
+    :param retries: The number of times to retry a failed request.  Default 3.
+    :param backoff: The number of seconds to wait before the first retry, doubled for each one after.  Default 1.
+    :param compression: The format to compress the file with as it is written, or None to store it as received.
+    Default None.
+    :raises Exception: Whatever the last attempt raised, if every attempt failed.
+    """
+    temporary = "{}.tmp{}".format(dest, os.getpid())
+    for attempt in range(retries + 1):
+        try:
+            with closing(urlopen(url)) as r:
+                with open_for_writing(temporary, compression, "wb") as f:
+                    copyfileobj(r, f, _read_buffer_size)
+            os.replace(temporary, dest)
+            return
+        except Exception:
+            if isfile(temporary):
+                os.remove(temporary)
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
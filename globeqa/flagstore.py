@@ -0,0 +1,129 @@
+"""
+A persistent store of quality-check results, so that observations that were already checked are not checked again.
+For each observation ID, an SQLite database keeps the flags that the checks raised, the rule set they were raised
+under (see rule_set()), and a hash of the observation's properties.  tools.do_quality_check() with a store only checks
+observations that are new, have changed, or were checked under another rule set, and loads the flags of the rest.
+Observations that a rule depending on the time of the check held for (such as DF, measured in the future) are not
+stored, so that they are checked again every time.
+"""
+
+from globeqa import rules
+from globeqa.land import land_source
+from globeqa.observation import Observation
+import hashlib
+import os
+from os.path import dirname, getmtime
+import sqlite3
+from typing import Dict, Iterable, Optional, Tuple
+
+
+# The version of the quality checks.  Changes to the rules in globeqa.rules and to the bits of the flags are detected
+# (see rule_set()); bump this whenever the inputs of the rules change instead, such as how ObservationTable derives its
+# columns, so that observations checked before are checked again.
+QC_VERSION = 1
+
+# Bump whenever the layout of the database changes.
+FLAG_STORE_VERSION = 1
+
+# The number of IDs looked up per query, well below SQLite's limit on the number of parameters.
+_lookup_batch = 500
+
+
+def rule_set(land=None) -> str:
+    """
+    :param land: The PreparedGeometry or LandMask used for land checking, or None if land is not checked.
+    :return: A name for the checks that are performed with that land: QC_VERSION, a hash of the flags' bits and the
+    rules (see globeqa.rules.fingerprint()), and the land shapefile and the time it was last modified.  A prepared
+    geometry and a land mask of the same shapefile raise the same flags, so they have the same name.
+    :raises ValueError: If land was not made by tools.prepare_earth_geometry() or tools.prepare_land_mask(), since
+    there is then no way to tell which land it is.
+    """
+    checks = "{}|{}".format(QC_VERSION, rules.fingerprint())
+    if land is None:
+        return "{}|no land".format(checks)
+    source = land_source(land)
+    if source is None:
+        raise ValueError("The land geometry cannot be identified; use prepare_earth_geometry() or prepare_land_mask() "
+                         "to make it.")
+    return "{}|{}|{}".format(checks, source[1], int(getmtime(source[1])))
+
+
+def record_hash(ob: Observation) -> int:
+    """
+    :param ob: An observation.
+    :return: A 64-bit hash of the observation's properties, which changes whenever any of them does.
+    """
+    digest = hashlib.blake2b(repr((ob.fromAPI, ob.as_dict())).encode("utf8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+class FlagStore:
+    def __init__(self, path: str):
+        """
+        A FlagStore keeps the flags raised on observations in an SQLite database, by observation ID.
+        :param path: The path of the database.  It is created if needed.
+        :raises ValueError: If the database was made by an incompatible version of FlagStore.
+        """
+        if dirname(path):
+            os.makedirs(dirname(path), exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path)
+
+        version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if version == 0:
+            with self._connection:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS flags (id TEXT PRIMARY KEY, "
+                                         "mask INTEGER NOT NULL, rule_set TEXT NOT NULL, hash INTEGER NOT NULL) "
+                                         "WITHOUT ROWID")
+                self._connection.execute("PRAGMA user_version = {}".format(FLAG_STORE_VERSION))
+        elif version != FLAG_STORE_VERSION:
+            self._connection.close()
+            raise ValueError("The flag store at '{}' has version {}, not {}.".format(path, version,
+                                                                                    FLAG_STORE_VERSION))
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM flags").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self._connection.close()
+
+    def lookup(self, ids: Iterable[Optional[str]], rules: str) -> Dict[str, Tuple[int, int]]:
+        """
+        :param ids: The IDs of some observations.  None is skipped.
+        :param rules: The rule set that the flags must have been raised under (see rule_set()).
+        :return: A dictionary of (ID, (mask, hash)) pairs: the flags raised on each observation that was checked under
+        that rule set, as a bitmask (see Observation.flag_bit()), and the hash of its properties when it was checked
+        (see record_hash()).
+        """
+        ids = list({i for i in ids if i is not None})
+        found = dict()
+        for start in range(0, len(ids), _lookup_batch):
+            batch = ids[start:start + _lookup_batch]
+            rows = self._connection.execute(
+                "SELECT id, mask, hash FROM flags WHERE rule_set = ? AND id IN ({})".format(",".join("?" * len(batch))),
+                [rules] + batch)
+            for i, mask, h in rows:
+                found[i] = (mask & 0xFFFFFFFFFFFFFFFF, h)
+        return found
+
+    def save(self, entries: Iterable[Tuple[str, int, int]], rules: str):
+        """
+        Saves the flags of some observations, replacing any saved before.
+        :param entries: The (ID, mask, hash) of each observation: its ID, the flags that the checks raised on it as a
+        bitmask, and the hash of its properties (see record_hash()).
+        :param rules: The rule set that the flags were raised under (see rule_set()).
+        """
+        # SQLite integers are signed, so masks that use the 64th bit are stored as negative numbers.
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO flags (id, mask, rule_set, hash) VALUES (?, ?, ?, ?)",
+                ((i, mask - (1 << 64) if mask >> 63 else mask, rules, h) for i, mask, h in entries))
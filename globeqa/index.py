@@ -0,0 +1,235 @@
+"""
+A byte-offset index over the features of a GeoJSON file.  The file is scanned once to record where each feature
+begins and ends, along with a few key columns; features are then decoded into Observations only when they are accessed.
+Indexes are kept in the snapshot cache (see globeqa.cache), so reopening a file that has not changed is nearly instant.
+"""
+
+from datetime import datetime
+from globeqa import cache as snapshots
+from globeqa.categories import Vocabulary
+from globeqa.files import GeoJSONStream, compression_of, detect_encoding
+from globeqa.observation import Observation
+from globeqa.table import ObservationTable, datetimes_between
+import codecs
+import json
+import numpy as np
+from tqdm import tqdm
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+
+# The variant under which indexes are cached.  Change it whenever the columns of an index change.
+_INDEX_VARIANT = "feature-index|1"
+
+
+class FeatureIndex:
+    def __init__(self, fp: str, columns: Dict[str, np.ndarray], starts: np.ndarray, ends: np.ndarray,
+                 protocols: Vocabulary):
+        """
+        A FeatureIndex is a lazy, read-only sequence of the observations in a GeoJSON file.  It holds the byte range of
+        every feature plus the columns id, measured (datetime64[s], NaT if invalid), lat, lon (float64, NaN if invalid)
+        and protocol (integer codes), so observations can be selected with vectorized operations and only the
+        selected ones decoded.  Indexes are normally created with FeatureIndex.open().
+        :param fp: The path to the GeoJSON file.
+        :param columns: The key columns.
+        :param starts: The byte offset at which each feature begins.
+        :param ends: The byte offset at which each feature ends.
+        :param protocols: The vocabulary of the protocol column.
+        """
+        self.fp = fp
+        self._columns = columns
+        self._starts = starts
+        self._ends = ends
+        self._protocols = protocols
+        self._data = None  # type: Optional[np.memmap]
+        # Views are created on first access and kept, so that flags raised on them persist.
+        self._views = dict()  # type: Dict[int, Observation]
+
+    @classmethod
+    def open(cls, fp: str, cache: Union[bool, str] = True, tqdm=tqdm) -> "FeatureIndex":
+        """
+        Opens the index of a GeoJSON file, loading it from the cache if there is a current one or building it if not.
+        :param fp: The path to the GeoJSON file.
+        :param cache: Whether to load and save the index in the cache.  May also be the path of the cache directory to
+        use.  Default True.
+        :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+        :return: The index.
+        :raises ValueError: If the file is compressed or not UTF-8 encoded, or is not a FeatureCollection.
+        """
+        cache_dir = cache if isinstance(cache, str) else None
+        if cache:
+            loaded = snapshots.load_arrays(fp, _INDEX_VARIANT, cache_dir)
+            if loaded is not None:
+                arrays, manifest = loaded
+                print("--  Loaded index of {}.".format(fp))
+                return cls(fp, {name: arrays[name] for name in ["id", "measured", "lat", "lon", "protocol"]},
+                           arrays["starts"], arrays["ends"], Vocabulary(manifest["protocols"][1:]))
+
+        index = cls.build(fp, tqdm=tqdm)
+        if cache:
+            arrays = dict(index._columns, starts=index._starts, ends=index._ends)
+            snapshots.save_arrays(fp, _INDEX_VARIANT, arrays, cache_dir, protocols=list(index._protocols))
+        return index
+
+    @classmethod
+    def build(cls, fp: str, tqdm=tqdm) -> "FeatureIndex":
+        """
+        Scans a GeoJSON file to build its index.
+        :param fp: The path to the GeoJSON file.
+        :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+        :return: The index.
+        :raises ValueError: If the file is compressed or not UTF-8 encoded, or is not a FeatureCollection.
+        """
+        compression = compression_of(fp)
+        if compression is not None:
+            raise ValueError("'{}' is {}-compressed; features can only be indexed in an uncompressed file.".format(
+                fp, compression))
+        print("--  Indexing {}...".format(fp))
+        protocols = Vocabulary()
+        starts, ends = [], []
+        values = dict(id=[], measured=[], lat=[], lon=[], protocol=[])
+
+        with open(fp, "rb") as f:
+            encoding = codecs.lookup(detect_encoding(f)).name
+            if encoding not in ["utf-8", "utf-8-sig"]:
+                raise ValueError("Only UTF-8 files can be indexed, but '{}' is {}.".format(fp, encoding))
+            stream = GeoJSONStream(f, encoding, track_offsets=True)
+            if not stream.open_features():
+                raise ValueError("'{}' has no 'features' array.".format(fp))
+            for start, end, feature in tqdm(stream.items(spans=True), desc="Indexing features"):
+                ob = Observation(feature=feature)
+                measured = ob.measured_dt
+                lat, lon = ob.lat, ob.lon
+                starts.append(start)
+                ends.append(end)
+                values["id"].append(ob.id or "")
+                values["measured"].append(np.datetime64("NaT") if measured is None else np.datetime64(measured, "s"))
+                values["lat"].append(np.nan if lat is None else lat)
+                values["lon"].append(np.nan if lon is None else lon)
+                values["protocol"].append(protocols.code(ob.soft_get("protocol")))
+
+        columns = dict(
+            id=np.array(values["id"], dtype=str),
+            measured=np.array(values["measured"], dtype="datetime64[s]"),
+            lat=np.array(values["lat"], dtype=np.float64),
+            lon=np.array(values["lon"], dtype=np.float64),
+            protocol=np.array(values["protocol"], dtype=np.uint8),
+        )
+        return cls(fp, columns, np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), protocols)
+
+    def __len__(self):
+        return len(self._starts)
+
+    def __iter__(self) -> Iterator[Observation]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, item: Union[int, str, slice, np.ndarray, Sequence[int]]):
+        """
+        Indexes the index.
+        :param item: An integer gets the Observation of that feature, decoding it if needed.  A string gets the key
+        column of that name.  A slice, an integer array, or a boolean mask gets a new index of the selected features,
+        without decoding any of them.
+        :return: The observation, column, or index.
+        """
+        if isinstance(item, (int, np.integer)):
+            return self._view(int(item))
+        elif isinstance(item, str):
+            return self._columns[item]
+        elif isinstance(item, slice):
+            return self.take(np.arange(len(self))[item])
+        else:
+            item = np.asarray(item)
+            if item.dtype == np.bool_:
+                if item.shape != (len(self),):
+                    raise ValueError("A boolean mask must have shape ({},).".format(len(self)))
+                item = np.flatnonzero(item)
+            return self.take(item)
+
+    def _view(self, i: int) -> Observation:
+        """
+        :param i: The position of the feature.
+        :return: The Observation of the feature, which is decoded on first access.
+        """
+        if i < 0:
+            i += len(self)
+        try:
+            return self._views[i]
+        except KeyError:
+            if not (0 <= i < len(self)):
+                raise IndexError("Feature {} is out of range for an index of {} features.".format(i, len(self)))
+            ob = Observation(feature=self.feature(i))
+            self._views[i] = ob
+            return ob
+
+    def raw(self, i: int) -> bytes:
+        """
+        :param i: The position of the feature.
+        :return: The feature's JSON text, read directly from the file.
+        """
+        if self._data is None:
+            self._data = np.memmap(self.fp, dtype=np.uint8, mode="r")
+        return self._data[self._starts[i]:self._ends[i]].tobytes()
+
+    def feature(self, i: int) -> dict:
+        """
+        :param i: The position of the feature.
+        :return: The feature, freshly decoded from the file.
+        """
+        return json.loads(self.raw(i).decode("utf-8"))
+
+    @property
+    def columns(self) -> List[str]:
+        """
+        :return: The names of the key columns.
+        """
+        return list(self._columns.keys())
+
+    def decoded(self, name: str) -> List[Optional[str]]:
+        """
+        :param name: The name of a dictionary-encoded column.  Only "protocol" is encoded.
+        :return: The values of that column, decoded to their original strings (None where missing).
+        """
+        if name != "protocol":
+            raise KeyError("Column '{}' is not dictionary-encoded.".format(name))
+        return self._protocols.decode(self._columns[name])
+
+    def isin(self, name: str, values: Sequence[Optional[str]]) -> np.ndarray:
+        """
+        :param name: The name of a column.  For "protocol", values are the protocol names.
+        :param values: The values to look for.
+        :return: A boolean mask of the features whose value in that column is one of the given values.
+        """
+        if name == "protocol":
+            values = [self._protocols.code(v) for v in values if v in self._protocols]
+        return np.isin(self._columns[name], values)
+
+    def between(self, earliest: Optional[datetime] = None, latest: Optional[datetime] = None) -> np.ndarray:
+        """
+        :param earliest: The earliest measurement datetime that passes, or None for no lower bound.  Default None.
+        :param latest: The measurement datetime at or after which features do NOT pass, or None for no upper bound.
+        Default None.
+        :return: A boolean mask of the features measured within the range.  Features without a valid datetime never
+        pass.
+        """
+        return datetimes_between(self._columns["measured"], earliest, latest)
+
+    def take(self, indices: Union[np.ndarray, Sequence[int]]) -> "FeatureIndex":
+        """
+        :param indices: The features to select, in the order they should appear.
+        :return: A new index of the selected features.  Observations already decoded are shared with the new index.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        index = FeatureIndex(self.fp, {name: column[indices] for name, column in self._columns.items()},
+                             self._starts[indices], self._ends[indices], self._protocols)
+        index._data = self._data
+        index._views = {new: self._views[old] for new, old in enumerate(indices.tolist()) if old in self._views}
+        return index
+
+    def to_table(self, tqdm=tqdm) -> ObservationTable:
+        """
+        Decodes every feature in this index into an ObservationTable.  Select the features you need first.
+        :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+        :return: The table.
+        """
+        return ObservationTable.from_observations((Observation(feature=self.feature(i)) for i in range(len(self))),
+                                                  tqdm=tqdm)
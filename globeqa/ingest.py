@@ -0,0 +1,216 @@
+from datetime import datetime
+from globeqa.observation import Observation
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# Returned by record accessors for keys that do not exist (as opposed to keys whose value is null).
+_missing = object()
+
+# Matches datetime strings that can be compared with each other as text, without parsing.
+_iso_datetime = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d+)?$")
+
+
+class IngestFilter:
+    def __init__(self, earliest: Optional[datetime] = None, latest: Optional[datetime] = None,
+                 protocols: Optional[Iterable[str]] = None,
+                 bbox: Optional[Tuple[float, float, float, float]] = None, require: Iterable[str] = ()):
+        """
+        An IngestFilter holds predicates that tools.parse_json() and tools.parse_csv() evaluate on each raw feature or
+        row before an Observation is created for it, so that rejected rows cost almost nothing.  The number of rows
+        rejected by each predicate is counted in dropped.  Predicates are evaluated in the order protocol, bbox,
+        require, time; a row is counted against the first predicate that rejects it.
+        :param earliest: The earliest measurement datetime that passes, as in tools.filter_by_datetime().  Default None
+        (no lower bound).
+        :param latest: The measurement datetime at or after which rows do NOT pass.  Default None (no upper bound).
+        Rows without a valid measurement datetime are rejected if either bound is given.
+        :param protocols: The protocols that pass.  Default None (all protocols).
+        :param bbox: The bounding box (west, south, east, north) in degrees that the location must lie within,
+        inclusive.  Rows without a valid location are rejected.  Default None (anywhere).
+        :param require: Keys that must have a value, without the protocol prefix.  A value that is null, empty, or the
+        text "null" counts as no value.  Property names such as "tcc" are expanded to the keys they read, and the first
+        of those keys that is present must have a value, as Observation.try_keys() would find it.  Default ().
+        """
+        self.earliest = earliest
+        self.latest = latest
+        self.protocols = frozenset(protocols) if protocols is not None else None
+        self.bbox = tuple(bbox) if bbox is not None else None
+        self.require = tuple(require)
+
+        self._require_keys = [Observation._property_keys.get(name, [name]) for name in self.require]
+        self._earliest_text = earliest.isoformat() if earliest is not None else None
+        self._latest_text = latest.isoformat() if latest is not None else None
+
+        self.seen = 0
+        self.dropped = dict(protocol=0, bbox=0, require=0, time=0)  # type: Dict[str, int]
+
+    def __repr__(self):
+        return "IngestFilter(earliest={!r}, latest={!r}, protocols={!r}, bbox={!r}, require={!r})".format(
+            self.earliest, self.latest, sorted(self.protocols) if self.protocols is not None else None, self.bbox,
+            self.require)
+
+    @property
+    def kept(self) -> int:
+        """
+        :return: The number of rows that passed every predicate.
+        """
+        return self.seen - sum(self.dropped.values())
+
+    def reset(self):
+        """
+        Resets the counters.
+        """
+        self.seen = 0
+        self.dropped = {k: 0 for k in self.dropped}
+
+    def merge(self, dropped: Dict[str, int], seen: int):
+        """
+        Adds counts gathered elsewhere (such as in a worker process) to this filter's counters.
+        :param dropped: The number of rows dropped by each predicate.
+        :param seen: The number of rows examined.
+        """
+        self.seen += seen
+        for k, v in dropped.items():
+            self.dropped[k] += v
+
+    def report(self):
+        """
+        Prints how many rows each predicate dropped.
+        """
+        print("--  Ingest filter kept {} of {} rows.".format(self.kept, self.seen))
+        for k, v in self.dropped.items():
+            if v > 0:
+                print("--      {:>8} dropped by {}".format(v, k))
+
+    def accept_feature(self, feature: dict) -> bool:
+        """
+        Evaluates the predicates on a GeoJSON feature.
+        :param feature: The feature, as decoded from the file.
+        :return: Whether the feature passes.
+        """
+        properties = feature["properties"]
+        protocol = properties.get("protocol")
+        prefix = protocol.replace("_", "") if protocol is not None else ""
+
+        def location():
+            coordinates = feature["geometry"]["coordinates"]
+            return coordinates[1], coordinates[0]
+
+        def get(key):
+            # The location is copied from the geometry into the properties when an Observation is created.
+            if key == "Observation Latitude":
+                return location()[0]
+            if key == "Observation Longitude":
+                return location()[1]
+            value = properties.get(key, _missing)
+            return properties.get(prefix + key, _missing) if value is _missing else value
+
+        return self._accept(get, protocol, location)
+
+    def accept_row(self, columns: Dict[str, int], row: List[str], protocol: Optional[str]) -> bool:
+        """
+        Evaluates the predicates on a row of a CSV file.
+        :param columns: The index of each column, by name (stripped, as in the header).
+        :param row: The row, split on commas.
+        :param protocol: The protocol that the CSV file comes from.
+        :return: Whether the row passes.
+        """
+        def get(key):
+            c = columns.get(key)
+            if c is None or c >= len(row):
+                return _missing
+            return row[c].strip()
+
+        def location():
+            return get("Observation Latitude"), get("Observation Longitude")
+
+        return self._accept(get, protocol, location)
+
+    def _accept(self, get: Callable, protocol: Optional[str], location: Callable) -> bool:
+        """
+        Evaluates the predicates, counting the row against the first one that rejects it.
+        :param get: Gets the raw value of a key, or _missing if the key does not exist.
+        :param protocol: The protocol of the row.
+        :param location: Gets the raw latitude and longitude of the row.
+        :return: Whether the row passes.
+        """
+        self.seen += 1
+
+        if self.protocols is not None and protocol not in self.protocols:
+            self.dropped["protocol"] += 1
+            return False
+
+        if self.bbox is not None and not self._in_bbox(*location()):
+            self.dropped["bbox"] += 1
+            return False
+
+        for keys in self._require_keys:
+            if _is_null(_first_present(get, keys)):
+                self.dropped["require"] += 1
+                return False
+
+        if (self.earliest is not None or self.latest is not None) and not self._in_window(get):
+            self.dropped["time"] += 1
+            return False
+
+        return True
+
+    def _in_bbox(self, lat, lon) -> bool:
+        """
+        :param lat: The raw latitude.
+        :param lon: The raw longitude.
+        :return: Whether the location is valid and inside the bounding box.
+        """
+        try:
+            lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError):
+            return False
+        west, south, east, north = self.bbox
+        return (west <= lon <= east) and (south <= lat <= north)
+
+    def _in_window(self, get: Callable) -> bool:
+        """
+        :param get: Gets the raw value of a key, or _missing if the key does not exist.
+        :return: Whether the measurement datetime is valid and inside the time window.  The datetime is found in the
+        same way as Observation.measured_dt.
+        """
+        d = _first_present(get, ["Measurment Date (UTC)", "Measurement Date (UTC)"])
+        t = _first_present(get, ["Measurment Time (UTC)", "Measurement Time (UTC)"])
+        dtstring = "{}T{}".format(d, t) if d is not None and t is not None else get("MeasuredAt")
+        if not isinstance(dtstring, str):
+            return False
+
+        # Well-formed datetime strings sort in chronological order, so most rows outside the window can be rejected
+        # without parsing.  Rows inside it are still parsed, to reject datetimes that are not real.
+        if _iso_datetime.match(dtstring):
+            if self._earliest_text is not None and dtstring < self._earliest_text:
+                return False
+            if self._latest_text is not None and dtstring >= self._latest_text:
+                return False
+
+        dt = Observation.parse_datetime(dtstring)
+        if dt is None:
+            return False
+        return (self.earliest is None or dt >= self.earliest) and (self.latest is None or dt < self.latest)
+
+
+def _first_present(get: Callable, keys: List[str]):
+    """
+    Gets the value of the first key that exists, like Observation.try_keys().
+    :param get: Gets the raw value of a key, or _missing if the key does not exist.
+    :param keys: The keys to try.
+    :return: The value, or None if none of the keys exist.
+    """
+    for key in keys:
+        value = get(key)
+        if value is not _missing:
+            return value
+    return None
+
+
+def _is_null(value) -> bool:
+    """
+    :param value: A raw value.
+    :return: Whether the value stands for no value: None, an empty string, or the text "null".
+    """
+    return value is None or (isinstance(value, str) and value.strip().lower() in ["", "null"])
@@ -0,0 +1,332 @@
+"""
+Land geometry for deciding whether points are over land or water.  The NaturalEarth land polygons are merged into one
+geometry, which is slow at fine resolutions, so the merged geometry is kept in the snapshot cache (see globeqa.cache) as
+WKB and the prepared geometry is kept in memory for the rest of the process.  For checking many points at once, a
+LandMask rasterizes the geometry into a bitmask, and only points in cells that a coastline crosses are checked against
+the exact geometry.
+"""
+
+import cartopy.io.shapereader as shpreader
+from globeqa import cache as snapshots
+import numpy as np
+from os.path import abspath
+import shapely
+import shapely.geometry as sgeom
+from shapely import wkb
+from shapely.ops import unary_union
+from shapely.prepared import prep
+from tqdm import tqdm
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+
+# The variant under which merged land geometry is cached.  Change it whenever the way it is built changes.
+_GEOMETRY_VARIANT = "land-geometry|1"
+
+# The variant under which land masks are cached, followed by the number of cells per degree.
+_MASK_VARIANT = "land-mask|1"
+
+# How far (in degrees) the cells of a land mask are grown before being classified, so that a point which rounding puts
+# into a neighbouring cell is still covered by the cell it is looked up in.
+_CELL_MARGIN = 1e-9
+
+# The prepared land geometry of each shapefile loaded so far, and the cache it was loaded with, by absolute path.
+_prepared = dict()  # type: Dict[str, Tuple[object, Union[bool, str]]]
+
+# The land masks loaded by open_land_source(), by their description.
+_masks = dict()  # type: Dict[Tuple, LandMask]
+
+
+def natural_earth_land(resolution: str = "50m") -> str:
+    """
+    :param resolution: The resolution of the NaturalEarth land shapefile: '10m', '50m' or '110m'.  Default '50m'.
+    :return: The path to the shapefile.  It is downloaded by cartopy the first time; later calls use the local copy.
+    :raises ValueError: If resolution is not '10m', '50m', or '110m'.
+    """
+    if resolution not in ["10m", "50m", "110m"]:
+        raise ValueError("Argument 'resolution' must be either '10m', '50m', or '110m'.")
+    return shpreader.natural_earth(resolution=resolution, category="physical", name="land")
+
+
+def load_land_geometry(shapefile: str, cache: Union[bool, str] = True):
+    """
+    Merges every polygon of a land shapefile into one geometry, or loads the merged geometry from the cache if the
+    shapefile has not changed since it was saved.
+    :param shapefile: The path to the shapefile.
+    :param cache: Whether to load and save the merged geometry in the cache.  May also be the path of the cache
+    directory to use.  Default True.
+    :return: The merged land geometry.
+    """
+    cache_dir = cache if isinstance(cache, str) else None
+    if cache:
+        loaded = snapshots.load_arrays(shapefile, _GEOMETRY_VARIANT, cache_dir)
+        if loaded is not None:
+            arrays, _ = loaded
+            return wkb.loads(arrays["wkb"].tobytes())
+
+    geometry = unary_union(list(shpreader.Reader(shapefile).geometries()))
+    if cache:
+        snapshots.save_arrays(shapefile, _GEOMETRY_VARIANT, dict(wkb=np.frombuffer(geometry.wkb, dtype=np.uint8)),
+                              cache_dir)
+    return geometry
+
+
+def prepared_land(resolution: str = "50m", shapefile: Optional[str] = None, cache: Union[bool, str] = True):
+    """
+    Gets the prepared land geometry, which can be used for point-land checking.  It is built (or loaded from the cache)
+    once per shapefile and then kept for the rest of the process, so later calls return immediately.
+    :param resolution: The resolution of the NaturalEarth land shapefile to use, if shapefile is None: '10m', '50m' or
+    '110m'.  Default '50m'.
+    :param shapefile: The path to a local land shapefile to use instead of NaturalEarth's.  Default None.
+    :param cache: Whether to load and save the merged geometry in the cache (see load_land_geometry()).  Default True.
+    :return: The PreparedGeometry.
+    :raises ValueError: If shapefile is None and resolution is not '10m', '50m', or '110m'.
+    """
+    if shapefile is None:
+        shapefile = natural_earth_land(resolution)
+    key = abspath(shapefile)
+    if key not in _prepared:
+        _prepared[key] = prep(load_land_geometry(shapefile, cache)), cache
+    return _prepared[key][0]
+
+
+def land_source(land) -> Optional[Tuple]:
+    """
+    :param land: A PreparedGeometry from prepared_land() or a LandMask from LandMask.open().
+    :return: A small, picklable description of where land came from, with which open_land_source() loads the same land
+    in another process.  Since land is loaded from the cache, that is much faster than building it, and much cheaper
+    than pickling it.  None if land was not made by prepared_land() or LandMask.open().
+    """
+    if isinstance(land, LandMask):
+        return land.source
+    for key, (prepared, cache) in _prepared.items():
+        if prepared is land:
+            return "geometry", key, cache
+    return None
+
+
+def open_land_source(source: Tuple):
+    """
+    Loads the land that a description from land_source() describes.  Like prepared_land(), the land is kept for the
+    rest of the process, so each process only loads it once.
+    :param source: The description.
+    :return: The PreparedGeometry or LandMask.
+    """
+    kind, shapefile, cache = source[:3]
+    if kind == "geometry":
+        return prepared_land(shapefile=shapefile, cache=cache)
+    key = source
+    if key not in _masks:
+        _masks[key] = LandMask.open(shapefile=shapefile, cells_per_degree=source[3], cache=cache)
+    return _masks[key]
+
+
+class LandMask:
+    def __init__(self, land: np.ndarray, mixed: np.ndarray, cells_per_degree: int, exact: Callable[[], object]):
+        """
+        A LandMask classifies points as over land or water in bulk.  The globe is divided into cells of
+        1/cells_per_degree degrees; a cell is land if it lies entirely in the interior of the land geometry, water if
+        it does not touch the land geometry at all, and mixed otherwise (a coastline crosses it).  Points in land and
+        water cells are classified by looking up their cell, and only points in mixed cells (or outside the grid) are
+        checked against the exact geometry, so the results are identical to PreparedGeometry.contains().
+        LandMasks are normally made with LandMask.open().
+        :param land: The land bit of each cell, packed along longitude with the first cell in the lowest bit of each
+        byte (see _pack_bits()).
+        Row 0 is the southernmost row of cells and column 0 begins at 180 W.
+        :param mixed: The mixed bit of each cell, packed the same way.
+        :param cells_per_degree: The number of cells per degree of latitude and longitude.
+        :param exact: A function that returns the PreparedGeometry used for points in mixed cells.  It is only called
+        the first time such a point is checked.
+        """
+        self._land = land
+        self._mixed = mixed
+        self.cells_per_degree = cells_per_degree
+        self._load_exact = exact
+        self._exact = None
+        # How to load this mask again in another process (see land_source()).  Set by open().
+        self.source = None  # type: Optional[Tuple]
+
+    @classmethod
+    def open(cls, resolution: str = "50m", shapefile: Optional[str] = None, cells_per_degree: int = 60,
+             cache: Union[bool, str] = True, tqdm=tqdm) -> "LandMask":
+        """
+        Opens the land mask of a land shapefile, loading it from the cache if there is a current one or building it if
+        not.  The cached bitmasks are memory-mapped.
+        :param resolution: The resolution of the NaturalEarth land shapefile to use, if shapefile is None: '10m', '50m'
+        or '110m'.  Default '50m'.
+        :param shapefile: The path to a local land shapefile to use instead of NaturalEarth's.  Default None.
+        :param cells_per_degree: The number of cells per degree.  Default 60 (cells of one arcminute).
+        :param cache: Whether to load and save the mask (and the merged geometry) in the cache.  May also be the path
+        of the cache directory to use.  Default True.
+        :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+        :return: The mask.
+        :raises ValueError: If shapefile is None and resolution is not '10m', '50m', or '110m'.
+        """
+        if shapefile is None:
+            shapefile = natural_earth_land(resolution)
+        variant = "{}|{}".format(_MASK_VARIANT, cells_per_degree)
+        cache_dir = cache if isinstance(cache, str) else None
+
+        def exact():
+            return prepared_land(shapefile=shapefile, cache=cache)
+
+        if cache:
+            loaded = snapshots.load_arrays(shapefile, variant, cache_dir)
+            if loaded is not None:
+                arrays, _ = loaded
+                mask = cls(arrays["land"], arrays["mixed"], cells_per_degree, exact)
+                mask.source = ("mask", abspath(shapefile), cache, cells_per_degree)
+                return mask
+
+        mask = cls.build(load_land_geometry(shapefile, cache), cells_per_degree, tqdm=tqdm)
+        mask._load_exact = exact
+        mask.source = ("mask", abspath(shapefile), cache, cells_per_degree)
+        if cache:
+            snapshots.save_arrays(shapefile, variant, dict(land=mask._land, mixed=mask._mixed), cache_dir)
+        return mask
+
+    @classmethod
+    def build(cls, geometry, cells_per_degree: int = 60, tqdm=tqdm) -> "LandMask":
+        """
+        Rasterizes land geometry.  Each band of one degree of latitude is split into cells of one degree, and cells that
+        are neither entirely land nor entirely water are split again, step by step, down to the final cell size.
+        :param geometry: The (unprepared) land geometry, such as from load_land_geometry().
+        :param cells_per_degree: The number of cells per degree.  Default 60 (cells of one arcminute).
+        :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+        :return: The mask.
+        :raises ValueError: If cells_per_degree is less than 1.
+        """
+        if cells_per_degree < 1:
+            raise ValueError("Argument 'cells_per_degree' must be at least 1.")
+        n = cells_per_degree
+        # Split cells by each prime factor of n in turn, so that every step divides them evenly.
+        splits = []  # type: List[int]
+        remainder, factor = n, 2
+        while remainder > 1:
+            while remainder % factor == 0:
+                splits.append(factor)
+                remainder //= factor
+            factor += 1
+
+        classify = _box_classifier(geometry)
+        width = (360 * n + 7) // 8
+        land = np.zeros((180 * n, width), dtype=np.uint8)
+        mixed = np.zeros((180 * n, width), dtype=np.uint8)
+
+        for band in tqdm(range(180), desc="Rasterizing land"):
+            band_land = np.zeros((n, 360 * n), dtype=bool)
+            # The cells still to classify, as (row, column) in units of the current cell size, which is span cells.
+            rows, columns, span = np.zeros(360, dtype=np.intp), np.arange(360), n
+            for split in [1] + splits:
+                if split > 1:
+                    # Replace each cell with its split x split children.
+                    offsets = np.arange(split)
+                    rows = np.repeat(rows * split, split * split) + np.tile(np.repeat(offsets, split), len(rows))
+                    columns = np.repeat(columns * split, split * split) + np.tile(offsets, split * len(columns))
+                    span //= split
+                inside, outside = classify(
+                    -180. + columns * span / n - _CELL_MARGIN, band - 90. + rows * span / n - _CELL_MARGIN,
+                    -180. + (columns + 1) * span / n + _CELL_MARGIN, band - 90. + (rows + 1) * span / n + _CELL_MARGIN)
+                if inside.any():
+                    level = np.zeros((n // span, 360 * n // span), dtype=bool)
+                    level[rows[inside], columns[inside]] = True
+                    band_land |= np.repeat(np.repeat(level, span, axis=0), span, axis=1)
+                undecided = ~(inside | outside)
+                rows, columns = rows[undecided], columns[undecided]
+
+            band_mixed = np.zeros((n, 360 * n), dtype=bool)
+            band_mixed[rows, columns] = True
+            land[band * n:(band + 1) * n] = _pack_bits(band_land)
+            mixed[band * n:(band + 1) * n] = _pack_bits(band_mixed)
+
+        return cls(land, mixed, n, lambda: prep(geometry))
+
+    @property
+    def exact(self):
+        """
+        :return: The PreparedGeometry that points in mixed cells are checked against.
+        """
+        if self._exact is None:
+            self._exact = self._load_exact()
+        return self._exact
+
+    def cells(self, lon: Iterable[float], lat: Iterable[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Looks up the cells of points.
+        :param lon: The longitude of each point.
+        :param lat: The latitude of each point.
+        :return: Whether each point's cell is land, and whether it is mixed.  Points outside the grid (including NaN
+        coordinates) are reported as mixed.
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        n = self.cells_per_degree
+        with np.errstate(invalid="ignore"):
+            column = np.floor((lon + 180.) * n)
+            row = np.floor((lat + 90.) * n)
+            valid = (column >= 0) & (column < 360 * n) & (row >= 0) & (row < 180 * n)
+        row, column = row[valid].astype(np.intp), column[valid].astype(np.intp)
+        shift = (column & 7).astype(np.uint8)
+
+        land = np.zeros(lon.shape, dtype=bool)
+        mixed = np.ones(lon.shape, dtype=bool)
+        land[valid] = (self._land[row, column >> 3] >> shift) & 1
+        mixed[valid] = (self._mixed[row, column >> 3] >> shift) & 1
+        return land, mixed
+
+    def contains_points(self, lon: Iterable[float], lat: Iterable[float]) -> np.ndarray:
+        """
+        :param lon: The longitude of each point.
+        :param lat: The latitude of each point.
+        :return: Whether each point is over land, exactly as PreparedGeometry.contains() would decide.  Points with a
+        NaN coordinate are not over land.
+        """
+        lon = np.asarray(lon, dtype=float)
+        lat = np.asarray(lat, dtype=float)
+        land, mixed = self.cells(lon, lat)
+        result = land & ~mixed
+        for i in np.flatnonzero(mixed & ~np.isnan(lon) & ~np.isnan(lat)):
+            result[i] = self.exact.contains(sgeom.Point(lon[i], lat[i]))
+        return result
+
+    def contains(self, point) -> bool:
+        """
+        Checks one point, so that a LandMask can be used wherever a PreparedGeometry is used for point-land checking.
+        :param point: The point.
+        :return: Whether the point is over land.
+        """
+        return bool(self.contains_points([point.x], [point.y])[0])
+
+
+def _pack_bits(bits: np.ndarray) -> np.ndarray:
+    """
+    :param bits: A boolean array of shape (rows, columns), where columns is a multiple of 8.
+    :return: A uint8 array of shape (rows, columns / 8), where bit j of byte [i, k] is bits[i, 8 * k + j].
+    """
+    # np.packbits() puts the first element in the most significant bit, so reverse each group of 8.
+    rows, columns = bits.shape
+    return np.packbits(bits.reshape(rows, columns // 8, 8)[:, :, ::-1].reshape(rows, columns), axis=1)
+
+
+def _box_classifier(geometry) -> Callable[[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+                                          Tuple[np.ndarray, np.ndarray]]:
+    """
+    :param geometry: The land geometry.
+    :return: A function of the bounds (west, south, east, north) of boxes that returns whether each box is entirely in
+    the interior of the geometry, and whether it is disjoint from it.  Shapely 2 classifies all boxes in one call;
+    earlier versions check them one at a time against the prepared geometry.
+    """
+    if hasattr(shapely, "contains_properly"):
+        shapely.prepare(geometry)
+
+        def classify(west, south, east, north):
+            boxes = shapely.box(west, south, east, north)
+            return shapely.contains_properly(geometry, boxes), ~shapely.intersects(geometry, boxes)
+    else:
+        prepared = prep(geometry)
+
+        def classify(west, south, east, north):
+            boxes = [sgeom.box(*bounds) for bounds in zip(west, south, east, north)]
+            return (np.array([prepared.contains_properly(box) for box in boxes], dtype=bool),
+                    np.array([not prepared.intersects(box) for box in boxes], dtype=bool))
+
+    return classify
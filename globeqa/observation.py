@@ -1,6 +1,8 @@
 from datetime import datetime
-import shapely.geometry as sgeom
-from typing import Optional, List, Union, Dict
+from functools import wraps
+from globeqa import categories
+import numpy as np
+from typing import Any, Optional, List, Union, Dict, FrozenSet, Iterable, Sequence, Tuple
 
 
 class CloudCover:
@@ -96,22 +98,366 @@ class CloudCover:
         return self._val
 
     def num_to_cat(self, fraction):
-        fraction = min(max(fraction, 0.0), 1.0)
-        bins = dict(none=0.00, few=0.10, isolated=0.25, scattered=0.50, broken=0.90)
-        for k, v in bins.items():
-            if fraction <= v:
-                return k
-        return "overcast"
+        # A NaN fraction has always been "overcast" here, since it is not at or below any threshold.
+        if fraction != fraction:
+            return "overcast"
+        return categories.bin_cloud_fraction(fraction)
 
     def cat_to_mid(self, cat):
+        return categories.tcc_midpoint(cat)
+
+
+class CloudCoverArray:
+    def __init__(self, num: np.ndarray, codes: np.ndarray, categorical: np.ndarray):
+        """
+        A CloudCoverArray holds many cloud covers as NumPy arrays.  Its comparison operators work element-wise with the
+        same semantics as CloudCover's, and return boolean arrays; comparisons involving a missing cloud cover are
+        False (except !=).  CloudCoverArrays are normally made with from_fractions(), from_categories() or from_codes().
+        :param num: The numeric value of each cloud cover (see CloudCover.num), or NaN if missing.
+        :param codes: The category code of each cloud cover (see globeqa.categories), or 0 if missing.
+        :param categorical: Whether each cloud cover was given as a category rather than a fraction.
+        """
+        self._num = num
+        self._codes = codes
+        self._categorical = categorical
+
+    @classmethod
+    def from_fractions(cls, fractions: Iterable[Optional[float]]) -> "CloudCoverArray":
+        """
+        :param fractions: Cloud fractions, from 0.0 to 1.0.  Values outside this range are clipped to be within the
+        range, and None or NaN stands for a missing cloud cover.
+        :return: A CloudCoverArray of the fractions.
+        """
+        num = np.clip(np.array(fractions, dtype=float), 0.0, 1.0)
+        return cls(num, categories.bin_cloud_fractions(num), np.zeros(num.shape, dtype=bool))
+
+    @classmethod
+    def from_categories(cls, cats: Iterable[Optional[str]]) -> "CloudCoverArray":
+        """
+        :param cats: GLOBE cloud cover categories, or None for a missing cloud cover.
+        :return: A CloudCoverArray of the categories.
+        :raises ValueError: If a category is not a GLOBE cloud cover category.
+        """
+        return cls.from_codes(categories.tcc_codes(cats))
+
+    @classmethod
+    def from_codes(cls, codes: Iterable[int]) -> "CloudCoverArray":
+        """
+        :param codes: Cloud cover category codes, such as an ObservationTable's "tcc" column.
+        :return: A CloudCoverArray of the categories.
+        """
+        codes = np.asarray(codes, dtype=np.uint8)
+        return cls(categories.tcc_midpoints(codes), codes, np.ones(codes.shape, dtype=bool))
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, item) -> Union[CloudCover, "CloudCoverArray"]:
+        """
+        :param item: An integer, a slice, an array of indices or a boolean mask.
+        :return: A CloudCover for an integer, otherwise a CloudCoverArray of the selected cloud covers.
+        """
+        if isinstance(item, (int, np.integer)):
+            if self._codes[item] == 0:
+                return CloudCover(None)
+            if self._categorical[item]:
+                return CloudCover(categories.GLOBE_TCC_CATEGORIES[self._codes[item]])
+            return CloudCover(float(self._num[item]))
+        return CloudCoverArray(self._num[item], self._codes[item], self._categorical[item])
+
+    def __lt__(self, other):
+        c = self._compare(other)
+        return c < 0. if c is not None else NotImplemented
+
+    def __gt__(self, other):
+        c = self._compare(other)
+        return c > 0. if c is not None else NotImplemented
+
+    def __le__(self, other):
+        c = self._compare(other)
+        return c <= 0. if c is not None else NotImplemented
+
+    def __ge__(self, other):
+        c = self._compare(other)
+        return c >= 0. if c is not None else NotImplemented
+
+    def __eq__(self, other):
+        c = self._compare(other)
+        return c == 0. if c is not None else NotImplemented
+
+    def __ne__(self, other):
+        c = self._compare(other)
+        return c != 0. if c is not None else NotImplemented
+
+    def _compare(self, other) -> Optional[np.ndarray]:
+        if isinstance(other, CloudCoverArray):
+            return self.num - other.num
+        elif isinstance(other, CloudCover):
+            return self.num - (other.num if other.num is not None else np.nan)
+        elif isinstance(other, str):
+            return self.mid - categories.tcc_midpoint(other)
+        elif isinstance(other, float):
+            return self.num - other
+        else:
+            return None
+
+    @property
+    def cat(self) -> np.ndarray:
+        """
+        :return: The GLOBE category of each cloud cover, as an object array (None if missing).
+        """
+        return categories.tcc_categories(self._codes)
+
+    @property
+    def codes(self) -> np.ndarray:
+        """
+        :return: The category code of each cloud cover (see globeqa.categories), or 0 if missing.
+        """
+        return self._codes
+
+    @property
+    def mid(self) -> np.ndarray:
+        """
+        :return: The numeric midpoint of the GLOBE category of each cloud cover, or NaN if missing.
+        """
+        return categories.tcc_midpoints(self._codes)
+
+    @property
+    def num(self) -> np.ndarray:
+        """
+        :return: The numeric value of each cloud cover (fraction), or NaN if missing.  Cloud covers given as
+        categories have the midpoint of the category (equal to mid).
+        """
+        return self._num
+
+
+# Stands in for a key that an observation does not have.
+_MISSING = object()
+
+
+class KeySchema:
+    # The schemas of full observations, by protocol and whether they came from the API.
+    _registry = dict()  # type: Dict[Tuple[Optional[str], bool], KeySchema]
+
+    def __init__(self, protocol: Optional[str], from_api: bool):
+        """
+        A KeySchema maps the keys of observations to positions in their lists of values.  One schema is shared by all
+        observations of a protocol from the same kind of source, so the keys are stored once rather than in a
+        dictionary per observation.  Schemas only ever grow: a key that has not been seen before is appended.
+        Schemas are normally obtained with KeySchema.of().
+        :param protocol: The protocol of the observations.
+        :param from_api: Whether the observations came from the API (JSON) rather than a CSV file.
+        """
+        self.protocol = protocol
+        self.from_api = from_api
+        self.prefix = protocol.replace("_", "") if from_api and isinstance(protocol, str) else ""
+        self.keys = []  # type: List[str]
+        self.positions = dict()  # type: Dict[str, int]
+        # The positions of key sequences seen before, and the subsets made by keep_only(), so each is worked out once.
+        self._layouts = dict()  # type: Dict[Tuple[str, ...], Tuple[Tuple[int, ...], bool]]
+        self._subsets = dict()  # type: Dict[Tuple[FrozenSet[str], int], Tuple[KeySchema, List[int]]]
+        # The positions that each sequence of names has been resolved to.  Cleared whenever a key is added.
+        self._resolved = dict()  # type: Dict[Tuple[str, ...], Tuple[int, ...]]
+
+    @classmethod
+    def of(cls, protocol: Optional[str], from_api: bool) -> "KeySchema":
+        """
+        :param protocol: The protocol of the observations.
+        :param from_api: Whether the observations came from the API (JSON) rather than a CSV file.
+        :return: The shared schema for those observations, which is created on first use.
+        """
         try:
-            return dict(none=0.00, clear=0.05, few=0.05, isolated=0.175, scattered=0.375, broken=0.70, overcast=0.95,
-                        obscured=0.95)[cat]
+            return cls._registry[(protocol, from_api)]
         except KeyError:
-            raise ValueError("'{}' does not represent a valid cloud cover category.".format(cat))
+            schema = cls(protocol, from_api)
+            cls._registry[(protocol, from_api)] = schema
+            return schema
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key: str) -> int:
+        """
+        :param key: A key.
+        :return: The position of the key, which is appended if it is not already in the schema.
+        """
+        try:
+            return self.positions[key]
+        except KeyError:
+            self.positions[key] = len(self.keys)
+            self.keys.append(key)
+            self._resolved.clear()
+            return self.positions[key]
+
+    def resolve(self, names: Tuple[str, ...]) -> Tuple[int, ...]:
+        """
+        Works out where to look for a value that may be stored under any of several names.  Each name is looked for
+        verbatim and then with the protocol prefix, as in Observation.__getitem__.  The result is remembered, so this
+        costs a single dictionary lookup after the first call.
+        :param names: The names, in order of preference.
+        :return: The positions of the names that are in the schema, in order of preference.
+        """
+        positions = self._resolved.get(names)
+        if positions is None:
+            candidates = []
+            for name in names:
+                for key in ([name, self.prefix + name] if self.prefix else [name]):
+                    p = self.positions.get(key)
+                    if p is not None and p not in candidates:
+                        candidates.append(p)
+            positions = tuple(candidates)
+            self._resolved[names] = positions
+        return positions
+
+    def layout(self, keys: Tuple[str, ...]) -> Tuple[Tuple[int, ...], bool]:
+        """
+        :param keys: The keys of an observation, in order.
+        :return: The position of each key, and whether the keys are exactly the first keys of the schema in order (in
+        which case the values can be stored as they are).
+        """
+        try:
+            return self._layouts[keys]
+        except KeyError:
+            positions = tuple(self.add(key) for key in keys)
+            layout = positions, positions == tuple(range(len(keys)))
+            self._layouts[keys] = layout
+            return layout
+
+    def values(self, keys: Tuple[str, ...], values: Iterable[Any]) -> List[Any]:
+        """
+        :param keys: The keys of an observation, in order.  If a key appears more than once, the last value is used.
+        :param values: The values of those keys, in the same order.
+        :return: The values arranged by position, with _MISSING for the keys that the observation does not have.
+        """
+        positions, direct = self.layout(keys)
+        if direct:
+            return list(values)
+        arranged = [_MISSING] * (max(positions) + 1 if positions else 0)
+        for p, value in zip(positions, values):
+            arranged[p] = value
+        return arranged
+
+    def subset(self, keep: FrozenSet[str]) -> Tuple["KeySchema", List[int]]:
+        """
+        :param keep: The keys to keep, without the protocol prefix.  A key is kept whether or not it has the prefix.
+        :return: A schema of just the keys of this schema that are kept, shared by every observation that keeps the
+        same keys, and the position in this schema of each of its keys.
+        """
+        try:
+            return self._subsets[(keep, len(self.keys))]
+        except KeyError:
+            n = len(self.prefix)
+            kept = [p for p, k in enumerate(self.keys)
+                    if k in keep or (n > 0 and k.startswith(self.prefix) and k[n:] in keep)]
+            schema = KeySchema(self.protocol, self.from_api)
+            for p in kept:
+                schema.add(self.keys[p])
+            self._subsets[(keep, len(self.keys))] = schema, kept
+            return schema, kept
+
+
+def _memoized(method):
+    """
+    Turns an Observation method into a property whose value is computed once and kept until a key of the observation
+    changes.  The flags raised while computing it are kept too, and raised again whenever the cached value is used, so
+    the flags are the same as if it had been computed again.
+    :param method: The method that computes the property.
+    :return: The property.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def get(self):
+        if self._cache is not None:
+            hit = self._cache.get(name)
+            if hit is not None:
+                value, raised = hit
+                for flag in raised:
+                    self.flag(flag)
+                return value
+        else:
+            self._cache = dict()
+
+        raised = []
+        if self._recording is None:
+            self._recording = []
+        self._recording.append(raised)
+        try:
+            value = method(self)
+        finally:
+            self._recording.pop()
+        self._cache[name] = (value, tuple(raised))
+        return value
+
+    return property(get)
 
 
 class Observation:
+    # Observations are numerous, so they have no per-instance __dict__.  Their keys are held by a shared KeySchema, and
+    # any key set later that the schema does not have is kept in _extra, which is only created when needed.  Derived
+    # properties are cached in _cache (see _memoized()).  Raised flags are the bits of the integer _flags (see
+    # flag_bit()).
+    __slots__ = ("_schema", "_values", "_extra", "_cache", "_recording", "fromAPI", "_flags")
+
+    # The keys of the cloud types, obscurations, and photo directions that may be reported.
+    _cloud_type_keys = ["Cirrus", "Cirrocumulus", "Cumulus", "Altocumulus", "Stratus", "Nimbostratus", "Altostratus",
+                        "Stratocumulus", "Cumulonimbus", "Cirrostratus"]
+    _obscuration_keys = ["Fog", "Smoke", "Haze", "VolcanicAsh", "Dust", "Sand", "Spray", "HeavyRain", "HeavySnow",
+                         "BlowingSnow"]
+    _photo_directions = ["South", "West", "North", "East", "Upward", "Downward"]
+
+    # The keys of the contrail counts, and the ranges of mosquito larvae that the app reports instead of a count.
+    _contrail_keys = ["ShortLivedContrails", "SpreadingContrails", "NonSpreadingContrails"]
+    _larvae_count_ranges = ["1-25", "26-50", "51-100", "more than 100"]
+
+    # Keys that are spelled more than one way in GLOBE files.  If any spelling is requested, all of them are kept.
+    _key_aliases = [
+        ("Measurement Date (UTC)", "Measurment Date (UTC)"),  # sic
+        ("Measurement Time (UTC)", "Measurment Time (UTC)"),  # sic
+    ]
+
+    # The (unprefixed) keys that each property reads, so that parsers can keep just the keys needed for them.
+    _property_keys = dict(
+        measured_dt=["Measurement Date (UTC)", "Measurement Time (UTC)", "MeasuredAt"],
+        lat=["Observation Latitude"],
+        lon=["Observation Longitude"],
+        elevation=["elevation", "Observation Elevation"],
+        tcc=["Total Cloud Cover", "CloudCover"],
+        tcc_aqua=["Aqua Low Cloud Cover", "Aqua Mid Cloud Cover", "Aqua High Cloud Cover"],
+        tcc_terra=["Terra Low Cloud Cover", "Terra Mid Cloud Cover", "Terra High Cloud Cover"],
+        tcc_geo=["GEO Low Cloud", "GEO Mid Cloud", "GEO High Cloud",
+                 "GEO Low Cloud Cover", "GEO Mid Cloud Cover", "GEO High Cloud Cover"],
+        which_geo=["GEO Satellite"],
+        cloud_types=_cloud_type_keys,
+        obscurations=_obscuration_keys,
+        photo_urls=["{}PhotoUrl".format(direction) for direction in _photo_directions],
+        cloud_type_mask=_cloud_type_keys,
+        obscuration_mask=_obscuration_keys,
+        photo_mask=["{}PhotoUrl".format(direction) for direction in _photo_directions],
+        source=["DataSource", "Is GLOBE Trained", "is Citizen Science"],
+        id=["ObservationId", "Observation Number"],
+    )
+    _property_keys.update(
+        tcc_aquaterra=_property_keys["tcc_aqua"] + _property_keys["tcc_terra"],
+        tcc_aqua_cat=_property_keys["tcc_aqua"],
+        tcc_terra_cat=_property_keys["tcc_terra"],
+        tcc_aquaterra_cat=_property_keys["tcc_aqua"] + _property_keys["tcc_terra"],
+        tcc_geo_cat=_property_keys["tcc_geo"],
+        tcc_code=_property_keys["tcc"],
+        tcc_aqua_code=_property_keys["tcc_aqua"],
+        tcc_terra_code=_property_keys["tcc_terra"],
+        tcc_aquaterra_code=_property_keys["tcc_aqua"] + _property_keys["tcc_terra"],
+        tcc_geo_code=_property_keys["tcc_geo"],
+        is_from_observer=_property_keys["source"],
+        check_for_flags=(_property_keys["measured_dt"] + _property_keys["lat"] + _property_keys["lon"] +
+                         _property_keys["elevation"] + _property_keys["tcc"] + _cloud_type_keys + _obscuration_keys +
+                         ["SkyClarity", "TreeHeightAvgM", "LarvaeCount"] + _contrail_keys),
+    )
+
     def __init__(self, header: Optional[List[str]] = None, row: Optional[List[str]] = None,
                  feature: Optional[dict] = None, protocol: Optional[str] = None):
         """
@@ -125,42 +471,189 @@ class Observation:
         """
 
         if header is not None and row is not None and protocol is not None:
-            self._raw = dict(protocol=protocol)
             self.fromAPI = False
-
-            for c in range(len(header)):
-                column = header[c]
-                try:
-                    self._raw[column] = row[c].strip()
-                except KeyError:
-                    self._raw[column] = None
+            self._schema = KeySchema.of(protocol, False)
+            self._values = self._schema.values(("protocol",) + tuple(header),
+                                               [protocol] + [row[c].strip() for c in range(len(header))])
 
         elif feature is not None:
             self.fromAPI = True
-            self._raw = feature["properties"]
-            self._raw["Observation Latitude"] = feature["geometry"]["coordinates"][1]
-            self._raw["Observation Longitude"] = feature["geometry"]["coordinates"][0]
+            properties = feature["properties"]
+            coordinates = feature["geometry"]["coordinates"]
+            self._schema = KeySchema.of(properties.get("protocol"), True)
+            self._values = self._schema.values(tuple(properties) + ("Observation Latitude", "Observation Longitude"),
+                                               list(properties.values()) + [coordinates[1], coordinates[0]])
 
         else:
             raise ValueError("Either 'feature' or all of ('header', 'row', and 'protocol') must be provided.")
 
-        self.flags = []
+        self._extra = None
+        self._cache = None
+        self._recording = None
+        self._flags = 0
+
+    @classmethod
+    def from_raw(cls, raw: dict, from_api: bool) -> "Observation":
+        """
+        Creates an observation from an already-processed dictionary of properties, such as as_dict() of another
+        observation.
+        :param raw: The properties of the observation.
+        :param from_api: Whether the properties came from the API (JSON) rather than a CSV file.
+        :return: The observation, with no flags raised.
+        """
+        ob = cls.__new__(cls)
+        ob.fromAPI = from_api
+        ob._schema = KeySchema.of(raw.get("protocol"), from_api)
+        ob._values = ob._schema.values(tuple(raw), raw.values())
+        ob._extra = None
+        ob._cache = None
+        ob._recording = None
+        ob._flags = 0
+        return ob
+
+    def without_flags(self) -> "Observation":
+        """
+        :return: A view of this observation with no flags raised.  It shares this observation's values, so flags raised
+        while reading its properties are not left on this observation.
+        """
+        ob = Observation.__new__(Observation)
+        ob.fromAPI = self.fromAPI
+        ob._schema = self._schema
+        ob._values = self._values
+        ob._extra = self._extra
+        ob._cache = None
+        ob._recording = None
+        ob._flags = 0
+        return ob
+
+    def __getstate__(self):
+        return self.as_dict(), self.fromAPI, self.flags
+
+    def __setstate__(self, state):
+        raw, from_api, flags = state
+        self.fromAPI = from_api
+        self._schema = KeySchema.of(raw.get("protocol"), from_api)
+        self._values = self._schema.values(tuple(raw), raw.values())
+        self._extra = None
+        self._cache = None
+        self._recording = None
+        self._flags = 0
+        self.flags = flags
+
+    def as_dict(self) -> Dict[str, Any]:
+        """
+        :return: A new dictionary of every key of this observation and its value, including keys that were set later.
+        """
+        d = {k: v for k, v in zip(self._schema.keys, self._values) if v is not _MISSING}
+        if self._extra is not None:
+            d.update(self._extra)
+        return d
+
+    @classmethod
+    def resolve_keys(cls, names: Iterable[str]) -> FrozenSet[str]:
+        """
+        Works out which raw keys must be kept to serve the given keys and properties.  See keep_only().
+        :param names: Keys (without the protocol prefix) and/or property names, such as "CloudCover", "measured_dt",
+        or "check_for_flags".  Property names are expanded to the keys they read, and keys that are spelled more than
+        one way in GLOBE files are expanded to every spelling.
+        :return: The set of unprefixed keys.  "protocol" is always included, since the prefix depends on it.
+        """
+        keys = {"protocol"}
+        for name in names:
+            for key in cls._property_keys.get(name, [name]):
+                keys.add(key)
+                for aliases in cls._key_aliases:
+                    if key in aliases:
+                        keys.update(aliases)
+        return frozenset(keys)
+
+    def keep_only(self, keys: FrozenSet[str]):
+        """
+        Discards every key of this observation except those given, to save memory.
+        :param keys: The keys to keep, without the protocol prefix, as returned by resolve_keys().  A key is kept
+        whether or not it has the prefix.
+        """
+        schema, kept = self._schema.subset(keys)
+        self._cache = None
+        n = len(self._values)
+        self._schema = schema
+        self._values = [self._values[p] if p < n else _MISSING for p in kept]
+        if self._extra is not None:
+            prefix = self.key_prefix
+            self._extra = {k: v for k, v in self._extra.items()
+                           if k in keys or (prefix and k.startswith(prefix) and k[len(prefix):] in keys)} or None
+
+    def _lookup(self, key: str):
+        """
+        :param key: The exact key.
+        :return: The value of the key, or _MISSING if this observation does not have it.
+        """
+        p = self._schema.positions.get(key)
+        if p is not None and p < len(self._values):
+            value = self._values[p]
+            if value is not _MISSING:
+                return value
+        if self._extra is not None:
+            return self._extra.get(key, _MISSING)
+        return _MISSING
+
+    def _get(self, names: Tuple[str, ...]):
+        """
+        Gets the value of the first of several names that this observation has, trying each name verbatim and then
+        with the protocol prefix.  The names are resolved to positions once per schema (see KeySchema.resolve()), so no
+        exceptions are raised, even when none of the names are present.
+        :param names: The names, in order of preference.
+        :return: The value, or _MISSING if this observation has none of the names.
+        """
+        values = self._values
+        if self._extra is None:
+            n = len(values)
+            for p in self._schema.resolve(names):
+                if p < n:
+                    value = values[p]
+                    if value is not _MISSING:
+                        return value
+            return _MISSING
+        # Keys set later may be in _extra, so look for each name in turn.
+        prefix = self.key_prefix
+        for name in names:
+            value = self._lookup(name)
+            if value is _MISSING and prefix:
+                value = self._lookup(prefix + name)
+            if value is not _MISSING:
+                return value
+        return _MISSING
 
     def __getitem__(self, item: str):
         """
         Attempts to get the requested key.  If the key verbatim does not exist, it will be prefixed with the protocol
         name and retrieval will be reattempted.  Failing that, a KeyError will be raised.
         """
-        try:
-            return self._raw[item]
-        except KeyError:
-            return self._raw[self.key_prefix + item]
+        value = self._get((item,))
+        if value is _MISSING:
+            raise KeyError(item)
+        return value
 
     def __contains__(self, item):
         return self.soft_get(item) is not None
 
     def __setitem__(self, key, value):
-        self._raw[key] = value
+        """
+        Sets the value of a key.  Keys that are not in the shared schema, such as patched attributes, are kept in a
+        separate dictionary for this observation alone.  Cached properties are discarded, since they may depend on it.
+        """
+        self._cache = None
+        p = self._schema.positions.get(key)
+        if p is None:
+            if self._extra is None:
+                self._extra = dict()
+            self._extra[key] = value
+            return
+        if p >= len(self._values):
+            self._values.extend([_MISSING] * (p + 1 - len(self._values)))
+        self._values[p] = value
+        if self._extra is not None:
+            self._extra.pop(key, None)
 
     def soft_get(self, item: str):
         """
@@ -169,42 +662,53 @@ class Observation:
         :param item: They key to look for.
         :return: The value associated with the key (with prefix if needed), or None if the key doesn't exist.
         """
-        try:
-            return self[item]
-        except KeyError:
-            return None
+        value = self._get((item,))
+        return None if value is _MISSING else value
 
     @property
     def key_prefix(self) -> str:
         """
         :return: Gets the prefix that should be appended to any key retrieved, based on the protocol.
         """
-        if not self.fromAPI:
-            return ""
-        else:
-            return self["protocol"].replace("_", "")
+        return self._schema.prefix
 
-    @property
+    @_memoized
     def measured_dt(self) -> Optional[datetime]:
         """
         :return: The measurement datetime of this observation, or none if the date and/or time are recorded incorrectly.
         Raises flag DX if the datetime is missing, and DI if the datetime is invalid or malformed.
         """
-        # Find or construct the string representing the datetime.
+        dtstring = self.measured_string
+        if dtstring is None:
+            self.flag("DX")
+            return None
 
+        # Attempt to convert that string to a datetime.
+        dt = self.parse_datetime(dtstring)
+        if dt is None:
+            self.flag("DI")
+        return dt
+
+    @property
+    def measured_string(self) -> Optional[str]:
+        """
+        :return: The string representing the measurement datetime of this observation, as it will be parsed by
+        measured_dt (see parse_datetime()), or None if the date and/or time are missing.  No flags are raised.
+        """
         # sic: "Measurement" may be misspelled in the file.
         d = self.try_keys(["Measurment Date (UTC)", "Measurement Date (UTC)"])
         t = self.try_keys(["Measurment Time (UTC)", "Measurement Time (UTC)"])
         if d is not None and t is not None:
-            dtstring = "{}T{}".format(d, t)
-        else:
-            try:
-                dtstring = self["MeasuredAt"]
-            except KeyError:
-                self.flag("DX")
-                return None
+            return "{}T{}".format(d, t)
+        return self.try_keys(["MeasuredAt"])
 
-        # Attempt to convert that string to a datetime.
+    @staticmethod
+    def parse_datetime(dtstring: str) -> Optional[datetime]:
+        """
+        Converts a GLOBE datetime string to a datetime.
+        :param dtstring: The string, formatted as %Y-%m-%dT%H:%M:%S with optional fractional seconds.
+        :return: The datetime, or None if the string is malformed or not a real datetime.
+        """
         try:
             return datetime.strptime(dtstring, "%Y-%m-%dT%H:%M:%S")
         except ValueError:
@@ -212,30 +716,29 @@ class Observation:
             try:
                 return datetime.strptime(dtstring, "%Y-%m-%dT%H:%M:%S.%f")
             except ValueError:
-                self.flag("DI")
                 return None
 
-    @property
+    @_memoized
     def lat(self) -> Optional[float]:
         """
         :return: The latitude of this observation, or None if the latitude is invalid.
         """
         return self.get_float("Observation Latitude", "LM", "LI")
 
-    @property
+    @_memoized
     def lon(self) -> Optional[float]:
         """
         :return: The longitude of this observation, or None if it is missing or invalid.
         """
         return self.get_float("Observation Longitude", "LM", "LI")
 
-    @property
+    @_memoized
     def elevation(self) -> Optional[float]:
         """
         :return: The elevation of this observation, or None if it is missing or invalid.
         """
         val = self.get_float(["elevation", "Observation Elevation"], "EX", "EI")
-        if not (-300. <= val <= 6000.):
+        if val is not None and not (-300. <= val <= 6000.):
             self.flag("ER")
         return val
 
@@ -249,14 +752,14 @@ class Observation:
         :return: The floated key value, or None if the value is missing or invalid.
         """
         val = self.try_keys(keys if type(keys) is list else [keys])
-        try:
-            return float(val)
-        # TypeError occurs if we try to float None.  val is None if none of the keys returned anything.
-        except TypeError:
+        # val is None if none of the keys returned anything.
+        if val is None:
             self.flag(flag_missing)
             return None
-        # ValueError occurs if a key returned something, but the string does not represent a float.
-        except ValueError:
+        try:
+            return float(val)
+        # TypeError or ValueError occurs if a key returned something, but it does not represent a float.
+        except (TypeError, ValueError):
             self.flag(flag_invalid)
             return None
 
@@ -273,7 +776,7 @@ class Observation:
                 total = val if total is None else total + val
         return total
 
-    @property
+    @_memoized
     def tcc(self) -> Optional[str]:
         """
         :return: Gets the total cloud cover of this observation as a string, or None if it is invalid.  Raises flag CI
@@ -297,7 +800,7 @@ class Observation:
             self.flag("CX")
             return None
 
-    @property
+    @_memoized
     def tcc_aqua(self) -> Optional[float]:
         """
         :return: Gets the total cloud cover (sum of each level) as reported by Aqua.  Returns None if Aqua is not
@@ -306,7 +809,7 @@ class Observation:
         s = self.sum_keys(["Aqua Low Cloud Cover", "Aqua Mid Cloud Cover", "Aqua High Cloud Cover"])
         return s / 100. if s is not None else None
 
-    @property
+    @_memoized
     def tcc_terra(self) -> Optional[float]:
         """
         :return: Gets the total cloud cover (sum of each level) as reported by Terra.  Returns None if Terra is not
@@ -315,7 +818,7 @@ class Observation:
         s = self.sum_keys(["Terra Low Cloud Cover", "Terra Mid Cloud Cover", "Terra High Cloud Cover"])
         return s / 100. if s is not None else None
 
-    @property
+    @_memoized
     def tcc_aquaterra(self) -> Optional[float]:
         """
         :return: Gets the total cloud cover from Aqua or Terra, whichever is available, or None if neither are
@@ -330,7 +833,7 @@ class Observation:
         else:
             return a
 
-    @property
+    @_memoized
     def tcc_geo(self) -> Optional[float]:
         """
         :return: Gets the total cloud cover (sum of each level) as reported by a geostationary satellite.  Returns None
@@ -340,7 +843,7 @@ class Observation:
                            "GEO Low Cloud Cover", "GEO Mid Cloud Cover", "GEO High Cloud Cover"])
         return s / 100. if s is not None else None
 
-    @property
+    @_memoized
     def tcc_aqua_cat(self) -> Optional[str]:
         """
         :return: Gets the cloud cover category associated with the cloud fraction reported by Aqua if this observation
@@ -348,7 +851,7 @@ class Observation:
         """
         return self.bin_cloud_fraction(self.tcc_aqua) if self.tcc_aqua is not None else None
 
-    @property
+    @_memoized
     def tcc_terra_cat(self) -> Optional[str]:
         """
         :return: Gets the cloud cover category associated with the cloud fraction reported by Terra if this observation
@@ -356,7 +859,7 @@ class Observation:
         """
         return self.bin_cloud_fraction(self.tcc_terra) if self.tcc_terra is not None else None
 
-    @property
+    @_memoized
     def tcc_aquaterra_cat(self) -> Optional[str]:
         """
         :return: Gets the cloud cover category associated with the cloud fraction reported by Aqua or Terra, if either
@@ -364,7 +867,7 @@ class Observation:
         """
         return self.bin_cloud_fraction(self.tcc_aquaterra) if self.tcc_aquaterra is not None else None
 
-    @property
+    @_memoized
     def tcc_geo_cat(self) -> Optional[str]:
         """
         :return: Gets the cloud cover category associated with the cloud fraction reported by a geostationary satellite
@@ -372,6 +875,44 @@ class Observation:
         """
         return self.bin_cloud_fraction(self.tcc_geo) if self.tcc_geo is not None else None
 
+    @_memoized
+    def tcc_code(self) -> int:
+        """
+        :return: The code of this observation's total cloud cover category (see globeqa.categories), or 0 if it is
+        missing or invalid.
+        """
+        return categories.tcc_code(self.tcc)
+
+    @_memoized
+    def tcc_aqua_code(self) -> int:
+        """
+        :return: The code of tcc_aqua_cat (see globeqa.categories), or 0 if Aqua is not matched to this observation.
+        """
+        return categories.tcc_code(self.tcc_aqua_cat)
+
+    @_memoized
+    def tcc_terra_code(self) -> int:
+        """
+        :return: The code of tcc_terra_cat (see globeqa.categories), or 0 if Terra is not matched to this observation.
+        """
+        return categories.tcc_code(self.tcc_terra_cat)
+
+    @_memoized
+    def tcc_aquaterra_code(self) -> int:
+        """
+        :return: The code of tcc_aquaterra_cat (see globeqa.categories), or 0 if neither Aqua nor Terra is matched to
+        this observation.
+        """
+        return categories.tcc_code(self.tcc_aquaterra_cat)
+
+    @_memoized
+    def tcc_geo_code(self) -> int:
+        """
+        :return: The code of tcc_geo_cat (see globeqa.categories), or 0 if no geostationary satellite is matched to
+        this observation.
+        """
+        return categories.tcc_code(self.tcc_geo_cat)
+
     @property
     def which_geo(self) -> Optional[str]:
         """
@@ -388,31 +929,38 @@ class Observation:
         to be within the range.
         :return: A string describing the cloud cover: one of [none, few, isolated, scattered, broken, overcast].
         """
-        fraction = min(max(fraction, 0.0), 1.0)
-
-        bins = dict(none=0.00, few=0.10, isolated=0.25, scattered=0.50, broken=0.90, overcast=1.00)
-
-        for k, v in bins.items():
-            if fraction <= v:
-                return k
+        return categories.bin_cloud_fraction(fraction)
 
     @property
     def cloud_types(self) -> List[str]:
         """
         :return:  Gets the list of cloud types reported in this observation.
         """
-        cloud_types = ["Cirrus", "Cirrocumulus", "Cumulus", "Altocumulus", "Stratus", "Nimbostratus", "Altostratus",
-                       "Stratocumulus", "Cumulonimbus", "Cirrostratus"]
-        return [key for key in cloud_types if self.soft_get(key) == "true"]
+        return categories.unpack_names(self.cloud_type_mask, self._cloud_type_keys)
 
     @property
     def obscurations(self) -> List[str]:
         """
         :return:  Gets the list of obscurations reported in this observation.
         """
-        obscurations = ["Fog", "Smoke", "Haze", "VolcanicAsh", "Dust", "Sand", "Spray", "HeavyRain", "HeavySnow",
-                        "BlowingSnow"]
-        return [key for key in obscurations if self.soft_get(key) == "true"]
+        return categories.unpack_names(self.obscuration_mask, self._obscuration_keys)
+
+    @_memoized
+    def cloud_type_mask(self) -> int:
+        """
+        :return: The cloud types reported in this observation as a bitmask, where bit i stands for _cloud_type_keys[i].
+        """
+        return categories.pack_names([key for key in self._cloud_type_keys if self.soft_get(key) == "true"],
+                                     self._cloud_type_keys)
+
+    @_memoized
+    def obscuration_mask(self) -> int:
+        """
+        :return: The obscurations reported in this observation as a bitmask, where bit i stands for
+        _obscuration_keys[i].
+        """
+        return categories.pack_names([key for key in self._obscuration_keys if self.soft_get(key) == "true"],
+                                     self._obscuration_keys)
 
     def try_keys(self, keys: List[str]):
         """
@@ -420,26 +968,82 @@ class Observation:
         :param keys: The keys to check for.  Note that protocol name will be added automatically if needed.
         :return: The value of the key if a match is found; None otherwise.
         """
-        for key in keys:
-            try:
-                return self[key]
-            except KeyError:
-                pass
-        return None
+        value = self._get(tuple(keys))
+        return None if value is _MISSING else value
+
+    @classmethod
+    def flag_bit(cls, flag: str) -> int:
+        """
+        :param flag: The code of a flag.
+        :return: The bit that represents the flag in flag_mask.  Flags in _flag_definitions have fixed bits, in the
+        order they are defined; any other flag is given the next free bit the first time it is used.
+        :raises ValueError: If the flag is new, but all 64 bits are in use.
+        """
+        bit = cls._flag_bits.get(flag)
+        if bit is None:
+            if len(cls._flag_bits) >= 64:
+                raise ValueError("Flag '{}' cannot be added, as 64 flags are already in use.".format(flag))
+            bit = 1 << len(cls._flag_bits)
+            cls._flag_bits[flag] = bit
+        return bit
+
+    @classmethod
+    def flag_mask_of(cls, flags: Iterable[str]) -> int:
+        """
+        :param flags: The codes of some flags.
+        :return: The bitmask with the bits of those flags set.  Flags that have never been used have no bit, since no
+        observation can have them, and are left out.
+        """
+        mask = 0
+        for flag in flags:
+            mask |= cls._flag_bits.get(flag, 0)
+        return mask
+
+    @classmethod
+    def decode_flags(cls, mask: int) -> List[str]:
+        """
+        :param mask: A bitmask of flags.
+        :return: The codes of the flags whose bits are set, in bit order.
+        """
+        if mask == 0:
+            return []
+        return [flag for flag, bit in cls._flag_bits.items() if mask & bit]
+
+    @property
+    def flag_mask(self) -> int:
+        """
+        :return: The flags raised on this observation, as a bitmask (see flag_bit()).
+        """
+        return self._flags
+
+    @property
+    def flags(self) -> List[str]:
+        """
+        :return: The codes of the flags raised on this observation.  This is a new list, so changing it has no effect;
+        raise and lower flags with flag(), or assign a new list of codes to this property.
+        """
+        return self.decode_flags(self._flags)
+
+    @flags.setter
+    def flags(self, flags: Iterable[str]):
+        self._flags = 0
+        for flag in flags:
+            self._flags |= self.flag_bit(flag)
 
     def has_flag(self, flag: str) -> bool:
         """
         :param flag: The flag to check for.
         :return: Whether the flag is raised on this observation.
         """
-        return flag in self.flags
+        bit = self._flag_bits.get(flag)
+        return bit is not None and self._flags & bit != 0
 
     @property
     def flagged(self) -> bool:
         """
         :return: Whether any flags have been raised for this observation.
         """
-        return len(self.flags) > 0
+        return self._flags != 0
 
     def flag(self, flag: Optional[str], set_raised: bool = True) -> bool:
         """
@@ -452,144 +1056,45 @@ class Observation:
         # If flag is None, do nothing.
         if flag is None:
             return False
+        bit = self.flag_bit(flag)
         # If we are trying to raise a flag...
         if set_raised:
+            # Let any cached properties that are being computed know that they raise it.
+            if self._recording:
+                for raised in self._recording:
+                    raised.append(flag)
             # If the flag is not already raised, raise it.
-            if flag not in self.flags:
-                self.flags.append(flag)
+            if not self._flags & bit:
+                self._flags |= bit
                 return True
             # Otherwise, do nothing.
             return False
         # If we are trying to lower a flag...
         else:
             # If the flag is raised, lower it.
-            if flag is self.flags:
-                self.flags.remove(flag)
+            if self._flags & bit:
+                self._flags &= ~bit
                 return True
             # Otherwise, do nothing.
             return False
 
-    def check_for_flags(self, land=None):
+    def raise_flag_mask(self, mask: int):
         """
-        Calls all properties and methods that could raise flags.
-        :param land: The PreparedGeometry for checking whether the location is over land. If None, determination of
-        whether a location is a water will be ignored.
-        """
-        _ = self.elevation
-        self._check_for_flags_datetime()
-        self._check_for_flags_location(land)
-        self._check_for_flags_obscurations()
-        self._check_for_flags_ranges()
-
-    def _check_for_flags_datetime(self):
-        """
-        Checks this observation for datetime flags: DF, DI, DM, DO, and DZ.
-        """
-        # Retrieving the datetime could raise DI or DM flags.
-        dt = self.measured_dt
-        if dt is not None:
-            if dt > datetime.now():
-                self.flag("DF")
-            if dt.year < 1995:
-                self.flag("DO")
-            if dt.hour == 0 and dt.minute == 0:
-                self.flag("DZ")
-
-    def _check_for_flags_location(self, land=None):
-        """
-        Checks this observation for flags associated with the location: LI, LW, and LZ.  Additionally check if spray was
-        reported over land (flag OP).
-        :param land: The PreparedGeometry for determining whether the point is over land.  If None, whether the location
-        is not over water will not be checked (flags LW and OP will not be raised).
-        """
-        if self.lat is not None and self.lon is not None:
-            if land is not None:
-                # If the point is not on land, flag LW.
-                if not land.contains(sgeom.Point(self.lon, self.lat)):
-                    self.flag("LW")
-                # If the point is on land but sea spray was reported, flag OP.
-                elif self.soft_get("Spray") == "true":
-                    self.flag("OP")
-
-            if self.lat == 0. and self.lon == 0.:
-                self.flag("LZ")
-        # If lat or lon is invalid, flag LI.
-        else:
-            self.flag("LI")
-
-    def _check_for_flags_obscurations(self):
+        Raises every flag whose bit is set in a bitmask (see flag_bit()), such as one returned from another process.
+        :param mask: The bitmask.
         """
-        Checks this observation for flags associated with obscuration: HC, HO, OC, OD, OO, OR, and OX.  Because .tcc
-        will also be accessed, flags CI, CM and CX could also be raised.  Flag OP is raised in _check_for_flags_location
-        because it requires the land check.
-        """
-        if self["protocol"] == "sky_conditions":
-            obscuration_types = ["Fog", "Smoke", "Haze", "VolcanicAsh", "Dust", "Sand", "Spray", "HeavyRain",
-                                 "HeavySnow", "BlowingSnow"]
-
-            num_obscurations = 0
-            for key in obscuration_types:
-                if self.soft_get(key) == "true":
-                    num_obscurations += 1
-
-            if num_obscurations == 2:
-                self.flag("OD")
-            elif num_obscurations > 2:
-                self.flag("OR")
+        self._flags |= mask
 
-            # If num_obscurations and tcc disagree, raise a flag.
-            if (num_obscurations > 0) and (self.tcc != "obscured"):
-                self.flag("OO")
-            elif (num_obscurations == 0) and (self.tcc == "obscured"):
-                self.flag("OX")
-
-            # If they do agree that there is obscuration, but cloud types are still being reported, raise a flag.
-            elif ((num_obscurations > 0) or (self.tcc == "obscured")) and (len(self.cloud_types) > 0):
-                self.flag("OC")
-
-            # If haze as obscuration and sky clarity disagree, raise a flag.
-            haze = self.soft_get("Haze")
-            sky_clarity = self.soft_get("SkyClarity")
-            if (haze == "true") and (sky_clarity != "extremely hazy"):
-                self.flag("HO")
-            elif (haze != "true") and (sky_clarity == "extremely hazy"):
-                self.flag("HC")
-
-    def _check_for_flags_ranges(self):
+    def check_for_flags(self, land=None):
         """
-        Checks this observation for flags associated with miscellaneous ranges: MI, MR, NI, NR, TI, TM, TR, and TX.
+        Raises the flags of every quality-check rule that this observation fails (see globeqa.rules).  To check many
+        observations, use tools.do_quality_check(), which evaluates the rules over all of them at once.
+        :param land: The PreparedGeometry (or globeqa.land.LandMask) for checking whether the location is over land. If
+        None, determination of whether a location is a water will be ignored.
         """
-        if self["protocol"] == "tree_heights":
-            self.check_key_in_range("TreeHeightAvgM", 0., 99., "T", -99.)
-
-        # Check mosquito larvae count.
-        if self["protocol"] == "mosquito_habitat_mapper":
-            val = self.soft_get("LarvaeCount")
-            if val is not None:
-                try:
-                    val = float(val)
-                    if not (0 <= val <= 199):
-                        self.flag("MR")
-                except ValueError:
-                    if val not in ["1-25", "26-50", "51-100", "more than 100"]:
-                        self.flag("MI")
-
-        # Check total contrail count.
-        contrails = 0
-        for key in ["ShortLivedContrails", "SpreadingContrails", "NonSpreadingContrails"]:
-            try:
-                val = self[key]
-                if (val is not None) and (val.strip() != ""):
-                    contrails += float(val)
-            # If the key doesn't exist, that's fine.  Ignore it.
-            except KeyError:
-                pass
-            # If the value isn't an integer, something's not right.
-            except ValueError:
-                self.flag("NI")
-
-        if contrails >= 20:
-            self.flag("NR")
+        # globeqa.rules builds on this module, so it can only be imported once this module has been loaded.
+        from globeqa import rules
+        self.raise_flag_mask(int(rules.evaluate_observations([self], land)[0]))
 
     def check_key_in_range(self, key: str, low: float, high: float, x: str, missing: Optional[float] = None):
         """
@@ -652,8 +1157,14 @@ class Observation:
 
             # The following flags are defined, but not yet implemented:
             PI="Protocol invalid or not yet implemented",
+
+            # Flags defined later are appended, so that the bits of the flags above never change:
+            LM="Location is missing",
         )
 
+    # The bit of each flag (see flag_bit()).
+    _flag_bits = {flag: 1 << i for i, flag in enumerate(_flag_definitions)}  # type: Dict[str, int]
+
     @property
     def flag_definitions(self):
         """
@@ -667,15 +1178,15 @@ class Observation:
         """
         :return: All flags for this observation converted to human-readable terms.
         """
-        # Return the value corresponding to the key for each flag.
-        return [self.flag_definitions[i] for i in self.flags]
+        # Return the value corresponding to the key for each flag.  Flags without a definition are shown as their code.
+        return [self.flag_definitions.get(i, i) for i in self.flags]
 
     @property
     def keys(self) -> List[str]:
         """
         :return: Gets all the keys associated with this observation.
         """
-        return self._raw.keys()
+        return list(self.as_dict().keys())
 
     @property
     def source(self) -> str:
@@ -697,13 +1208,20 @@ class Observation:
         "rejected" if a photo was submitted but was rejected from the GLOBE database.
         """
         ret = {}
-        for direction in ["South", "West", "North", "East", "Upward", "Downward"]:
-            try:
-                ret[direction] = self["{}PhotoUrl".format(direction)]
-            except KeyError:
-                pass
+        for direction in self._photo_directions:
+            url = self._get(("{}PhotoUrl".format(direction),))
+            if url is not _MISSING:
+                ret[direction] = url
         return ret
 
+    @_memoized
+    def photo_mask(self) -> int:
+        """
+        :return: The directions that have a photo for this observation (see photo_urls) as a bitmask, where bit i stands
+        for _photo_directions[i].
+        """
+        return categories.pack_names(self.photo_urls, self._photo_directions)
+
     @property
     def is_from_observer(self):
         """
@@ -711,7 +1229,7 @@ class Observation:
         """
         return self.source in ["GLOBE Observer App", "citizen science", "GLOBE-trained citizen science"]
 
-    @property
+    @_memoized
     def id(self):
         """
         :return: Gets the observation's ID or number, whichever is available first.
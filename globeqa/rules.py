@@ -0,0 +1,404 @@
+"""
+The quality checks, evaluated over whole ObservationTables at once.  Every check is declared here, and only here, as a
+rule: the flag it raises, the inputs it reads, and a predicate over them, written as NumPy array expressions.
+tools.do_quality_check() and Observation.check_for_flags() both evaluate these rules (see evaluate()), which computes
+each input once per table.
+
+Inputs are named after the columns of the table (encoded columns, such as "protocol" and "sky_clarity", are decoded to
+their values), "<field>_status" for the state of a field in globeqa.table.STATUS_FIELDS, or one of the derived inputs
+registered with @derived, such as "now" and "over_land".  Rules that read "over_land" are only evaluated when land is
+given.  To add a flag, describe it at the end of Observation._flag_definitions, which gives it the next free bit, and
+declare its rule with @rule.
+"""
+
+from datetime import datetime
+from globeqa import categories
+from globeqa.land import LandMask
+from globeqa.observation import Observation
+from globeqa.table import CODED, INVALID, MISSING, VALID, STATUS_FIELDS, ObservationTable
+from hashlib import blake2b
+import inspect
+import numpy as np
+import shapely.geometry as sgeom
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+def _quiet(iterable, *_, **__):
+    """
+    A stand-in for tqdm that prints nothing.
+    """
+    return iterable
+
+
+class Rule:
+    def __init__(self, flag: str, inputs: Sequence[str], predicate: Callable[..., np.ndarray]):
+        """
+        A Rule raises a flag on the rows of a table for which its predicate holds.
+        :param flag: The code of the flag.  It must be defined in Observation._flag_definitions, so that its bit is the
+        same in every process.
+        :param inputs: The names of the inputs that the predicate takes, in order.
+        :param predicate: A function of the input arrays that returns a boolean array with one element per row.
+        :raises ValueError: If the flag is not defined.
+        """
+        if flag not in Observation._flag_definitions:
+            raise ValueError("Flag '{}' must be defined in Observation._flag_definitions.".format(flag))
+        self.flag = flag
+        self.inputs = tuple(inputs)
+        self.predicate = predicate
+        self.bit = Observation.flag_bit(flag)
+        # Whether the rule depends on the time of the check.  Such a rule must only ever stop holding as time passes
+        # (like DF), never start, since flag stores only check again the observations that it held for.
+        self.volatile = "now" in self.inputs
+
+    def __repr__(self):
+        return "Rule({!r}, {!r})".format(self.flag, self.inputs)
+
+
+# Every rule, in the order they are evaluated.
+RULES = []  # type: List[Rule]
+
+# The functions that compute the derived inputs, by name.
+_derived = dict()  # type: Dict[str, Callable[["Inputs"], np.ndarray]]
+
+
+def rule(flag: str, *inputs: str):
+    """
+    Declares a rule, by decorating its predicate.
+    :param flag: The code of the flag that the rule raises.
+    :param inputs: The names of the inputs that the predicate takes, in order.
+    :return: The decorator, which adds the rule to RULES and returns the predicate unchanged.
+    """
+    def register(predicate):
+        RULES.append(Rule(flag, inputs, predicate))
+        return predicate
+    return register
+
+
+def derived(name: str):
+    """
+    Declares a derived input, by decorating the function that computes it from the other inputs.
+    :param name: The name of the input.
+    :return: The decorator, which registers the function and returns it unchanged.
+    """
+    def register(compute):
+        _derived[name] = compute
+        return compute
+    return register
+
+
+class Inputs:
+    def __init__(self, table: ObservationTable, land=None, now: Optional[datetime] = None):
+        """
+        Inputs computes the inputs of rules over a table when they are first needed, and keeps them for the other rules.
+        :param table: The table.
+        :param land: The PreparedGeometry or LandMask for land checking, or None.
+        :param now: The time that measurements after are in the future.  Default None, which uses the current time.
+        """
+        self.table = table
+        self.land = land
+        self.now = np.datetime64(datetime.now() if now is None else now)
+        self._values = dict()  # type: Dict[str, np.ndarray]
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        """
+        :param name: The name of an input.
+        :return: Its value.
+        :raises KeyError: If there is no such input.
+        """
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        if name in _derived:
+            value = _derived[name](self)
+        elif name.endswith("_status") and name[:-len("_status")] in STATUS_FIELDS:
+            value = self.table.status(name[:-len("_status")])
+        elif name in ObservationTable._encoded_columns:
+            value = np.array(list(self.table.vocabulary(name)), dtype=object)[self.table[name]]
+        elif name in self.table.columns:
+            value = np.asarray(self.table[name])
+        else:
+            raise KeyError(name)
+        self._values[name] = value
+        return value
+
+
+def evaluate(table: ObservationTable, land=None, now: Optional[datetime] = None,
+             rules: Optional[Sequence[Rule]] = None) -> np.ndarray:
+    """
+    Quality checks every observation in a table at once.
+    :param table: The table.
+    :param land: The PreparedGeometry or LandMask for land checking (see tools.prepare_earth_geometry() and
+    tools.prepare_land_mask()).  If None, the rules that need it (LW and OP) are skipped.
+    :param now: The time that measurements after are in the future (flag DF).  Default None, which uses the current
+    time.
+    :param rules: The rules to evaluate.  Default None, which evaluates RULES.
+    :return: The flags raised on each row, as a uint64 array of bitmasks (see Observation.flag_bit()).
+    """
+    inputs = Inputs(table, land, now)
+    masks = np.zeros(len(table), dtype=np.uint64)
+    for r in RULES if rules is None else rules:
+        if land is None and "over_land" in r.inputs:
+            continue
+        masks[r.predicate(*[inputs[name] for name in r.inputs])] |= np.uint64(r.bit)
+    return masks
+
+
+def volatile_mask() -> int:
+    """
+    :return: The bitmask of the flags raised by rules that depend on the time of the check (see Rule.volatile).
+    """
+    mask = 0
+    for r in RULES:
+        if r.volatile:
+            mask |= r.bit
+    return mask
+
+
+def fingerprint() -> str:
+    """
+    :return: A hash of the flags' bits (the order of Observation._flag_definitions) and of every rule and derived input,
+    including the source of its function, which changes whenever any of them does.
+    """
+    parts = [list(Observation._flag_definitions)]
+    parts += [(r.flag, r.inputs, _source(r.predicate)) for r in RULES]
+    parts += [(name, _source(compute)) for name, compute in sorted(_derived.items())]
+    return blake2b(repr(parts).encode("utf8"), digest_size=8).hexdigest()
+
+
+def _source(function: Callable) -> str:
+    """
+    :param function: A function.
+    :return: Its source code, or its bytecode if the source is not available.
+    """
+    try:
+        return inspect.getsource(function)
+    except (OSError, TypeError):
+        return function.__code__.co_code.hex()
+
+
+def evaluate_observations(obs: Sequence[Observation], land=None, now: Optional[datetime] = None,
+                          tqdm=_quiet) -> np.ndarray:
+    """
+    Quality checks a list of observations at once, by evaluating the rules over a table of them.  The flags already
+    raised on the observations are neither used nor changed.
+    :param obs: The observations.
+    :param land: The PreparedGeometry or LandMask for land checking, or None; see evaluate().
+    :param now: The time that measurements after are in the future; see evaluate().
+    :param tqdm: The wrapper around the loop that builds the table.  By default, nothing is printed.
+    :return: The flags raised on each observation, as a uint64 array of bitmasks (see Observation.flag_bit()).
+    """
+    return evaluate(ObservationTable.from_observations(obs, tqdm=tqdm, checked_only=True), land, now)
+
+
+@derived("now")
+def _now(inputs: Inputs) -> np.datetime64:
+    return inputs.now
+
+
+@derived("location_valid")
+def _location_valid(inputs: Inputs) -> np.ndarray:
+    return (inputs["lat_status"] == VALID) & (inputs["lon_status"] == VALID)
+
+
+@derived("over_land")
+def _over_land(inputs: Inputs) -> np.ndarray:
+    # Only valid locations are looked up.
+    valid = np.flatnonzero(inputs["location_valid"])
+    lon, lat = inputs["lon"][valid], inputs["lat"][valid]
+    over_land = np.zeros(len(inputs.table), dtype=bool)
+    if isinstance(inputs.land, LandMask):
+        over_land[valid] = inputs.land.contains_points(lon, lat)
+    else:
+        over_land[valid] = [inputs.land.contains(sgeom.Point(x, y)) for x, y in zip(lon, lat)]
+    return over_land
+
+
+@derived("obscuration_count")
+def _obscuration_count(inputs: Inputs) -> np.ndarray:
+    return categories.popcount(inputs["obscuration_mask"])
+
+
+@derived("haze")
+def _haze(inputs: Inputs) -> np.ndarray:
+    return inputs["obscuration_mask"] & categories.pack_names(["Haze"], Observation._obscuration_keys) != 0
+
+
+@derived("spray")
+def _spray(inputs: Inputs) -> np.ndarray:
+    return inputs["obscuration_mask"] & categories.pack_names(["Spray"], Observation._obscuration_keys) != 0
+
+
+# Cloud cover.  The cloud cover is only checked for the sky conditions protocol.
+
+@rule("CI", "protocol", "tcc_status")
+def _tcc_invalid(protocol, status):
+    return (protocol == "sky_conditions") & (status == INVALID)
+
+
+@rule("CM", "protocol", "tcc_status")
+def _tcc_coded_missing(protocol, status):
+    return (protocol == "sky_conditions") & (status == CODED)
+
+
+@rule("CX", "protocol", "tcc_status")
+def _tcc_missing(protocol, status):
+    return (protocol == "sky_conditions") & (status == MISSING)
+
+
+# Measurement time.
+
+@rule("DF", "measured_status", "measured", "now")
+def _measured_in_future(status, measured, now):
+    return (status == VALID) & (measured > now)
+
+
+@rule("DI", "measured_status")
+def _measured_invalid(status):
+    return status == INVALID
+
+
+@rule("DO", "measured_status", "measured")
+def _measured_before_1995(status, measured):
+    return (status == VALID) & (measured < np.datetime64("1995-01-01"))
+
+
+@rule("DX", "measured_status")
+def _measured_missing(status):
+    return status == MISSING
+
+
+@rule("DZ", "measured_status", "measured")
+def _measured_at_midnight(status, measured):
+    return (status == VALID) & (measured - measured.astype("datetime64[D]") < np.timedelta64(60, "s"))
+
+
+# Elevation.
+
+@rule("EI", "elevation_status")
+def _elevation_invalid(status):
+    return status == INVALID
+
+
+@rule("ER", "elevation_status", "elevation")
+def _elevation_out_of_range(status, elevation):
+    return (status == VALID) & ~((-300. <= elevation) & (elevation <= 6000.))
+
+
+@rule("EX", "elevation_status")
+def _elevation_missing(status):
+    return status == MISSING
+
+
+# Haze.
+
+@rule("HC", "protocol", "haze", "sky_clarity")
+def _haze_clarity_only(protocol, haze, sky_clarity):
+    return (protocol == "sky_conditions") & ~haze & (sky_clarity == "extremely hazy")
+
+
+@rule("HO", "protocol", "haze", "sky_clarity")
+def _haze_obscuration_only(protocol, haze, sky_clarity):
+    return (protocol == "sky_conditions") & haze & (sky_clarity != "extremely hazy")
+
+
+# Location.
+
+@rule("LI", "location_valid")
+def _location_invalid(valid):
+    return ~valid
+
+
+@rule("LM", "lat_status", "lon_status")
+def _location_missing(lat_status, lon_status):
+    # The longitude is only read once the latitude is known to be valid, so an invalid latitude hides a missing
+    # longitude.
+    return (lat_status == MISSING) | ((lat_status == VALID) & (lon_status == MISSING))
+
+
+@rule("LW", "location_valid", "over_land")
+def _location_over_water(valid, over_land):
+    return valid & ~over_land
+
+
+@rule("LZ", "location_valid", "lat", "lon")
+def _location_zero(valid, lat, lon):
+    return valid & (lat == 0.) & (lon == 0.)
+
+
+# Mosquito larvae.
+
+@rule("MI", "protocol", "larvae_count_status")
+def _larvae_count_invalid(protocol, status):
+    return (protocol == "mosquito_habitat_mapper") & (status == INVALID)
+
+
+@rule("MR", "protocol", "larvae_count_status", "larvae_count")
+def _larvae_count_out_of_range(protocol, status, count):
+    return (protocol == "mosquito_habitat_mapper") & (status == VALID) & ~((0. <= count) & (count <= 199.))
+
+
+# Contrails.
+
+@rule("NI", "contrails_status")
+def _contrails_invalid(status):
+    return status == INVALID
+
+
+@rule("NR", "contrails")
+def _contrails_out_of_range(contrails):
+    return contrails >= 20.
+
+
+# Obscurations.  Like cloud cover, these are only checked for the sky conditions protocol.
+
+@rule("OC", "protocol", "obscuration_count", "tcc", "cloud_type_mask")
+def _obscured_with_cloud_types(protocol, count, tcc, cloud_type_mask):
+    return (protocol == "sky_conditions") & (count > 0) & (tcc == "obscured") & (cloud_type_mask != 0)
+
+
+@rule("OD", "protocol", "obscuration_count")
+def _two_obscurations(protocol, count):
+    return (protocol == "sky_conditions") & (count == 2)
+
+
+@rule("OO", "protocol", "obscuration_count", "tcc")
+def _obscurations_not_obscured(protocol, count, tcc):
+    return (protocol == "sky_conditions") & (count > 0) & (tcc != "obscured")
+
+
+@rule("OP", "location_valid", "over_land", "spray")
+def _spray_over_land(valid, over_land, spray):
+    return valid & over_land & spray
+
+
+@rule("OR", "protocol", "obscuration_count")
+def _many_obscurations(protocol, count):
+    return (protocol == "sky_conditions") & (count > 2)
+
+
+@rule("OX", "protocol", "obscuration_count", "tcc")
+def _obscured_without_obscurations(protocol, count, tcc):
+    return (protocol == "sky_conditions") & (count == 0) & (tcc == "obscured")
+
+
+# Tree height.
+
+@rule("TI", "protocol", "tree_height_status")
+def _tree_height_invalid(protocol, status):
+    return (protocol == "tree_heights") & (status == INVALID)
+
+
+@rule("TM", "protocol", "tree_height_status")
+def _tree_height_coded_missing(protocol, status):
+    return (protocol == "tree_heights") & (status == CODED)
+
+
+@rule("TR", "protocol", "tree_height_status", "tree_height")
+def _tree_height_out_of_range(protocol, status, height):
+    return (protocol == "tree_heights") & (status == VALID) & ~((0. <= height) & (height <= 99.))
+
+
+@rule("TX", "protocol", "tree_height_status")
+def _tree_height_missing(protocol, status):
+    return (protocol == "tree_heights") & (status == MISSING)
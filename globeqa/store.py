@@ -0,0 +1,353 @@
+"""
+A local store of GLOBE API downloads, partitioned by protocol and by day or month.  A request for a range of dates only
+downloads the partitions that are not already stored, and the union of the stored partitions is then written out as
+a single GeoJSON file that tools.parse_json() can read.
+"""
+
+from datetime import date, datetime, timedelta
+from globeqa import tools
+from globeqa.files import GeoJSONStream, detect_encoding, fetch
+import json
+import os
+from os.path import dirname, isfile, join
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+
+# Bump whenever the layout of the store changes.
+STORE_VERSION = 1
+
+
+class ObservationStore:
+    def __init__(self, root: str, partition: str = "day", refresh_days: int = 3,
+                 refresh_interval: timedelta = timedelta(hours=1), base_url: str = tools.GLOBE_API_URL,
+                 retries: int = 3):
+        """
+        An ObservationStore keeps GLOBE API downloads in a folder, one GeoJSON file per protocol and partition (day or
+        month).  Partitions that ended more than refresh_days ago are marked immutable once downloaded and are never
+        downloaded again.  More recent partitions may still gain observations, so they are downloaded again if they
+        are older than refresh_interval.
+        :param root: The folder to keep the store in.  It is created if needed.
+        :param partition: "day" or "month".  Default "day".  This cannot be changed once the store has been created.
+        :param refresh_days: The number of days before today within which partitions are not yet immutable.  Default 3.
+        :param refresh_interval: How long a partition that is not yet immutable is used before it is downloaded again.
+        Default 1 hour.
+        :param base_url: The URL of the API endpoint.  Default tools.GLOBE_API_URL.
+        :param retries: The number of times to retry a failed request, waiting 1, 2, 4... seconds in between.  Default
+        3.
+        :raises ValueError: If partition is not "day" or "month", or does not match the existing store.
+        """
+        if partition not in ["day", "month"]:
+            raise ValueError("Argument 'partition' must be 'day' or 'month'.")
+
+        self.root = root
+        self.partition = partition
+        self.refresh_days = refresh_days
+        self.refresh_interval = refresh_interval
+        self.base_url = base_url
+        self.retries = retries
+
+        os.makedirs(root, exist_ok=True)
+        self._manifest_path = join(root, "manifest.json")
+        if isfile(self._manifest_path):
+            with open(self._manifest_path, "r") as f:
+                self._manifest = json.load(f)
+            if self._manifest["partition"] != partition:
+                raise ValueError("The store at '{}' is partitioned by {}, not {}.".format(
+                    root, self._manifest["partition"], partition))
+        else:
+            self._manifest = dict(version=STORE_VERSION, partition=partition, partitions=dict())
+
+    def partitions(self, start: Union[date, datetime], end: Union[date, datetime]) -> List[str]:
+        """
+        :param start: The first day of the range.
+        :param end: The last day of the range.
+        :return: The keys of the partitions that cover the range, in order ("2019-05-01" or "2019-05").
+        """
+        keys = []
+        day = _as_date(start)
+        while day <= _as_date(end):
+            key = self._key(day)
+            keys.append(key)
+            day = self._span(key)[1] + timedelta(1)
+        return keys
+
+    def path(self, protocol: str, key: str) -> str:
+        """
+        :param protocol: The protocol.
+        :param key: The key of the partition.
+        :return: The path of the partition's GeoJSON file.
+        """
+        return join(self.root, protocol, key[:4], key + ".json")
+
+    def missing(self, protocols: List[str], start: Union[date, datetime],
+                end: Union[date, datetime]) -> List[Tuple[str, str]]:
+        """
+        :param protocols: The protocols.
+        :param start: The first day of the range.
+        :param end: The last day of the range.
+        :return: The (protocol, key) pairs of the partitions that must be downloaded to serve the range: those that
+        have never been downloaded, and those that are not immutable and were downloaded more than refresh_interval ago.
+        """
+        now = datetime.utcnow()
+        result = []
+        for protocol in protocols:
+            for key in self.partitions(start, end):
+                entry = self._manifest["partitions"].get("{}/{}".format(protocol, key))
+                if entry is None or not isfile(self.path(protocol, key)):
+                    result.append((protocol, key))
+                elif not entry["immutable"] and now - _parse_timestamp(entry["fetched_at"]) > self.refresh_interval:
+                    result.append((protocol, key))
+        return result
+
+    def update(self, protocols: List[str], start: Union[date, datetime], end: Union[date, datetime],
+               today: Optional[date] = None, max_run: int = 31):
+        """
+        Downloads the partitions that are missing or out of date for a range (see missing()).  Consecutive partitions
+        of a protocol are downloaded with a single request, up to max_run partitions at a time.
+        :param protocols: The protocols.
+        :param start: The first day of the range.
+        :param end: The last day of the range.
+        :param today: The current date (UTC), which determines which partitions become immutable.  Default None, which
+        uses the system clock.
+        :param max_run: The largest number of partitions to download with one request.  Default 31.
+        :raises IOError: If any partition could not be downloaded.  Partitions that were downloaded are kept.
+        """
+        if today is None:
+            today = datetime.utcnow().date()
+
+        missing = self.missing(protocols, start, end)
+        if len(missing) == 0:
+            print("--  All {} partitions are already stored.".format(len(protocols) * len(self.partitions(start, end))))
+            return
+
+        runs = list(self._runs(missing, max_run))
+        print("--  Downloading {} partitions in {} requests...".format(len(missing), len(runs)))
+        failed = []
+        for protocol, keys in runs:
+            try:
+                self._download_run(protocol, keys, today)
+            except Exception as e:
+                print("(x) Download of {} {} to {} failed:".format(protocol, keys[0], keys[-1]))
+                print(e)
+                failed += keys
+
+        if len(failed) > 0:
+            raise IOError("{} partitions could not be downloaded.".format(len(failed)))
+
+    def download(self, protocols: List[str], start: Union[date, datetime], end: Optional[Union[date, datetime]] = None,
+                 download_dest: str = "%P_%S_%E.json", today: Optional[date] = None) -> str:
+        """
+        Downloads whatever the store lacks for a range, then writes the stored observations within the range to one
+        GeoJSON file.  This is a drop-in replacement for tools.download_from_api() that never downloads the same
+        completed day twice.
+        :param protocols: The protocols to download.
+        :param start: The first day of the range.
+        :param end: The last day of the range.  If None, will be set equal to the start date.  Default None.
+        :param download_dest: Where to save the file.  %P, %S, and %E are replaced as in tools.download_from_api().
+        Default "%P_%S_%E.json".
+        :param today: The current date (UTC).  Default None, which uses the system clock.
+        :return: The path to the file.
+        :raises IOError: If any partition could not be downloaded.
+        """
+        if end is None:
+            end = start
+
+        self.update(protocols, start, end, today)
+
+        download_dest = download_dest.replace("%P", "__".join(protocols))
+        download_dest = download_dest.replace("%S", start.strftime("%Y%m%d"))
+        download_dest = download_dest.replace("%E", end.strftime("%Y%m%d"))
+        self.export(protocols, start, end, download_dest)
+        return download_dest
+
+    def export(self, protocols: List[str], start: Union[date, datetime], end: Union[date, datetime], dest: str) -> int:
+        """
+        Writes the stored observations within a range to one GeoJSON file.  Partitions that are not stored are skipped.
+        :param protocols: The protocols.
+        :param start: The first day of the range.
+        :param end: The last day of the range.
+        :param dest: The path of the file to write.
+        :return: The number of features written.
+        """
+        written = 0
+        temporary = "{}.tmp{}".format(dest, os.getpid())
+        with open(temporary, "w", encoding="utf8") as out:
+            out.write('{"type": "FeatureCollection", "features": [')
+            for line in self.iter_lines(protocols, start, end):
+                out.write(",\n" if written > 0 else "\n")
+                out.write(line)
+                written += 1
+            out.write("\n]}\n")
+        os.replace(temporary, dest)
+        print("--  Wrote {} observations from the store to:".format(written))
+        print("--  {}".format(dest))
+        return written
+
+    def iter_lines(self, protocols: List[str], start: Union[date, datetime],
+                   end: Union[date, datetime]) -> Iterator[str]:
+        """
+        :param protocols: The protocols.
+        :param start: The first day of the range.
+        :param end: The last day of the range.
+        :return: A generator of the encoded JSON text of each stored feature within the range, by protocol and then in
+        partition order.  Partitions that are not stored are skipped.
+        """
+        first, last = _as_date(start), _as_date(end)
+        for protocol in protocols:
+            for key in self.partitions(first, last):
+                fp = self.path(protocol, key)
+                if not isfile(fp):
+                    continue
+                span = self._span(key)
+                # Only partitions that overlap the ends of the range need to be decoded to check each feature's date.
+                whole = first <= span[0] and span[1] <= last
+                for line in _iter_partition(fp):
+                    if whole:
+                        yield line
+                    else:
+                        day = _feature_date(json.loads(line))
+                        if day is None or first <= day <= last:
+                            yield line
+
+    def _key(self, day: date) -> str:
+        """
+        :param day: A date.
+        :return: The key of the partition that the date falls in.
+        """
+        return day.strftime("%Y-%m-%d") if self.partition == "day" else day.strftime("%Y-%m")
+
+    def _span(self, key: str) -> Tuple[date, date]:
+        """
+        :param key: The key of a partition.
+        :return: The first and last days of the partition.
+        """
+        if self.partition == "day":
+            day = datetime.strptime(key, "%Y-%m-%d").date()
+            return day, day
+        first = datetime.strptime(key, "%Y-%m").date()
+        following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+        return first, following - timedelta(1)
+
+    def _runs(self, missing: List[Tuple[str, str]], max_run: int) -> Iterator[Tuple[str, List[str]]]:
+        """
+        Groups partitions into runs of consecutive partitions of the same protocol.
+        :param missing: The (protocol, key) pairs, in the order returned by missing().
+        :param max_run: The largest number of partitions in one run.
+        :return: A generator of (protocol, keys) pairs.
+        """
+        run = []
+        for protocol, key in missing:
+            if len(run) > 0 and (run[0][0] != protocol or len(run) >= max_run or
+                                 self._span(run[-1][1])[1] + timedelta(1) != self._span(key)[0]):
+                yield run[0][0], [k for _, k in run]
+                run = []
+            run.append((protocol, key))
+        if len(run) > 0:
+            yield run[0][0], [k for _, k in run]
+
+    def _download_run(self, protocol: str, keys: List[str], today: date):
+        """
+        Downloads a run of consecutive partitions with one request, splits the features among the partitions by
+        measurement date, and saves every partition in the run (including empty ones).
+        :param protocol: The protocol.
+        :param keys: The keys of the partitions, in order.
+        :param today: The current date (UTC).
+        """
+        first, last = self._span(keys[0])[0], self._span(keys[-1])[1]
+        url = tools.api_query_url([protocol], first, last, self.base_url)
+        print("--  {}".format(url))
+
+        # Download to a temporary file first, so that a failed download leaves the store unchanged.
+        temporary = join(self.root, "download.tmp{}".format(os.getpid()))
+        try:
+            fetch(url, temporary, self.retries)
+
+            lines = {key: [] for key in keys}  # type: Dict[str, List[str]]
+            with open(temporary, "rb") as f:
+                stream = GeoJSONStream(f, detect_encoding(f))
+                for feature in stream.features():
+                    day = _feature_date(feature)
+                    key = self._key(day) if day is not None and first <= day <= last else None
+                    # Features without a usable date are kept with the first partition so that they are not lost.
+                    lines[key if key in lines else keys[0]].append(json.dumps(feature, ensure_ascii=False))
+        finally:
+            if isfile(temporary):
+                os.remove(temporary)
+
+        fetched_at = datetime.utcnow().isoformat()
+        for key in keys:
+            _write_partition(self.path(protocol, key), lines[key])
+            self._manifest["partitions"]["{}/{}".format(protocol, key)] = dict(
+                fetched_at=fetched_at,
+                immutable=self._span(key)[1] < today - timedelta(self.refresh_days),
+                count=len(lines[key]),
+            )
+        self._write_manifest()
+
+    def _write_manifest(self):
+        """
+        Atomically writes the store's manifest.
+        """
+        temporary = self._manifest_path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump(self._manifest, f, indent=1, sort_keys=True)
+        os.replace(temporary, self._manifest_path)
+
+
+def _as_date(d: Union[date, datetime]) -> date:
+    """
+    :param d: A date or datetime.
+    :return: The date.
+    """
+    return d.date() if isinstance(d, datetime) else d
+
+
+def _parse_timestamp(timestamp: str) -> datetime:
+    """
+    :param timestamp: A timestamp written by datetime.isoformat().
+    :return: The datetime.
+    """
+    return datetime.strptime(timestamp[:19], "%Y-%m-%dT%H:%M:%S")
+
+
+def _feature_date(feature: dict) -> Optional[date]:
+    """
+    :param feature: A GeoJSON feature from the GLOBE API.
+    :return: The date on which the observation was measured, or None if it is missing or invalid.
+    """
+    properties = feature["properties"]
+    protocol = properties.get("protocol") or ""
+    measured_at = properties.get("MeasuredAt", properties.get(protocol.replace("_", "") + "MeasuredAt"))
+    try:
+        return datetime.strptime(measured_at[:10], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _write_partition(fp: str, lines: List[str]):
+    """
+    Atomically writes a partition as a GeoJSON file with one feature per line, which _iter_partition() relies on.
+    :param fp: The path of the partition.
+    :param lines: The encoded JSON text of each feature.
+    """
+    os.makedirs(dirname(fp), exist_ok=True)
+    temporary = fp + ".tmp"
+    with open(temporary, "w", encoding="utf8") as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        f.write(",\n".join(lines))
+        f.write("\n]}\n")
+    os.replace(temporary, fp)
+
+
+def _iter_partition(fp: str) -> Iterator[str]:
+    """
+    :param fp: The path of a partition written by _write_partition().
+    :return: A generator of the encoded JSON text of each feature in the partition.
+    """
+    with open(fp, "r", encoding="utf8") as f:
+        # Skip the line that opens the collection.  The line that closes it does not begin with '{'.
+        next(f, None)
+        for line in f:
+            if line.startswith("{"):
+                line = line.rstrip("\n")
+                yield line[:-1] if line.endswith(",") else line
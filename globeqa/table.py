@@ -0,0 +1,595 @@
+from datetime import datetime
+from globeqa.categories import GLOBE_TCC_CATEGORIES, Vocabulary
+from globeqa.observation import Observation
+from itertools import islice
+import json
+import numpy as np
+from tqdm import tqdm
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+
+def parse_datetimes(strings: Iterable[Optional[str]]) -> np.ndarray:
+    """
+    Converts GLOBE datetime strings to an array in one vectorized pass.  The result is exactly what
+    Observation.parse_datetime() gives for each string, truncated to whole seconds.  Strings in the usual
+    %Y-%m-%dT%H:%M:%S[.%f] layout are decoded with array arithmetic; the rare strings that are laid out differently (for
+    instance, with single-digit fields, which strptime also accepts) are handed to Observation.parse_datetime().
+    :param strings: The strings.  None, and anything else that is not a string, gives NaT.
+    :return: The datetimes, as datetime64[s], with NaT where a string is missing, malformed, or not a real datetime.
+    """
+    # Work through the strings in blocks, so that the character matrices stay small.
+    blocks = []
+    iterator = iter(strings)
+    while True:
+        block = [s if type(s) is str else "" for s in islice(iterator, _datetime_block_size)]
+        if len(block) == 0:
+            break
+        blocks.append(_parse_datetime_block(np.array(block, dtype=str)))
+    return np.concatenate(blocks) if blocks else np.array([], dtype="datetime64[s]")
+
+
+def datetimes_between(measured: np.ndarray, earliest: Optional[datetime] = None,
+                      latest: Optional[datetime] = None) -> np.ndarray:
+    """
+    :param measured: Datetimes, as datetime64[s].
+    :param earliest: The earliest datetime that passes, or None for no lower bound.  Default None.
+    :param latest: The datetime at or after which datetimes do NOT pass, or None for no upper bound.  Default None.
+    :return: A boolean mask of the datetimes within the range.  NaT never passes.
+    """
+    mask = ~np.isnat(measured)
+    if earliest is not None:
+        mask &= measured >= np.datetime64(earliest, "s")
+    if latest is not None:
+        mask &= measured < np.datetime64(latest, "s")
+    return mask
+
+
+# The number of strings that parse_datetimes() decodes at a time.
+_datetime_block_size = 1 << 16
+
+# The states of a field recorded in a table's "field_status" column.  A field is VALID if it holds a usable value,
+# MISSING if the observation does not have it, INVALID if its value cannot be interpreted, and CODED if its value is a
+# recognized code instead of a number (such as "-99" for missing, or a range of larvae counts).
+VALID, MISSING, INVALID, CODED = 0, 1, 2, 3
+
+# The fields whose states are held in the "field_status" column, two bits each, from the least significant bits up.
+STATUS_FIELDS = ("measured", "lat", "lon", "elevation", "tcc", "tree_height", "larvae_count", "contrails")
+
+
+def _float_state(value) -> Tuple[float, int]:
+    """
+    :param value: A raw value.
+    :return: The value as a float, and its state: MISSING if it is None, and INVALID if it does not represent a float,
+    as Observation.get_float() decides.  The float is NaN unless the state is VALID.
+    """
+    if value is None:
+        return np.nan, MISSING
+    try:
+        return float(value), VALID
+    except (TypeError, ValueError):
+        return np.nan, INVALID
+
+
+def _parse_datetime_block(text: np.ndarray) -> np.ndarray:
+    """
+    :param text: A block of strings, as an array of dtype str.  Missing strings are empty.
+    :return: The datetimes; see parse_datetimes().
+    """
+    result = np.full(len(text), np.datetime64("NaT"), dtype="datetime64[s]")
+
+    # Lay the strings out as a matrix of character codes, padded with zeros to the longest canonical length of 26.
+    lengths = np.char.str_len(text)
+    width = text.dtype.itemsize // 4
+    codes = np.zeros((len(text), 26), dtype=np.uint32)
+    if width > 0:
+        codes[:, :min(width, 26)] = text.view(np.uint32).reshape(len(text), width)[:, :26]
+    digits = codes - ord("0")
+    is_digit = digits <= 9
+
+    canonical = (lengths == 19) | ((lengths >= 21) & (lengths <= 26) & (codes[:, 19] == ord(".")))
+    canonical &= is_digit[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]].all(axis=1)
+    canonical &= (codes[:, 4] == ord("-")) & (codes[:, 7] == ord("-")) & (codes[:, 10] == ord("T"))
+    canonical &= (codes[:, 13] == ord(":")) & (codes[:, 16] == ord(":"))
+    for k in range(20, 26):
+        canonical &= is_digit[:, k] | (lengths <= k)
+
+    def field(first: int, count: int) -> np.ndarray:
+        value = np.zeros(len(text), dtype=np.int64)
+        for k in range(first, first + count):
+            value = value * 10 + np.where(canonical, digits[:, k], 0)
+        return value
+
+    year, month, day = field(0, 4), field(5, 2), field(8, 2)
+    hour, minute, second = field(11, 2), field(14, 2), field(17, 2)
+    months = np.where(canonical & (month >= 1) & (month <= 12), (year - 1970) * 12 + month - 1, 0)
+    first_day = months.astype("datetime64[M]").astype("datetime64[D]")
+    month_length = ((months + 1).astype("datetime64[M]").astype("datetime64[D]") - first_day).astype(np.int64)
+    valid = (canonical & (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_length) &
+             (hour <= 23) & (minute <= 59) & (second <= 59))
+    result[valid] = (first_day[valid].astype("datetime64[s]") +
+                     ((day[valid] - 1) * 86400 + hour[valid] * 3600 + minute[valid] * 60 + second[valid]))
+
+    for i in np.flatnonzero(~canonical & (lengths > 0)):
+        dt = Observation.parse_datetime(text[i])
+        if dt is not None:
+            result[i] = np.datetime64(dt, "s")
+    return result
+
+
+class PackedRecords:
+    def __init__(self, blob: np.ndarray, starts: np.ndarray, ends: np.ndarray):
+        """
+        PackedRecords is a read-only sequence of raw observation properties stored as UTF-8 JSON text in a single
+        byte buffer.  Each record is decoded only when it is accessed, and the buffer may be a memory-mapped file.
+        :param blob: The buffer, as a uint8 array.
+        :param starts: The offset in the buffer at which each record begins.
+        :param ends: The offset in the buffer at which each record ends.
+        """
+        self._blob = blob
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def pack(cls, records: Iterable[dict]) -> "PackedRecords":
+        """
+        :param records: The records to pack.
+        :return: The records packed into a single in-memory buffer.
+        """
+        encoded = [json.dumps(r, separators=(",", ":")).encode("utf8") for r in records]
+        ends = np.cumsum([len(e) for e in encoded], dtype=np.int64)
+        starts = ends - np.array([len(e) for e in encoded], dtype=np.int64)
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), starts, ends)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i: int) -> dict:
+        return json.loads(self.raw(i))
+
+    def raw(self, i: int) -> bytes:
+        """
+        :param i: The index of the record.
+        :return: The encoded JSON text of the record.
+        """
+        return self._blob[self.starts[i]:self.ends[i]].tobytes()
+
+    @classmethod
+    def concat(cls, sequences: Sequence["PackedRecords"]) -> "PackedRecords":
+        """
+        :param sequences: The sequences to concatenate.
+        :return: A new sequence holding the records of all the sequences, in order, in a new buffer.
+        """
+        blobs, starts, ends = [], [], []
+        offset = 0
+        for sequence in sequences:
+            # Only the bytes spanned by the selected records are copied.
+            low = int(sequence.starts.min()) if len(sequence) else 0
+            high = int(sequence.ends.max()) if len(sequence) else 0
+            blobs.append(np.asarray(sequence._blob[low:high]))
+            starts.append(sequence.starts - low + offset)
+            ends.append(sequence.ends - low + offset)
+            offset += high - low
+        return cls(np.concatenate(blobs) if blobs else np.array([], dtype=np.uint8),
+                   np.concatenate(starts).astype(np.int64) if starts else np.array([], dtype=np.int64),
+                   np.concatenate(ends).astype(np.int64) if ends else np.array([], dtype=np.int64))
+
+    def take(self, indices: np.ndarray) -> "PackedRecords":
+        """
+        :param indices: The records to select.
+        :return: A new sequence of the selected records, sharing this one's buffer.
+        """
+        return PackedRecords(self._blob, self.starts[indices], self.ends[indices])
+
+
+class ObservationTable:
+    # The typed columns that every table holds, and their dtypes.
+    _column_dtypes = dict(
+        lat=np.float64,
+        lon=np.float64,
+        elevation=np.float64,
+        measured=np.dtype("datetime64[s]"),
+        tcc=np.uint8,
+        tcc_aqua_cat=np.uint8,
+        tcc_terra_cat=np.uint8,
+        tcc_aquaterra_cat=np.uint8,
+        tcc_geo_cat=np.uint8,
+        cloud_type_mask=np.uint16,
+        obscuration_mask=np.uint16,
+        photo_mask=np.uint8,
+        protocol=np.uint8,
+        source=np.int32,
+        site=np.int32,
+        from_api=np.bool_,
+        sky_clarity=np.int32,
+        tree_height=np.float64,
+        larvae_count=np.float64,
+        contrails=np.float64,
+        field_status=np.uint16,
+    )
+
+    # The columns that are dictionary-encoded, and therefore have a vocabulary.
+    _encoded_columns = ("tcc", "tcc_aqua_cat", "tcc_terra_cat", "tcc_aquaterra_cat", "tcc_geo_cat", "protocol",
+                        "source", "site", "sky_clarity")
+
+    # The encoded columns that hold cloud cover categories.  Their codes are fixed (see globeqa.categories), so that
+    # they mean the same thing in every table and can be compared directly.
+    _tcc_columns = ("tcc", "tcc_aqua_cat", "tcc_terra_cat", "tcc_aquaterra_cat", "tcc_geo_cat")
+
+    def __init__(self, columns: Dict[str, np.ndarray], vocabularies: Dict[str, Vocabulary], records: Sequence[dict]):
+        """
+        An ObservationTable holds observations column-wise in NumPy arrays, so that filters and aggregations can be
+        performed as vectorized array operations.  Latitude, longitude, and elevation are float64 (NaN if missing or
+        invalid), the measurement time is datetime64[s] (NaT if missing or invalid), and cloud cover, protocol,
+        DataSource, and siteName are stored as integer codes into a Vocabulary.  The GLOBE cloud cover ("tcc") and the
+        categories of the cloud fractions of any matched satellites ("tcc_aqua_cat", ...) always use the codes of
+        globeqa.categories.GLOBE_TCC_CATEGORIES.  The cloud types, obscurations, and photo directions reported are
+        stored as bitmasks (see Observation.cloud_type_mask, obscuration_mask and photo_mask).  The values that the
+        quality checks examine are also kept: the sky clarity (encoded), the average tree height, the larvae count, the
+        total contrail count, and the state of each field in STATUS_FIELDS (see status()), so that globeqa.rules can
+        check whole tables at once.  The raw properties of each observation are kept alongside, so row-wise Observation
+        views (table[i]) remain available.
+        Tables are normally built with from_observations(), or by passing as_table=True to tools.parse_json() or
+        tools.parse_csv().
+        :param columns: The typed columns.  Every column must have the same length as records.
+        :param vocabularies: The vocabulary for each dictionary-encoded column.
+        :param records: The raw properties (Observation.as_dict()) of each row.  This may be a list or a lazily-decoded
+        sequence such as PackedRecords.
+        :raises ValueError: If any column is missing or has the wrong length.
+        """
+        for name in self._column_dtypes:
+            if name not in columns:
+                raise ValueError("Column '{}' is missing.".format(name))
+            if len(columns[name]) != len(records):
+                raise ValueError("Column '{}' has length {}, but there are {} records.".format(
+                    name, len(columns[name]), len(records)))
+
+        self._columns = columns
+        self._vocabularies = vocabularies
+        self._records = records
+        # Row-wise views are created on first access and kept, so that flags raised on them persist.
+        self._views = dict()  # type: Dict[int, Observation]
+        # The flags raised on every row at once (see raise_flag_masks()).  Views start with the flags of their row.
+        self._flag_masks = np.zeros(len(records), dtype=np.uint64)
+
+    # The columns that are derived from the cloud cover matched from satellites and the photos, which the quality checks
+    # (see globeqa.rules) do not read.
+    _unchecked_columns = ("tcc_aqua_cat", "tcc_terra_cat", "tcc_aquaterra_cat", "tcc_geo_cat", "photo_mask", "source",
+                          "site")
+
+    @classmethod
+    def from_observations(cls, obs: Iterable[Observation], tqdm=tqdm, pack: bool = False,
+                          keep: Optional[FrozenSet[str]] = None, checked_only: bool = False) -> "ObservationTable":
+        """
+        Builds a table from observations.  The observations may be a generator (such as tools.iter_json()), in which
+        case they are consumed one at a time and only their raw properties are kept.
+        :param obs: The observations.
+        :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+        :param pack: Whether to store the raw properties as PackedRecords rather than a list of dictionaries.  Packed
+        records are far cheaper to pickle, such as when returning a table from a worker process.  Default False.
+        :param keep: If given, only these keys of each observation's raw properties are kept (see
+        Observation.keep_only()).  The typed columns are derived before any keys are dropped.  Default None.
+        :param checked_only: Whether to only derive the columns that the quality checks read (see globeqa.rules), which
+        is about twice as fast.  The satellite cloud cover categories, photo_mask, source and site are then left empty
+        (0, the code of None).  Default False.
+        :return: The table.
+        """
+        vocabularies = cls._new_vocabularies()
+        values = {name: [] for name in cls._column_dtypes}
+        records = []
+
+        for ob in tqdm(obs, desc="Building observation table"):
+            row = cls._extract_row(ob, vocabularies, checked_only)
+            for name, value in row.items():
+                values[name].append(value)
+            if keep is not None:
+                ob.keep_only(keep)
+            records.append(ob.as_dict())
+
+        columns = {name: parse_datetimes(values[name]) if name == "measured" else np.array(values[name], dtype=dtype)
+                   for name, dtype in cls._column_dtypes.items()}
+        # A measurement time is only known to be invalid once it has been parsed.
+        status = columns["field_status"]
+        status[np.isnat(columns["measured"]) & (status & 3 == VALID)] |= INVALID
+        return cls(columns, vocabularies, PackedRecords.pack(records) if pack else records)
+
+    @classmethod
+    def concat(cls, tables: Sequence["ObservationTable"]) -> "ObservationTable":
+        """
+        Concatenates tables, merging the vocabularies of their dictionary-encoded columns.  The codes of the result
+        are the same as if the rows had all been added to one table in order.
+        :param tables: The tables to concatenate.
+        :return: The concatenated table.
+        """
+        vocabularies = cls._new_vocabularies()
+        parts = {name: [] for name in cls._column_dtypes}
+        for table in tables:
+            for name in cls._column_dtypes:
+                column = np.asarray(table[name])
+                if name in cls._encoded_columns:
+                    # Translate this table's codes into the merged vocabulary.
+                    translation = np.array([vocabularies[name].code(v) for v in table.vocabulary(name)],
+                                           dtype=column.dtype)
+                    column = translation[column]
+                parts[name].append(column)
+        columns = {name: np.concatenate(parts[name]).astype(dtype, copy=False) if parts[name] else
+                   np.array([], dtype=dtype) for name, dtype in cls._column_dtypes.items()}
+
+        if all(isinstance(table.records, PackedRecords) for table in tables) and len(tables) > 0:
+            records = PackedRecords.concat([table.records for table in tables])
+        else:
+            records = [r for table in tables for r in table.records]
+
+        result = cls(columns, vocabularies, records)
+        if len(tables) > 0:
+            result._flag_masks = np.concatenate([table._flag_masks for table in tables])
+        offset = 0
+        for table in tables:
+            result._views.update({offset + i: view for i, view in table._views.items()})
+            offset += len(table)
+        return result
+
+    @classmethod
+    def _new_vocabularies(cls) -> Dict[str, Vocabulary]:
+        """
+        :return: An empty vocabulary for each dictionary-encoded column, except that the cloud cover columns have the
+        fixed vocabulary of GLOBE_TCC_CATEGORIES.
+        """
+        return {name: Vocabulary(GLOBE_TCC_CATEGORIES[1:], frozen=True) if name in cls._tcc_columns else Vocabulary()
+                for name in cls._encoded_columns}
+
+    @classmethod
+    def _extract_row(cls, ob: Observation, vocabularies: Dict[str, Vocabulary], checked_only: bool = False) -> dict:
+        """
+        Derives the typed column values of one observation.
+        :param ob: The observation.
+        :param vocabularies: The vocabularies of the dictionary-encoded columns, which are extended as needed.
+        :param checked_only: Whether to leave the columns that the quality checks do not read empty.  Default False.
+        :return: A dictionary of (column, value) pairs.
+        """
+        # Read the properties through a throwaway view, so that the flags they raise are not left on the original.
+        scratch = ob.without_flags()
+        lat, lat_status = _float_state(scratch.try_keys(["Observation Latitude"]))
+        lon, lon_status = _float_state(scratch.try_keys(["Observation Longitude"]))
+        elevation, elevation_status = _float_state(scratch.try_keys(["elevation", "Observation Elevation"]))
+        # The measurement datetimes of the whole table are parsed at once, in from_observations(), which also marks
+        # the ones that cannot be parsed as invalid.
+        measured = scratch.measured_string
+
+        tcc = scratch.try_keys(["Total Cloud Cover", "CloudCover"])
+        tcc_status = (MISSING if tcc is None else VALID if tcc in GLOBE_TCC_CATEGORIES[1:] else
+                      CODED if tcc == "-99" else INVALID)
+
+        tree_height, tree_height_status = _float_state(scratch.soft_get("TreeHeightAvgM"))
+        if tree_height_status == VALID and tree_height == -99.:
+            tree_height_status = CODED
+
+        larvae = scratch.soft_get("LarvaeCount")
+        larvae_count, larvae_count_status = _float_state(larvae)
+        if larvae_count_status == INVALID and larvae in Observation._larvae_count_ranges:
+            larvae_count_status = CODED
+        # Blank counts are ignored and the valid ones are added up (see the NI and NR rules in globeqa.rules).
+        contrails, contrails_status = 0., MISSING
+        for key in Observation._contrail_keys:
+            val = scratch.soft_get(key)
+            if val is not None and str(val).strip() != "":
+                val, val_status = _float_state(val)
+                if val_status == VALID:
+                    contrails += val
+                # One invalid count makes the whole field invalid.
+                if contrails_status != INVALID:
+                    contrails_status = val_status
+
+        states = (MISSING if measured is None else VALID, lat_status, lon_status, elevation_status, tcc_status,
+                  tree_height_status, larvae_count_status, contrails_status)
+
+        row = dict(
+            lat=lat,
+            lon=lon,
+            elevation=elevation,
+            measured=measured,
+            tcc=scratch.tcc_code,
+            cloud_type_mask=scratch.cloud_type_mask,
+            obscuration_mask=scratch.obscuration_mask,
+            protocol=vocabularies["protocol"].code(scratch.soft_get("protocol")),
+            from_api=ob.fromAPI,
+            sky_clarity=vocabularies["sky_clarity"].code(scratch.soft_get("SkyClarity")),
+            tree_height=tree_height,
+            larvae_count=larvae_count,
+            contrails=contrails,
+            field_status=sum(state << 2 * k for k, state in enumerate(states)),
+        )
+        if checked_only:
+            row.update((name, 0) for name in cls._unchecked_columns)
+            return row
+
+        try:
+            source = scratch.source
+        except KeyError:
+            source = None
+        row.update(
+            tcc_aqua_cat=scratch.tcc_aqua_code,
+            tcc_terra_cat=scratch.tcc_terra_code,
+            tcc_aquaterra_cat=scratch.tcc_aquaterra_code,
+            tcc_geo_cat=scratch.tcc_geo_code,
+            photo_mask=scratch.photo_mask,
+            source=vocabularies["source"].code(source),
+            site=vocabularies["site"].code(scratch.soft_get("siteName")),
+        )
+        return row
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[Observation]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getitem__(self, item: Union[int, str, slice, np.ndarray, Sequence[int]]):
+        """
+        Indexes the table.
+        :param item: An integer gets the Observation view of that row.  A string gets the column of that name.  A
+        slice, an integer array, or a boolean mask gets a new table of the selected rows.
+        :return: The view, column, or table.
+        """
+        if isinstance(item, (int, np.integer)):
+            return self._view(int(item))
+        elif isinstance(item, str):
+            return self._columns[item]
+        elif isinstance(item, slice):
+            return self.take(np.arange(len(self))[item])
+        else:
+            item = np.asarray(item)
+            if item.dtype == np.bool_:
+                return self.filter(item)
+            return self.take(item)
+
+    def _view(self, i: int) -> Observation:
+        """
+        :param i: The row.
+        :return: The Observation view of the row, which is created on first access.
+        """
+        if i < 0:
+            i += len(self)
+        try:
+            return self._views[i]
+        except KeyError:
+            if not (0 <= i < len(self)):
+                raise IndexError("Row {} is out of range for a table of {} observations.".format(i, len(self)))
+            ob = Observation.from_raw(self._records[i], bool(self._columns["from_api"][i]))
+            ob.raise_flag_mask(int(self._flag_masks[i]))
+            self._views[i] = ob
+            return ob
+
+    def status(self, field: str) -> np.ndarray:
+        """
+        :param field: One of STATUS_FIELDS.
+        :return: The state of that field in each row: VALID, MISSING, INVALID or CODED.
+        :raises ValueError: If field is not one of STATUS_FIELDS.
+        """
+        if field not in STATUS_FIELDS:
+            raise ValueError("'{}' is not one of {}.".format(field, ", ".join(STATUS_FIELDS)))
+        return (self._columns["field_status"] >> 2 * STATUS_FIELDS.index(field)) & 3
+
+    @property
+    def flag_masks(self) -> np.ndarray:
+        """
+        :return: The flags raised on each row, as a uint64 bitmask (see Observation.flag_bit()): those raised on every
+        row at once with raise_flag_masks(), and those raised on its Observation view.
+        """
+        masks = self._flag_masks.copy()
+        for i, view in self._views.items():
+            masks[i] |= np.uint64(view.flag_mask)
+        return masks
+
+    def raise_flag_masks(self, masks: np.ndarray):
+        """
+        Raises flags on every row at once, without creating any Observation views.  Views that already exist have the
+        flags raised on them as well.
+        :param masks: The bitmask of the flags to raise on each row (see Observation.flag_bit()).
+        :raises ValueError: If there is not one mask per row.
+        """
+        masks = np.asarray(masks, dtype=np.uint64)
+        if masks.shape != (len(self),):
+            raise ValueError("Argument 'masks' must have shape ({},).".format(len(self)))
+        self._flag_masks |= masks
+        for i, view in self._views.items():
+            view.raise_flag_mask(int(masks[i]))
+
+    @property
+    def columns(self) -> List[str]:
+        """
+        :return: The names of all columns in this table.
+        """
+        return list(self._columns.keys())
+
+    @property
+    def records(self) -> Sequence[dict]:
+        """
+        :return: The raw properties of each row.
+        """
+        return self._records
+
+    @property
+    def observations(self) -> List[Observation]:
+        """
+        :return: The Observation views of every row, in order.  This is equivalent to the list returned by
+        tools.parse_json() and tools.parse_csv().
+        """
+        return list(self)
+
+    def vocabulary(self, name: str) -> Vocabulary:
+        """
+        :param name: The name of a dictionary-encoded column.
+        :return: The vocabulary of that column.
+        """
+        return self._vocabularies[name]
+
+    def decoded(self, name: str) -> List[Optional[str]]:
+        """
+        :param name: The name of a dictionary-encoded column.
+        :return: The values of that column, decoded to their original strings (None where missing).
+        """
+        return self._vocabularies[name].decode(self._columns[name])
+
+    def codes_of(self, name: str, values: Iterable[Optional[str]]) -> np.ndarray:
+        """
+        :param name: The name of a dictionary-encoded column.
+        :param values: The values to look up.  Values that do not appear in the column are skipped.
+        :return: The integer codes of the values, for use with np.isin().
+        """
+        vocabulary = self._vocabularies[name]
+        return np.array([vocabulary.code(v) for v in values if v in vocabulary], dtype=self._columns[name].dtype)
+
+    def isin(self, name: str, values: Iterable[Optional[str]]) -> np.ndarray:
+        """
+        :param name: The name of a dictionary-encoded column.
+        :param values: The values to look for.
+        :return: A boolean mask of the rows whose value in that column is one of the given values.
+        """
+        return np.isin(self._columns[name], self.codes_of(name, values))
+
+    def take(self, indices: Union[np.ndarray, Sequence[int]]) -> "ObservationTable":
+        """
+        :param indices: The rows to select, in the order they should appear.
+        :return: A new table holding the selected rows.  Views already created are shared with the new table.
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        columns = {name: column[indices] for name, column in self._columns.items()}
+        if isinstance(self._records, PackedRecords):
+            records = self._records.take(indices)
+        else:
+            records = [self._records[i] for i in indices]
+        table = ObservationTable(columns, self._vocabularies, records)
+        table._flag_masks = self._flag_masks[indices]
+        table._views = {new: self._views[old] for new, old in enumerate(indices.tolist()) if old in self._views}
+        return table
+
+    def filter(self, mask: np.ndarray) -> "ObservationTable":
+        """
+        :param mask: A boolean mask with one element per row.
+        :return: A new table holding the rows where the mask is True.
+        :raises ValueError: If the mask does not have one element per row.
+        """
+        mask = np.asarray(mask, dtype=np.bool_)
+        if mask.shape != (len(self),):
+            raise ValueError("Argument 'mask' must have shape ({},).".format(len(self)))
+        return self.take(np.flatnonzero(mask))
+
+    def between(self, earliest: Optional[datetime] = None, latest: Optional[datetime] = None) -> np.ndarray:
+        """
+        :param earliest: The earliest measurement datetime that passes, or None for no lower bound.  Default None.
+        :param latest: The measurement datetime at or after which observations do NOT pass, or None for no upper bound.
+        Default None.
+        :return: A boolean mask of the rows measured within the range.  Rows without a valid datetime never pass.
+        """
+        return datetimes_between(self._columns["measured"], earliest, latest)
+
+    def value_counts(self, name: str) -> Dict[Optional[str], int]:
+        """
+        Counts how many times each value occurs in a dictionary-encoded column.
+        :param name: The name of a dictionary-encoded column.
+        :return: A dictionary of (value, count) pairs for each value that occurs at least once.
+        """
+        counts = np.bincount(self._columns[name], minlength=len(self._vocabularies[name]))
+        vocabulary = self._vocabularies[name]
+        return {vocabulary[code]: int(count) for code, count in enumerate(counts) if count > 0}
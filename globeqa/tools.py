@@ -1,51 +1,311 @@
-import cartopy.io.shapereader as shpreader
-from contextlib import closing
+import codecs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import date, datetime, timedelta
+import io
 import json
+import multiprocessing
 from netCDF4 import Dataset
+import numpy as np
+from globeqa import cache as snapshots, categories, flagstore, rules
+from globeqa.files import (GeoJSONStream, compression_of, compression_suffix, detect_encoding, fetch, open_data_file,
+                           open_for_writing)
+from globeqa.flagstore import FlagStore
+from globeqa.ingest import IngestFilter
+from globeqa.land import LandMask, land_source, open_land_source, prepared_land
 from globeqa.observation import Observation
+from globeqa.table import ObservationTable, datetimes_between, parse_datetimes
 from operator import itemgetter
-from os.path import isfile, join
-from shapely.ops import unary_union
-from shapely.prepared import prep
-from shutil import copyfileobj
+import os
+from os.path import getsize, isfile, join
+import re
+from shutil import rmtree
 from tqdm import tqdm
-from typing import List, Dict, Optional, Union, Tuple, Iterable, Callable, Any
-from urllib.request import urlopen
+from typing import (List, Dict, Optional, Union, Tuple, Iterable, Iterator, Callable, Any, BinaryIO, FrozenSet,
+                    Sequence)
 
 
-def parse_csv(fp: str, count: int = 1e30, protocol: Optional[str] = "sky_conditions", tqdm=tqdm) -> List[Observation]:
+def parse_csv(fp: str, count: int = 1e30, protocol: Optional[str] = "sky_conditions", tqdm=tqdm,
+              as_table: bool = False, cache: Union[bool, str] = False, workers: int = 1,
+              columns: Optional[Iterable[str]] = None,
+              where: Optional[IngestFilter] = None) -> Union[List[Observation], ObservationTable]:
     """
     Parse a CSV file containing GLOBE observations.
-    :param fp: The path to the CSV file.
-    :param count: The maximum number of observations to parse.  Default 1e30.
+    :param fp: The path to the CSV file, which may be gzip- or xz-compressed (see open_data_file()).
+    :param count: The maximum number of observations to parse.  If where is given, only rows that pass count towards
+    this.  Default 1e30.
     :param protocol: The protocol that the CSV file comes from.  Default 'sky_conditions'.
     :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+    :param as_table: Whether to return the observations as a columnar ObservationTable instead of a list.  Default
+    False.
+    :param cache: Whether to keep a binary snapshot of the parsed file (see globeqa.cache) and load from it on later
+    calls.  May also be the path of the cache directory to use.  Loading is fastest with as_table=True.  Default False.
+    :param workers: The number of processes to parse with.  If more than 1, the file is split into byte ranges at line
+    boundaries that are parsed in parallel into table columns; the result is identical to parsing serially.  This
+    benefits as_table=True the most, since a list requires every record to be decoded again in this process.
+    Compressed files, and files that are not UTF-8, are always parsed serially.  Default 1.
+    :param columns: The keys and/or Observation properties to keep (see Observation.resolve_keys()); every other key
+    is dropped as the file is parsed.  For example, ["measured_dt", "tcc", "lat", "lon", "DataSource"].  The typed
+    columns of a table are always filled in.  Default None, which keeps every key.
+    :param where: Predicates that each row must pass to be parsed (see globeqa.ingest.IngestFilter).  They are
+    evaluated on the raw row, so rows that fail cost almost nothing.  The number of rows dropped by each predicate is
+    added to the filter's counters and printed.  Default None, which parses every row.
     :return: The observations.
     """
+    keep = Observation.resolve_keys(columns) if columns is not None else None
+
+    def build() -> ObservationTable:
+        table = None
+        if workers > 1 and compression_of(fp) is None:
+            table = _parse_csv_parallel(fp, count, protocol, workers, keep, tqdm=tqdm, where=where)
+            if table is None:
+                print("--  The file is not UTF-8, so it cannot be split; parsing serially instead.")
+        if table is None:
+            table = ObservationTable.from_observations(_iter_csv(fp, count, protocol, tqdm, where=where),
+                                                       tqdm=_untracked, keep=keep)
+        if where is not None:
+            where.report()
+        return table
+
+    if cache:
+        return _parse_cached(fp, _variant("csv", protocol, count, keep, where), cache, as_table, build)
+    if as_table or workers > 1:
+        table = build()
+        return table if as_table else table.observations
+    obs = list(_iter_csv(fp, count, protocol, tqdm, keep, where))
+    if where is not None:
+        where.report()
+    return obs
+
+
+def _variant(*options) -> str:
+    """
+    :param options: The options that a file was parsed with.
+    :return: A string that identifies the options, for keying the snapshot cache.
+    """
+    return "|".join(",".join(sorted(o)) if isinstance(o, frozenset) else str(o) for o in options)
 
-    # Prepare to collect observations.
-    observations = []
-    with open(fp, "r") as f:
-        # Set aside the header, split it, and strip each piece.
-        header = f.readline().split(',')
-        header = [h.strip() for h in header]
-        # Determine number of lines for tqdm.
-        line_count = sum(1 for _ in open(fp, 'rb')) - 1
-        # Loop through each line.
-        for line in tqdm(f, total=line_count, desc="Reading CSV file"):
-            # If limited by count, exit.
-            if len(observations) >= count:
-                break
-            # Split the line and create an Observation for it.
-            s = line.split(',')
-            observations.append(Observation(header, s, protocol=protocol))
 
-    return observations
+def _parse_cached(fp: str, variant: str, cache: Union[bool, str], as_table: bool,
+                  build: Callable[[], ObservationTable]) -> Union[List[Observation], ObservationTable]:
+    """
+    Loads a parsed file from the snapshot cache, or builds and caches it if there is no current snapshot.
+    :param fp: The path to the source file.
+    :param variant: A string describing the parse options.
+    :param cache: True to use the default cache directory, or the path of the cache directory.
+    :param as_table: Whether to return a table rather than a list.
+    :param build: A function that parses the file into a table.
+    :return: The observations.
+    """
+    cache_dir = cache if isinstance(cache, str) else None
+    table = snapshots.load_snapshot(fp, variant, cache_dir)
+    if table is None:
+        table = build()
+        snapshots.save_snapshot(fp, variant, table, cache_dir)
+    return table if as_table else table.observations
+
+
+def _untracked(iterable, *_, **__):
+    """
+    A stand-in for tqdm that prints nothing, used where an iterable is already wrapped by the caller's tqdm.
+    """
+    return iterable
+
+
+def _iter_csv(fp: str, count: int, protocol: Optional[str], tqdm, keep: Optional[FrozenSet[str]] = None,
+              where: Optional[IngestFilter] = None) -> Iterator[Observation]:
+    """
+    Lazily parses a CSV file containing GLOBE observations.  See parse_csv() for a description of the parameters.
+    Progress is tracked in blocks of the file (see _iter_line_blocks()), so no separate pass is needed to count lines.
+    :return: A generator of observations, in file order.
+    """
+    parsed = 0
+    header = None
+    index = None
+    with open_data_file(fp) as f:
+        encoding = detect_encoding(f)
+        # The size of a compressed file says little about how many blocks it decompresses to.
+        blocks = -(-getsize(fp) // _csv_block_size) if compression_of(fp) is None else None
+        for lines in tqdm(_iter_text_line_blocks(f, encoding), total=blocks, desc="Reading CSV file (MiB)"):
+            for line in lines:
+                # Set aside the header, split it, and strip each piece.
+                if header is None:
+                    header = [h.strip() for h in line.split(',')]
+                    index = {h: c for c, h in enumerate(header)}
+                    continue
+                # If limited by count, exit.
+                if parsed >= count:
+                    return
+                # Split the line, skip it if it fails the filter, and create an Observation for it.
+                s = line.split(',')
+                if where is not None and not where.accept_row(index, s, protocol):
+                    continue
+                parsed += 1
+                ob = Observation(header, s, protocol=protocol)
+                if keep is not None:
+                    ob.keep_only(keep)
+                yield ob
+
+
+# The number of bytes of a CSV file read at a time.  Progress through a CSV file is reported in these blocks.
+_csv_block_size = 1 << 20
+
+
+def _iter_line_blocks(f: BinaryIO, stop: Optional[int] = None) -> Iterator[List[bytes]]:
+    """
+    Reads a binary file in blocks and splits it into lines, which keep their line endings.  As with files opened in
+    text mode, lines may end with '\n', '\r\n', or '\r'.
+    :param f: The binary file object, positioned at the start of a line.
+    :param stop: The byte offset at which to stop reading, which must be the start of a line.  Default None, which
+    reads to the end of the file.
+    :return: A generator of the lists of complete lines in each block.
+    """
+    position = f.tell()
+    tail = b""
+    while True:
+        size = _csv_block_size if stop is None else min(_csv_block_size, stop - position)
+        block = f.read(size) if size > 0 else b""
+        position += len(block)
+        if not block:
+            if tail:
+                yield [tail]
+            return
+        lines = (tail + block).splitlines(keepends=True)
+        # The last line may continue in the next block, including a '\r' whose '\n' has not been read yet.
+        tail = b"" if lines[-1].endswith(b"\n") else lines.pop()
+        yield lines
+
+
+def _iter_text_line_blocks(f: BinaryIO, encoding: str) -> Iterator[List[str]]:
+    """
+    Reads a binary file in blocks and splits it into decoded lines, which keep their line endings.  In encodings where
+    a newline is not the single byte '\n', such as UTF-16, the text is decoded before it is split rather than after.
+    :param f: The binary file object, positioned at the start of a line.
+    :param encoding: The text encoding of the file (see detect_encoding()).
+    :return: A generator of the lists of complete lines in each block of about _csv_block_size bytes.
+    """
+    if not codecs.lookup(encoding).name.startswith(("utf-16", "utf-32")):
+        for lines in _iter_line_blocks(f):
+            yield [line.decode(encoding) for line in lines]
+        return
+    # newline="" splits lines at the same endings as _iter_line_blocks(), and keeps them.
+    text = io.TextIOWrapper(f, encoding, newline="")
+    try:
+        # Each character takes at least two bytes.
+        for lines in iter(lambda: text.readlines(_csv_block_size // 2), []):
+            yield lines
+    finally:
+        text.detach()
+
+
+def _parse_csv_parallel(fp: str, count: int, protocol: Optional[str], workers: int, keep: Optional[FrozenSet[str]],
+                        tqdm=tqdm, where: Optional[IngestFilter] = None) -> Optional[ObservationTable]:
+    """
+    Parses a CSV file into a table using a pool of worker processes.  The rows after the header are split into byte
+    ranges that begin at line boundaries, each range is parsed by a worker into a partial table, and the partial
+    tables are concatenated in order.  See parse_csv() for a description of the parameters.
+    Only UTF-8 files are split, since in other encodings (such as UTF-16) a newline byte may be half of a character.
+    :return: The table, or None if the file is not UTF-8 and so must be parsed serially.
+    """
+    with open(fp, "rb") as f:
+        encoding = codecs.lookup(detect_encoding(f)).name
+        if encoding not in ["utf-8", "utf-8-sig"]:
+            return None
+        header_line = next(iter(next(_iter_line_blocks(f), [b""])), b"")
+        header = [h.strip() for h in header_line.decode(encoding).split(',')]
+
+        # Split into equal byte ranges, each moved forward to the start of the next line.  Four ranges per worker keeps
+        # the workers evenly loaded.
+        size = getsize(fp)
+        starts = [len(header_line)]
+        shard_count = workers * 4
+        for k in range(1, shard_count):
+            f.seek(starts[0] + (size - starts[0]) * k // shard_count)
+            window = f.read(1 << 16)
+            newline = window.find(b"\n")
+            if newline >= 0:
+                start = f.tell() - len(window) + newline + 1
+                if starts[-1] < start < size:
+                    starts.append(start)
+
+    stops = starts[1:] + [None]
+    tables = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        shards = executor.map(_parse_csv_shard, [fp] * len(starts), [header] * len(starts), [protocol] * len(starts),
+                              [encoding] * len(starts), starts, stops, [count] * len(starts), [keep] * len(starts),
+                              [where] * len(starts))
+        for table, seen, dropped in tqdm(shards, total=len(starts), desc="Reading CSV file"):
+            tables.append(table)
+            if where is not None:
+                where.merge(dropped, seen)
+
+    table = ObservationTable.concat(tables)
+    # No shard parses more than count rows, but together they may.
+    return table[:int(count)] if len(table) > count else table
+
+
+def _parse_csv_shard(fp: str, header: List[str], protocol: Optional[str], encoding: str, start: int,
+                     stop: Optional[int], count: int, keep: Optional[FrozenSet[str]],
+                     where: Optional[IngestFilter]) -> Tuple[ObservationTable, int, Dict[str, int]]:
+    """
+    Parses the lines within a byte range of a CSV file.  This runs in a worker process.
+    :param fp: The path to the CSV file.
+    :param header: The stripped column names.
+    :param protocol: The protocol that the CSV file comes from.
+    :param encoding: The text encoding of the file.
+    :param start: The byte offset of the first line in the range.
+    :param stop: The byte offset of the end of the range, or None to read to the end of the file.
+    :param count: The maximum number of observations to parse.
+    :param keep: The keys to keep, or None to keep every key.
+    :param where: The filter that rows must pass, or None to parse every row.
+    :return: The partial table with its records packed, the number of rows the filter examined, and the number it
+    dropped by each predicate.
+    """
+    index = {h: c for c, h in enumerate(header)}
+    if where is not None:
+        # This is a copy of the caller's filter; its counts are returned so that the caller can add them up.
+        where.reset()
+
+    def observations() -> Iterator[Observation]:
+        parsed = 0
+        with open(fp, "rb") as f:
+            f.seek(start)
+            for lines in _iter_line_blocks(f, stop):
+                for line in lines:
+                    if parsed >= count:
+                        return
+                    s = line.decode(encoding).split(',')
+                    if where is not None and not where.accept_row(index, s, protocol):
+                        continue
+                    parsed += 1
+                    yield Observation(header, s, protocol=protocol)
+
+    table = ObservationTable.from_observations(observations(), tqdm=_untracked, pack=True, keep=keep)
+    return (table, where.seen, where.dropped) if where is not None else (table, 0, {})
+
+
+# The GLOBE API endpoint that searches for measurements by protocol and measurement date.
+GLOBE_API_URL = "https://api.globe.gov/search/v1/measurement/protocol/measureddate/"
+
+
+def api_query_url(protocols: List[str], start: Union[date, datetime], end: Union[date, datetime],
+                  base_url: str = GLOBE_API_URL) -> str:
+    """
+    :param protocols: The protocols to download.
+    :param start: The first day of the range to download.
+    :param end: The last day of the range to download.
+    :param base_url: The URL of the API endpoint.  Default GLOBE_API_URL.
+    :return: The URL that downloads the observations of the given protocols within the range as GeoJSON.
+    """
+    # Create a string that represents the protocol part of the query.
+    protocol_string = "".join(["protocols={}&".format(protocol) for protocol in protocols])
+    return "{}?{}startdate={}&enddate={}&geojson=TRUE&sample=FALSE".format(
+        base_url, protocol_string, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
 
 
 def download_from_api(protocols: List[str], start: Union[date, datetime], end: Optional[Union[date, datetime]] = None,
-                      download_dest: str = "%P_%S_%E.json", check_existing: bool = True) -> str:
+                      download_dest: str = "%P_%S_%E.json", check_existing: bool = True,
+                      base_url: str = GLOBE_API_URL, chunk_months: Optional[int] = None, workers: int = 4,
+                      retries: int = 3, compression: Optional[str] = None, tqdm=tqdm) -> str:
     """
     Downloads from the GLOBE API.
     :param protocols: The protocols to download.
@@ -57,22 +317,34 @@ def download_from_api(protocols: List[str], start: Union[date, datetime], end: O
     :param check_existing: Whether to check if the file exists locally (at download_dest) before
     downloading.  download_dest will be interpreted according to the rules listed above before checking.
     Default True.
-    :returns: The path to the downloaded file, including the file name.
+    :param base_url: The URL of the API endpoint.  Default GLOBE_API_URL.
+    :param chunk_months: If given, the range is split at calendar month boundaries into chunks of this many months,
+    which are downloaded concurrently and then merged into one file.  Chunks that were downloaded are kept until the
+    merge succeeds, so after a failure, downloading the same range again only requests the chunks that failed.
+    Default None, which downloads the whole range with one request.
+    :param workers: The number of chunks to download at once.  Default 4.
+    :param retries: The number of times to retry a failed request, waiting 1, 2, 4... seconds in between.  Default 3.
+    :param compression: 'gzip' or 'xz' to store the file compressed, which typically makes it around 10 times
+    smaller.  The matching suffix ('.gz' or '.xz') is appended to download_dest unless it already ends with it.  The
+    parsers decompress such files transparently (see open_data_file()).  Default None, which stores plain text.
+    :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+    :returns: The path to the downloaded file, including the file name.  The file is only created once the download
+    has succeeded, so it is never left partially written.
+    :raises ValueError: If compression is not one of the supported formats.
     """
     if end is None:
         end = start
+    suffix = compression_suffix(compression) if compression is not None else None
 
-    # Create a string that represents the protocol part of the query.
-    protocol_string = "".join(["protocols={}&".format(protocol) for protocol in protocols])
     # Create the full download link.
-    download_src = "https://api.globe.gov/search/v1/measurement/protocol/measureddate/?{}startdate={}&enddate={" \
-                   "}&geojson=TRUE&sample=FALSE "
-    download_src = download_src.format(protocol_string, start.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d"))
+    download_src = api_query_url(protocols, start, end, base_url)
 
     # Replace % indicators in the destination string with their respective variable values.
     download_dest = download_dest.replace("%P", "__".join(protocols))
     download_dest = download_dest.replace("%S", start.strftime("%Y%m%d"))
     download_dest = download_dest.replace("%E", end.strftime("%Y%m%d"))
+    if suffix is not None and not download_dest.endswith(suffix):
+        download_dest += suffix
 
     # Check if file already exists at the destination.  If a file by the target name already exists, skip download.
     if check_existing:
@@ -83,11 +355,12 @@ def download_from_api(protocols: List[str], start: Union[date, datetime], end: O
     # Try to download from the API.
     try:
         print("--  Downloading from API...")
-        print("--  {}".format(download_src))
-        # Open the target URL, open the local file, and copy.
-        with closing(urlopen(download_src)) as r:
-            with open(download_dest, 'wb') as f:
-                copyfileobj(r, f)
+        if chunk_months is None:
+            print("--  {}".format(download_src))
+            fetch(download_src, download_dest, retries, compression=compression)
+        else:
+            _download_chunks(protocols, start, end, download_dest, base_url, chunk_months, workers, retries, tqdm,
+                             compression)
         print("--  Download successful.  Saved to:")
         print("--  {}".format(download_dest))
     # In the event of a failure, print the error.
@@ -98,32 +371,292 @@ def download_from_api(protocols: List[str], start: Union[date, datetime], end: O
     return download_dest
 
 
-def parse_json(fp: str, tqdm=tqdm) -> List[Observation]:
+def _month_chunks(start: date, end: date, months: int) -> List[Tuple[date, date]]:
     """
-    Parses a JSON file and returns its features converted to observations.
-    :param fp: The path to the JSON file.
+    Splits a range of days at calendar month boundaries.
+    :param start: The first day of the range.
+    :param end: The last day of the range.
+    :param months: The number of months in each chunk.
+    :return: The first and last day of each chunk, in order.  The first and last chunks may be partial months.
+    """
+    chunks = []
+    while start <= end:
+        index = start.year * 12 + start.month - 1 + months
+        following = date(index // 12, index % 12 + 1, 1)
+        chunks.append((start, min(end, following - timedelta(1))))
+        start = following
+    return chunks
+
+
+def _download_chunks(protocols: List[str], start: Union[date, datetime], end: Union[date, datetime], dest: str,
+                     base_url: str, chunk_months: int, workers: int, retries: int, tqdm=tqdm,
+                     compression: Optional[str] = None):
+    """
+    Downloads a range in chunks of months with a pool of threads, then merges the chunks into one GeoJSON file.  See
+    download_from_api() for a description of the parameters.  The chunks themselves are never compressed, since they
+    are deleted once merged.
+    :raises IOError: If any chunk could not be downloaded.  The chunks that were downloaded are kept for next time.
+    """
+    if isinstance(start, datetime):
+        start = start.date()
+    if isinstance(end, datetime):
+        end = end.date()
+    chunks = _month_chunks(start, end, chunk_months)
+    folder = dest + ".chunks"
+    os.makedirs(folder, exist_ok=True)
+    paths = [join(folder, "{}_{}.json".format(s.strftime("%Y%m%d"), e.strftime("%Y%m%d"))) for s, e in chunks]
+
+    def fetch_chunk(k: int) -> Optional[Exception]:
+        if isfile(paths[k]):
+            return None
+        try:
+            fetch(api_query_url(protocols, chunks[k][0], chunks[k][1], base_url), paths[k], retries)
+        except Exception as e:
+            return e
+
+    print("--  Downloading {} chunks with {} threads...".format(len(chunks), workers))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        errors = list(tqdm(executor.map(fetch_chunk, range(len(chunks))), total=len(chunks), desc="Downloading chunks"))
+
+    failed = [(chunks[k], e) for k, e in enumerate(errors) if e is not None]
+    for (s, e), error in failed:
+        print("(x) Chunk {} to {} failed: {}".format(s, e, error))
+    if len(failed) > 0:
+        raise IOError("{} of {} chunks could not be downloaded.".format(len(failed), len(chunks)))
+
+    # Merge the chunks one feature at a time, so no chunk has to be held in memory.
+    temporary = "{}.tmp{}".format(dest, os.getpid())
+    written = 0
+    with open_for_writing(temporary, compression, "wt", encoding="utf8") as out:
+        out.write('{"type": "FeatureCollection", "features": [')
+        for path in paths:
+            with open(path, "rb") as f:
+                for feature in GeoJSONStream(f, detect_encoding(f)).features():
+                    out.write(",\n" if written > 0 else "\n")
+                    out.write(json.dumps(feature, ensure_ascii=False))
+                    written += 1
+        out.write("\n]}\n")
+    os.replace(temporary, dest)
+    rmtree(folder, ignore_errors=True)
+
+
+def parse_json(fp: str, tqdm=tqdm, as_table: bool = False, cache: Union[bool, str] = False, workers: int = 1,
+               columns: Optional[Iterable[str]] = None,
+               where: Optional[IngestFilter] = None) -> Union[List[Observation], ObservationTable]:
+    """
+    Parses a JSON file and returns its features converted to observations.  The file is read incrementally (see
+    iter_json()), so the raw text and the decoded document are never held in memory in full.
+    :param fp: The path to the JSON file, which may be gzip- or xz-compressed (see open_data_file()).
+    :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+    :param as_table: Whether to return the observations as a columnar ObservationTable instead of a list.  Default
+    False.
+    :param cache: Whether to keep a binary snapshot of the parsed file (see globeqa.cache) and load from it on later
+    calls.  May also be the path of the cache directory to use.  Loading is fastest with as_table=True.  Default False.
+    :param workers: The number of processes to parse with.  If more than 1, the 'features' array is split into byte
+    ranges that are parsed in parallel into table columns; the result is identical to parsing serially.  This benefits
+    as_table=True the most, since a list requires every record to be decoded again in this process.  Compressed files
+    are always parsed serially.  Default 1.
+    :param columns: The keys and/or Observation properties to keep (see Observation.resolve_keys()); every other key
+    is dropped as the file is parsed.  For example, ["measured_dt", "tcc", "lat", "lon", "DataSource"].  The typed
+    columns of a table are always filled in.  Default None, which keeps every key.
+    :param where: Predicates that each feature must pass to be parsed (see globeqa.ingest.IngestFilter).  They are
+    evaluated on the decoded feature before an Observation is created for it.  The number of features dropped by each
+    predicate is added to the filter's counters and printed.  Default None, which parses every feature.
     :returns: The features of the JSON.
     """
+    keep = Observation.resolve_keys(columns) if columns is not None else None
+
+    def build() -> ObservationTable:
+        table = None
+        if workers > 1:
+            print("--  Reading JSON from {} with {} workers...".format(fp, workers))
+            table = _parse_json_parallel(fp, workers, keep, tqdm=tqdm, where=where)
+            if table is None:
+                print("--  The file could not be split; parsing serially instead.")
+        if table is None:
+            table = ObservationTable.from_observations(iter_json(fp, tqdm=tqdm, where=where), tqdm=_untracked,
+                                                       keep=keep)
+        if where is not None:
+            where.report()
+        return table
+
+    if cache:
+        return _parse_cached(fp, _variant("json", keep, where), cache, as_table, build)
+    if as_table or workers > 1:
+        table = build()
+        return table if as_table else table.observations
+    obs = list(iter_json(fp, tqdm=tqdm, columns=columns, where=where))
+    if where is not None:
+        where.report()
+    return obs
+
+
+def iter_json(fp: str, tqdm=tqdm, columns: Optional[Iterable[str]] = None,
+              where: Optional[IngestFilter] = None) -> Iterator[Observation]:
+    """
+    Lazily parses a GeoJSON file, yielding one observation per feature as the 'features' array is walked.  Only one
+    feature is decoded at a time, so peak memory grows with the size of a single feature rather than the whole file.
+    :param fp: The path to the JSON file, which may be gzip- or xz-compressed.  It is decompressed as it is read.
+    :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+    :param columns: The keys and/or Observation properties to keep; see parse_json().  Default None, which keeps every
+    key.
+    :param where: Predicates that each feature must pass to be yielded; see parse_json().  Unlike parse_json(), the
+    filter's counters are not printed.  Default None, which yields every feature.
+    :return: A generator of observations, in file order.
+    """
+    keep = Observation.resolve_keys(columns) if columns is not None else None
     print("--  Reading JSON from {}...".format(fp))
+    with open_data_file(fp) as f:
+        stream = GeoJSONStream(f, detect_encoding(f))
+        for feature in tqdm(stream.features(), desc="Parsing JSON as observations"):
+            if where is not None and not where.accept_feature(feature):
+                continue
+            ob = Observation(feature=feature)
+            if keep is not None:
+                ob.keep_only(keep)
+            yield ob
+
+
+# Matches the boundary between two objects in an array.  Used to guess where to split the 'features' array.
+_feature_boundary = re.compile(rb"\}\s*,\s*\{")
+
+
+def _parse_json_parallel(fp: str, workers: int, keep: Optional[FrozenSet[str]], tqdm=tqdm,
+                         where: Optional[IngestFilter] = None) -> Optional[ObservationTable]:
+    """
+    Parses a GeoJSON file into a table using a pool of worker processes.  The 'features' array is split into byte
+    ranges that begin at feature boundaries, each range is parsed by a worker into a partial table, and the partial
+    tables are concatenated in order.
+    Boundaries are found by searching for the text between two objects, which could in principle also appear inside a
+    string.  Every shard therefore reports where it actually stopped reading, and if the shards do not line up exactly,
+    None is returned so that the caller can fall back to parsing serially.
+    :param fp: The path to the JSON file.
+    :param workers: The number of worker processes.
+    :param keep: The keys to keep, or None to keep every key.
+    :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+    :param where: The filter that features must pass, or None to parse every feature.  Its counters are only updated
+    if the file is parsed successfully.  Default None.
+    :return: The table, or None if the file could not be split reliably (or is compressed).
+    """
+    if compression_of(fp) is not None:
+        return None
+    with open(fp, "rb") as f:
+        encoding = codecs.lookup(detect_encoding(f)).name
+        if encoding not in ["utf-8", "utf-8-sig"]:
+            return None
+        stream = GeoJSONStream(f, encoding, track_offsets=True)
+        if not stream.open_features() or stream._peek() in ["", "]"]:
+            return None
+        first = stream.offset
+
+        # Four shards per worker keeps the workers evenly loaded when features vary in size.
+        size = getsize(fp)
+        starts = [first]
+        shard_count = workers * 4
+        for k in range(1, shard_count):
+            f.seek(first + (size - first) * k // shard_count)
+            window = f.read(1 << 16)
+            match = _feature_boundary.search(window)
+            if match is not None:
+                start = f.tell() - len(window) + match.end() - 1
+                if start > starts[-1]:
+                    starts.append(start)
+
+    shards = [(fp, starts[k], starts[k + 1] if k + 1 < len(starts) else None, keep, where)
+              for k in range(len(starts))]
+    tables, counts = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for table, stop, seen, dropped in tqdm(executor.map(_parse_json_shard, *zip(*shards)), total=len(shards),
+                                               desc="Parsing JSON shards"):
+            tables.append(table)
+            counts.append((dropped, seen))
+            if table is None or stop != shards[len(tables) - 1][2]:
+                return None
+
+    if where is not None:
+        for dropped, seen in counts:
+            where.merge(dropped, seen)
+    return ObservationTable.concat(tables)
+
+
+def _parse_json_shard(fp: str, start: int, stop: Optional[int], keep: Optional[FrozenSet[str]],
+                      where: Optional[IngestFilter]) -> Tuple[Optional[ObservationTable], Optional[int], int,
+                                                              Dict[str, int]]:
+    """
+    Parses the features that begin within a byte range of a GeoJSON file.  This runs in a worker process.
+    :param fp: The path to the JSON file.
+    :param start: The byte offset of the first feature in the range.
+    :param stop: The byte offset that the range ends at, or None to read to the end of the 'features' array.
+    :param keep: The keys to keep, or None to keep every key.
+    :param where: The filter that features must pass, or None to parse every feature.
+    :return: The partial table with its records packed (or None if the range could not be parsed), the byte offset
+    at which reading stopped (None if the end of the array was reached), the number of features the filter examined,
+    and the number it dropped by each predicate.
+    """
+    if where is not None:
+        # This is a copy of the caller's filter; its counts are returned so that the caller can add them up.
+        where.reset()
     try:
-        with open(fp, "r") as f:
-            g = f.read()
-            print("--  Interpreting file as JSON...")
-            raw = json.loads(g)
-    except UnicodeDecodeError:
-        with open(fp, "r", encoding="utf8") as f:
-            g = f.read()
-            print("--  Interpreting file as JSON...")
-            raw = json.loads(g)
-
-    ret = []
-    for o in tqdm(range(len(raw["features"])), desc="Parsing JSON as observations"):
-        ob = raw["features"][o]
-        ret.append(Observation(feature=ob))
-    return ret
+        with open(fp, "rb") as f:
+            f.seek(start)
+            stream = GeoJSONStream(f, "utf-8", track_offsets=True)
+            obs = (Observation(feature=feature) for feature in stream.items(stop)
+                   if where is None or where.accept_feature(feature))
+            table = ObservationTable.from_observations(obs, tqdm=_untracked, pack=True, keep=keep)
+            if where is None:
+                return table, stream.stopped_at, 0, {}
+            return table, stream.stopped_at, where.seen, where.dropped
+    except (ValueError, KeyError, TypeError, IndexError):
+        return None, None, 0, {}
+
+
+def get_flag_masks(obs: Union[Iterable[Observation], ObservationTable]) -> np.ndarray:
+    """
+    :param obs: The observations.
+    :return: The flags raised on each observation, as a uint64 array of bitmasks (see Observation.flag_bit()).
+    """
+    if isinstance(obs, ObservationTable):
+        return obs.flag_masks
+    return np.fromiter((ob.flag_mask for ob in obs), dtype=np.uint64)
+
+
+def get_cloud_type_masks(obs: Union[Iterable[Observation], ObservationTable]) -> np.ndarray:
+    """
+    :param obs: The observations.
+    :return: The cloud types reported in each observation, as a uint16 array of bitmasks (see
+    Observation.cloud_type_mask).  Use categories.popcount(), bit_counts() and co_occurrence() to count them.
+    """
+    return _get_masks(obs, "cloud_type_mask", np.uint16)
+
+
+def get_obscuration_masks(obs: Union[Iterable[Observation], ObservationTable]) -> np.ndarray:
+    """
+    :param obs: The observations.
+    :return: The obscurations reported in each observation, as a uint16 array of bitmasks (see
+    Observation.obscuration_mask).
+    """
+    return _get_masks(obs, "obscuration_mask", np.uint16)
 
-    # Although this works and may be more efficient, I'm not sure how to make it work with tqdm...
-    # return [Observation(feature=ob) for ob in raw["features"]]
+
+def get_photo_masks(obs: Union[Iterable[Observation], ObservationTable]) -> np.ndarray:
+    """
+    :param obs: The observations.
+    :return: The directions that have a photo in each observation, as a uint8 array of bitmasks (see
+    Observation.photo_mask).
+    """
+    return _get_masks(obs, "photo_mask", np.uint8)
+
+
+def _get_masks(obs: Union[Iterable[Observation], ObservationTable], name: str, dtype) -> np.ndarray:
+    """
+    :param obs: The observations.
+    :param name: The name of the bitmask property, which is also the name of the table column that holds it.
+    :param dtype: The dtype of the bitmasks.
+    :return: The bitmask of each observation.  A table's column is returned as it is, without building observations.
+    """
+    if isinstance(obs, ObservationTable):
+        return obs[name]
+    return np.fromiter((getattr(ob, name) for ob in obs), dtype=dtype)
 
 
 def get_flag_counts(obs: List[Observation]) -> Dict[str, int]:
@@ -132,17 +665,10 @@ def get_flag_counts(obs: List[Observation]) -> Dict[str, int]:
     :param obs: The observations to analyze.
     :return: The dictionary of (flag, count) pairs for each flag found at least once.
     """
-    flag_counts = dict()
     print("--  Enumerating flags...")
     # tqdm not used here because this is a surprisingly fast process.
-    for ob in obs:
-        for flag in ob.flags:
-            try:
-                flag_counts[flag] += 1
-            except KeyError:
-                flag_counts[flag] = 1
-
-    return flag_counts
+    counts = categories.bit_counts(get_flag_masks(obs), 64)
+    return {Observation.decode_flags(1 << i)[0]: int(counts[i]) for i in np.flatnonzero(counts)}
 
 
 def filter_by_flag(obs: List[Observation], specs: Union[bool, Dict[str, bool]] = True, tqdm=tqdm) -> List[Observation]:
@@ -158,20 +684,14 @@ def filter_by_flag(obs: List[Observation], specs: Union[bool, Dict[str, bool]] =
     :return: The filtered observations.
     :raises TypeError: If specs is neither a string or a dict of string=bool pairs.
     """
-    # If specs is a dict...
+    # If specs is a dict, every flag mapped to True must be present and every flag mapped to False must be absent.
     if type(specs) == dict:
-        ret = []
-        # For each observation...
-        for ob in tqdm(obs, desc="Filtering observations by flag"):
-            # For each specification k=v, k is the flag and v is whether it must be present or absent.
-            for k, v in specs.items():
-                # If the flag is present or absent as required, add this ob to the list.
-                if ob.has_flag(k) == v:
-                    ret.append(ob)
-        return ret
+        return filter_by_flag_sets(obs, all_of=[k for k, v in specs.items() if v],
+                                   none_of=[k for k, v in specs.items() if not v])
     # If specs is a bool, just return those obs which have or do not have flags.
     elif type(specs) == bool:
-        return [ob for ob in obs if ob.flagged == specs]
+        masks = get_flag_masks(obs)
+        return [obs[i] for i in np.flatnonzero((masks != 0) == specs)]
     # If not a dict or bool, raise an error.
     else:
         raise TypeError("Argument 'specs' must be either Dict[str, bool] or bool.")
@@ -190,20 +710,26 @@ def filter_by_flag_sets(obs: List[Observation], all_of: Iterable[str] = (), none
     all observations.  Passing only one flag to any_of has the same effect as instead appending that flag to all_of.
     :return: An iterable of obs that have been filtered.
     """
-    # Store only those obs which have at least one flag from any_of - that is, the intersection of actual flags and
-    # required flags has at least one item.
-    # Note that we must skip this check of any_of is empty - otherwise, nothing passes.
-    ret = [ob for ob in obs if len(set(ob.flags) & set(any_of)) > 0] if any_of else [ob for ob in obs]
+    all_of = set(all_of)
+    all_mask = Observation.flag_mask_of(all_of)
+    # A flag that has never been raised has no bit, and no observation can have it.
+    if bin(all_mask).count("1") < len(all_of):
+        return []
 
-    # Store only those obs which have all of the all_of flags - that is, the actual flags is a (not necessarily proper)
-    # superset of the required flags.
-    ret = [ob for ob in ret if set(ob.flags) >= set(all_of)]
+    any_of = set(any_of)
+    masks = get_flag_masks(obs)
+    all_mask = np.uint64(all_mask)
+    none_mask = np.uint64(Observation.flag_mask_of(none_of))
+    any_mask = np.uint64(Observation.flag_mask_of(any_of))
 
-    # Store only those obs which have none of the none_of flags - that is, the intersection of actual flags and required
-    # flags is empty.
-    ret = [ob for ob in ret if len(set(ob.flags) & set(none_of)) == 0]
+    # Every all_of flag must be present, and no none_of flag may be.
+    passed = ((masks & all_mask) == all_mask) & ((masks & none_mask) == 0)
+    # At least one any_of flag must be present.  Note that we must skip this check if any_of is empty - otherwise,
+    # nothing passes.  If none of its flags has a bit, any_mask is 0 and nothing passes, as it should.
+    if any_of:
+        passed &= (masks & any_mask) != 0
 
-    return ret
+    return [obs[i] for i in np.flatnonzero(passed)]
 
 
 def get_cdf_datetime(cdf: Dataset, index: int) -> datetime:
@@ -266,13 +792,20 @@ def find_closest_gridbox(cdf: Dataset, t: datetime, lat: float, lon: float) -> T
     return int(time_index), int(lat_index), int(lon_index)
 
 
-def prepare_earth_geometry(geometry_resolution: str = "50m"):
+def prepare_earth_geometry(geometry_resolution: str = "50m", shapefile: Optional[str] = None,
+                           cache: Union[bool, str] = True):
     """
     Preparations necessary for determining whether a point is over land or water.
     This code may need to download a ZIP containing Earth geometry data the first time it runs.
     Code borrowed from   https://stackoverflow.com/a/48062502
+    The merged geometry is kept in the snapshot cache, and the prepared geometry is kept for the rest of the process,
+    so only the first call for a resolution is slow (see globeqa.land.prepared_land()).
     :param geometry_resolution: The resolution of the NaturalEarth shapereader to use.  Valid values are '10m', '50m'
     or '110m'.  Default '50m'.
+    :param shapefile: The path to a local land shapefile to use instead of NaturalEarth's, such as when there is no
+    network access.  Default None.
+    :param cache: Whether to load and save the merged geometry in the cache.  May also be the path of the cache
+    directory to use.  Default True.
     :return: The PreparedGeometry object that can be used for point-land checking.
     :raises ValueError: If geometry_resolution is not '10m', '50m', or '110m'.
     """
@@ -280,22 +813,181 @@ def prepare_earth_geometry(geometry_resolution: str = "50m"):
         raise ValueError("Argument 'geometry_resolution' must be either '10m', '50m', or '110m'.")
 
     print("--  Preparing Earth geometry...")
-    land_shp_fname = shpreader.natural_earth(resolution=geometry_resolution, category='physical', name='land')
-    land_geom = unary_union(list(shpreader.Reader(land_shp_fname).geometries()))
-    land = prep(land_geom)
+    land = prepared_land(geometry_resolution, shapefile, cache)
     print("--  Earth geometry prepared.")
     return land
 
 
-def do_quality_check(obs: List[Observation], land=None, tqdm=tqdm):
+def prepare_land_mask(geometry_resolution: str = "50m", cells_per_degree: int = 60, shapefile: Optional[str] = None,
+                      cache: Union[bool, str] = True, tqdm=tqdm) -> LandMask:
     """
-    Perform quality checks on the observations.
-    :param obs: The observations.
-    :param land: The PreparedGeometry for land checking.  If None, land check will not be performed.
+    Prepares a raster land mask, which do_quality_check() uses to decide whether many points are over land at once.
+    The results are identical to those of prepare_earth_geometry(); only points near a coastline are checked against
+    the exact geometry.  The mask is built the first time and then loaded from the cache (see globeqa.land.LandMask).
+    :param geometry_resolution: The resolution of the NaturalEarth shapereader to use.  Valid values are '10m', '50m'
+    or '110m'.  Default '50m'.
+    :param cells_per_degree: The number of cells of the mask per degree.  Default 60 (cells of one arcminute).
+    :param shapefile: The path to a local land shapefile to use instead of NaturalEarth's.  Default None.
+    :param cache: Whether to load and save the mask in the cache.  May also be the path of the cache directory to use.
+    Default True.
     :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+    :return: The LandMask, which can be passed as the land argument of do_quality_check().
+    :raises ValueError: If geometry_resolution is not '10m', '50m', or '110m'.
+    """
+    if geometry_resolution not in ["10m", "50m", "110m"]:
+        raise ValueError("Argument 'geometry_resolution' must be either '10m', '50m', or '110m'.")
+
+    print("--  Preparing land mask...")
+    mask = LandMask.open(geometry_resolution, shapefile, cells_per_degree, cache, tqdm=tqdm)
+    print("--  Land mask prepared.")
+    return mask
+
+
+def do_quality_check(obs: Union[List[Observation], ObservationTable], land=None, tqdm=tqdm, workers: int = 1,
+                     store: Optional[FlagStore] = None):
+    """
+    Perform quality checks on the observations, by evaluating the rules in globeqa.rules over all of them at once.
+    :param obs: The observations, as a list or an ObservationTable.  A list is first built into a table.
+    :param land: The PreparedGeometry or LandMask for land checking (see prepare_earth_geometry() and
+    prepare_land_mask()).  With a LandMask, every location is looked up at once.  If None, land check will not be
+    performed.
+    :param tqdm: The wrapper around for-loops in this function.  Default tqdm, which will print a progress bar.
+    :param workers: The number of processes to check with.  If more than 1, the observations are split into chunks that
+    are checked by a pool of worker processes, and the flags they raise are copied back in order, so the result is the
+    same as checking in this process.  Each worker gets land once, when it starts: forked workers inherit it, and other
+    workers load it from the cache.  Default 1.
+    :param store: The store of flags raised before (see globeqa.flagstore).  If given, only observations that are not
+    in the store, have changed, or were checked under another rule set (other checks or other land) are checked, and the
+    flags of the rest are loaded from the store.  The flags of the observations checked are saved, unless they include
+    a flag that depends on the time of the check (DF).  Default None.
+    :raises ValueError: If workers is more than 1, the workers are not forked, and land was not made by
+    prepare_earth_geometry() or prepare_land_mask(), so they cannot load it; or if a store is given, and land was not
+    made by either.
+    """
+    if store is not None:
+        _do_quality_check_stored(obs, land, store, workers, tqdm=tqdm)
+        return
+    _raise_flag_masks(obs, _quality_masks(obs, land, workers, tqdm=tqdm))
+
+
+def _raise_flag_masks(obs: Union[List[Observation], ObservationTable], masks: np.ndarray):
+    """
+    Raises flags on observations.  A table takes them all at once (see ObservationTable.raise_flag_masks()), so no
+    Observation views are created.
+    :param obs: The observations, as a list or an ObservationTable.
+    :param masks: The bitmask of the flags to raise on each observation (see Observation.flag_bit()).
+    """
+    if isinstance(obs, ObservationTable):
+        obs.raise_flag_masks(masks)
+    else:
+        for ob, mask in zip(obs, masks.tolist()):
+            ob.raise_flag_mask(mask)
+
+
+def _quality_masks(obs: Union[List[Observation], ObservationTable], land, workers: int, tqdm=tqdm) -> np.ndarray:
+    """
+    Evaluates the quality-check rules on the observations, without raising any flags on them.  See do_quality_check()
+    for a description of the parameters.
+    :return: The bitmask of the flags that the rules raise on each observation, as a uint64 array (see
+    Observation.flag_bit()).
     """
-    for o in tqdm(range(len(obs)), desc="Performing quality check"):
-        obs[o].check_for_flags(land)
+    if workers > 1 and len(obs) > 1:
+        return _quality_masks_parallel(obs, land, workers, tqdm=tqdm)
+    if isinstance(obs, ObservationTable):
+        return rules.evaluate(obs, land)
+    return rules.evaluate_observations(obs, land, tqdm=tqdm)
+
+
+def _do_quality_check_stored(obs: Union[List[Observation], ObservationTable], land, store: FlagStore, workers: int,
+                             tqdm=tqdm):
+    """
+    Performs quality checks on the observations that the store does not have current flags for, and loads the flags of
+    the rest.  See do_quality_check() for a description of the parameters.
+    """
+    rule_set = flagstore.rule_set(land)
+    ids = [ob.id for ob in obs]
+    hashes = [flagstore.record_hash(ob) for ob in obs]
+    known = store.lookup(ids, rule_set)
+
+    loaded = np.zeros(len(obs), dtype=np.uint64)
+    stale = []
+    for o in range(len(obs)):
+        hit = known.get(ids[o])
+        if hit is not None and hit[1] == hashes[o]:
+            loaded[o] = hit[0]
+        else:
+            stale.append(o)
+    print("--  Loaded flags of {} observations from the flag store; checking {}.".format(len(obs) - len(stale),
+                                                                                       len(stale)))
+
+    if isinstance(obs, ObservationTable):
+        masks = _quality_masks(obs.take(np.array(stale, dtype=np.intp)), land, workers, tqdm=tqdm)
+    else:
+        masks = _quality_masks([obs[o] for o in stale], land, workers, tqdm=tqdm)
+    loaded[stale] = masks
+    _raise_flag_masks(obs, loaded)
+    # Flags that depend on the time of the check may clear later, so observations that have them are not stored.
+    volatile = rules.volatile_mask()
+    store.save(((ids[o], mask, hashes[o]) for o, mask in zip(stale, masks.tolist())
+                if ids[o] is not None and not mask & volatile), rule_set)
+
+
+# The land used by the quality-check worker processes.  _quality_masks_parallel() sets it before starting its pool, so
+# that forked workers inherit it; other workers load it in _init_quality_worker().
+_quality_land = None
+
+
+def _quality_masks_parallel(obs: Union[List[Observation], ObservationTable], land, workers: int,
+                            tqdm=tqdm) -> np.ndarray:
+    """
+    Evaluates the quality-check rules on the observations using a pool of worker processes.  See do_quality_check() for
+    a description of the parameters.
+    :return: The bitmask of the flags that the rules raise on each observation, in order, as a uint64 array.
+    """
+    global _quality_land
+    forked = multiprocessing.get_start_method() == "fork"
+    source = land_source(land)
+    if land is not None and source is None and not forked:
+        raise ValueError("The land geometry cannot be loaded by worker processes; use prepare_earth_geometry() or "
+                         "prepare_land_mask() to make it.")
+
+    # Four chunks per worker keeps the workers evenly loaded.  A chunk of a table is itself a table.
+    chunk_size = -(-len(obs) // (workers * 4))
+    starts = range(0, len(obs), chunk_size)
+    chunks = (obs[start:start + chunk_size] for start in starts)
+
+    masks = []
+    _quality_land = land
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_quality_worker,
+                                 initargs=(None if forked else source,)) as executor:
+            for chunk_masks in tqdm(executor.map(_check_chunk, chunks), total=len(starts),
+                                    desc="Performing quality check"):
+                masks.append(chunk_masks)
+    finally:
+        _quality_land = None
+    return np.concatenate(masks)
+
+
+def _init_quality_worker(source: Optional[Tuple]):
+    """
+    Loads the land for a quality-check worker process, unless it was inherited.
+    :param source: Where the land came from (see globeqa.land.land_source()), or None if it was inherited or there is
+    no land.
+    """
+    global _quality_land
+    if source is not None:
+        _quality_land = open_land_source(source)
+
+
+def _check_chunk(chunk: Union[List[Observation], ObservationTable]) -> np.ndarray:
+    """
+    Evaluates the quality-check rules on a chunk of observations.  This runs in a worker process.
+    :param chunk: Copies of the observations.
+    :return: The bitmask of the flags that the rules raise on each observation (see Observation.flag_bit()).  Rules
+    only raise flags in Observation._flag_definitions, whose bits are the same in every process.
+    """
+    return _quality_masks(chunk, _quality_land, 1, tqdm=_untracked)
 
 
 def find_all_values(obs: List[Observation], attribute: str, tqdm=tqdm) -> Dict[str, int]:
@@ -468,24 +1160,43 @@ def bin_cloud_fraction(fraction: float, clip: bool = False) -> str:
     elif not (0.0 <= fraction <= 1.0):
         raise ValueError("Argument 'fraction' must be between 0.0 and 1.0 (inclusive).")
 
-    bins = dict(none=0.00,
-                few=0.10,
-                isolated=0.25,
-                scattered=0.50,
-                broken=0.90,
-                overcast=1.00)
+    return categories.bin_cloud_fraction(fraction)
+
+
+def get_measured_datetimes(obs: Union[Sequence[Observation], ObservationTable], flag: bool = True) -> np.ndarray:
+    """
+    Decodes the measurement datetimes of many observations at once (see globeqa.table.parse_datetimes()).  This is
+    much faster than reading measured_dt from each observation.
+    :param obs: The observations.  If an ObservationTable, its measured column is returned as is.
+    :param flag: Whether to raise flag DX on the observations whose datetime is missing and DI on those whose datetime
+    is invalid, as measured_dt would.  Default True.
+    :return: The datetimes, as datetime64[s], with NaT where the datetime is missing or invalid.
+    """
+    if isinstance(obs, ObservationTable):
+        return obs["measured"]
+    strings = [ob.measured_string for ob in obs]
+    measured = parse_datetimes(strings)
+    if flag:
+        for i in np.flatnonzero(np.isnat(measured)):
+            obs[i].flag("DX" if strings[i] is None else "DI")
+    return measured
+
 
-    for k, v in bins.items():
-        if fraction <= v:
-            return k
+def _hours_of(measured: np.ndarray) -> np.ndarray:
+    """
+    :param measured: Datetimes, as datetime64[s].
+    :return: The hour of each datetime (meaningless where it is NaT).
+    """
+    return (measured - measured.astype("datetime64[D]")).astype("timedelta64[h]").astype(np.int64)
 
 
-def filter_by_datetime(obs: List[Observation], earliest: Optional[datetime] = datetime.min,
+def filter_by_datetime(obs: Union[List[Observation], ObservationTable], earliest: Optional[datetime] = datetime.min,
                        latest: Optional[datetime] = datetime.max, assume_chronology: bool = False,
-                       tqdm=tqdm) -> List[Observation]:
+                       tqdm=tqdm) -> Union[List[Observation], ObservationTable]:
     """
     Filters a list of observations to a certain datetime range, assuming chronology of the observations.
-    :param obs: The observations.
+    :param obs: The observations.  If an ObservationTable, a table is returned.  Either way, the datetimes are
+    decoded in bulk (see get_measured_datetimes()).
     :param earliest: The earliest datetime that an observation may have to pass the filter.  Default datetime.min, which
     filters out no observations.
     :param latest: The earliest datetime that an observation may have to NOT pass the filter - that is, observations
@@ -502,6 +1213,9 @@ def filter_by_datetime(obs: List[Observation], earliest: Optional[datetime] = da
     elif earliest is None and latest is None:
         return obs
 
+    if isinstance(obs, ObservationTable):
+        return obs.filter(obs.between(earliest, latest))
+
     if assume_chronology:
         first_acceptable_index = 0
         if earliest is not None:
@@ -520,32 +1234,40 @@ def filter_by_datetime(obs: List[Observation], earliest: Optional[datetime] = da
         return obs[first_acceptable_index:last_acceptable_index]
 
     else:
-        ret = []
-        for ob in tqdm(obs, desc="Filtering observations by datetime"):
-            if earliest <= ob.measured_dt < latest:
-                ret.append(ob)
-
-        return ret
+        mask = datetimes_between(get_measured_datetimes(obs), earliest, latest)
+        return [obs[i] for i in np.flatnonzero(mask)]
 
 
-def filter_by_hour(obs: List[Observation], hours: List[int]) -> List[Observation]:
+def filter_by_hour(obs: Union[List[Observation], ObservationTable],
+                   hours: List[int]) -> Union[List[Observation], ObservationTable]:
     """
     Filters a list of observations by the hour of measurement.
-    :param obs: The observations.
+    :param obs: The observations.  If an ObservationTable, a table is returned.  Either way, the datetimes are
+    decoded in bulk (see get_measured_datetimes()).
     :param hours: The hours that shall pass the filter.
     :return: The observations that passed the filter.
     """
-    return [ob for ob in obs if ob.measured_dt.hour in hours]
+    measured = get_measured_datetimes(obs)
+    mask = ~np.isnat(measured) & np.isin(_hours_of(measured), hours)
+    if isinstance(obs, ObservationTable):
+        return obs.filter(mask)
+    return [obs[i] for i in np.flatnonzero(mask)]
+
+
+# The protocols that process_one_day() downloads.
+DAILY_PROTOCOLS = ["sky_conditions", "land_covers", "mosquito_habitat_mapper", "tree_heights"]
 
 
 def process_one_day(download_folder: str = "", download_file: str = "SC_LC_MHM_TH__%S.json",
-                    day: Optional[Union[date, datetime]] = None):
+                    day: Optional[Union[date, datetime]] = None, flag_store: Optional[str] = None):
     """
     Downloads, parses, and quality-checks one day's observations.
     :param download_folder: The folder to download the JSON file to.  Default "" (current working directory).
     :param download_file: The name that the JSON file should have.  Certain % codes are replaced; see
     download_from_api().  Default "SC_LC_MHM_TH__%S.json" (%S replaced by the date).
     :param day: The day to process.  Default None, which is treated as yesterday.
+    :param flag_store: The path of a flag store (see globeqa.flagstore) to keep the flags in, so that observations
+    checked by earlier runs are not checked again.  Default None, which checks every observation.
     :return: The list of observations.
     :raises ValueError: If the JSON file contains no observations.
     """
@@ -553,8 +1275,7 @@ def process_one_day(download_folder: str = "", download_file: str = "SC_LC_MHM_T
         day = date.today() - timedelta(1)
 
     # Download yesterday's GLOBE observations.
-    fp = download_from_api(["sky_conditions", "land_covers", "mosquito_habitat_mapper", "tree_heights"],
-                           day, download_dest=join(download_folder, download_file))
+    fp = download_from_api(DAILY_PROTOCOLS, day, download_dest=join(download_folder, download_file))
 
     # Open and parse that file.
     observations = parse_json(fp)
@@ -564,7 +1285,11 @@ def process_one_day(download_folder: str = "", download_file: str = "SC_LC_MHM_T
 
     # Perform quality checking.
     land = prepare_earth_geometry()
-    do_quality_check(observations, land)
+    if flag_store is None:
+        do_quality_check(observations, land)
+    else:
+        with FlagStore(flag_store) as store:
+            do_quality_check(observations, land, store=store)
 
     # Summarize flags.
     flag_summary = get_flag_counts(observations)
@@ -573,11 +1298,12 @@ def process_one_day(download_folder: str = "", download_file: str = "SC_LC_MHM_T
     return observations
 
 
-def filter_by_datetime_cdf(obs: List[Observation], cdf: Dataset, buffer: timedelta):
+def filter_by_datetime_cdf(obs: Union[List[Observation], ObservationTable], cdf: Dataset, buffer: timedelta):
     """
     Filters a list of observations, returning only those which lie within the time span of the CDF with the given
     buffer.
-    :param obs: A list of observations.
+    :param obs: A list of observations.  If an ObservationTable, a table is returned.  Either way, the datetimes are
+    decoded in bulk (see get_measured_datetimes()).
     :param cdf: A NetCDF4 Dataset.
     :param buffer: The amount of time on either side of the Dataset's begin and end time in which observation will still
     pass the filter.  For instance, if buffer is 30 minutes, then observations will pass if they are between
@@ -586,7 +1312,10 @@ def filter_by_datetime_cdf(obs: List[Observation], cdf: Dataset, buffer: timedel
     """
     earliest = get_cdf_datetime(cdf, 0) - buffer
     latest = get_cdf_datetime(cdf, -1) + buffer
-    return [ob for ob in obs if earliest <= ob.measured_dt < latest]
+    if isinstance(obs, ObservationTable):
+        return obs.filter(obs.between(earliest, latest))
+    mask = datetimes_between(get_measured_datetimes(obs), earliest, latest)
+    return [obs[i] for i in np.flatnonzero(mask)]
 
 
 def patch_obs(obs: List[Observation], fp: str, attribute: str, processor: Callable[[str], Any] = lambda v: v,
@@ -630,4 +1359,4 @@ def pretty_print_observation(ob: Observation, **kwargs):
     :param kwargs: kwargs are passed to pretty_print_dictionary().
     :return: None.  The properties of the observation are printed (see pretty_print_dictionary()).
     """
-    pretty_print_dictionary(ob._raw, False, False, **kwargs)
+    pretty_print_dictionary(ob.as_dict(), False, False, **kwargs)
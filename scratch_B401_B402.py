@@ -33,12 +33,12 @@ for cdf in [Dataset(fp_GEOS_Jan), Dataset(fp_GEOS_Jul)]:
     for ob in tqdm(obs, desc="Finding GEOS coincident output for all observations"):
         try:
             i = tools.find_closest_gridbox(cdf, ob.measured_dt, ob.lat, ob.lon)
-            ob.tcc_geos = float(cdf["CLDTOT"][i])
+            ob["tcc_geos"] = float(cdf["CLDTOT"][i])
         except IndexError:
             pass
 
     # Filter out any obs that do not have GEOS coincident output.
-    obs = [ob for ob in obs if "tcc_geos" in dir(ob)]
+    obs = [ob for ob in obs if "tcc_geos" in ob]
 
     lats = np.arange(-90., 90.1, latitude_bin_width)
 
@@ -50,7 +50,7 @@ for cdf in [Dataset(fp_GEOS_Jan), Dataset(fp_GEOS_Jul)]:
 
         # Construct lists used for scattering.
         y = [ob.lat for ob in sample]
-        geos = np.array([ob.tcc_geos for ob in sample])
+        geos = np.array([ob["tcc_geos"] for ob in sample])
         globe = np.array([category_to_midpoint[ob.tcc] for ob in sample])
         diff = globe - geos
 
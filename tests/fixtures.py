@@ -0,0 +1,182 @@
+"""
+Generated observations shared by the tests, and helpers to write them to files and to compare tables.
+"""
+
+from globeqa import tools
+from globeqa.observation import Observation
+from globeqa.table import ObservationTable
+import json
+import numpy as np
+import random
+import shapefile
+import unittest
+
+
+def quiet(iterable, *_, **__):
+    """
+    A stand-in for tqdm that prints nothing.
+    """
+    return iterable
+
+
+def features(n: int, seed: int = 0) -> list:
+    """
+    :param n: The number of features.
+    :param seed: The seed of the random choices.
+    :return: GeoJSON features of every checked protocol whose values are valid, missing, invalid, coded as missing or
+    out of range, in random combinations.
+    """
+    r = random.Random(seed)
+    result = []
+    for i in range(n):
+        protocol = r.choice(["sky_conditions", "tree_heights", "mosquito_habitat_mapper", "land_covers"])
+        prefix = protocol.replace("_", "")
+        properties = {"protocol": protocol, prefix + "ObservationId": str(i)}
+        if r.random() < .9:
+            properties[prefix + "MeasuredAt"] = r.choice([
+                "2019-06-0{}T{:02d}:{:02d}:00".format(r.randint(1, 9), r.randint(0, 23), r.choice([0, 0, 30])),
+                "1990-01-01T10:00:00", "2099-01-01T10:00:00", "garbage", "2019-13-45T00:00:00", ""])
+        lat = r.choice([r.uniform(-90, 90), 0., None, "abc", 95.])
+        lon = r.choice([r.uniform(-180, 180), 0., None, "x"])
+        if r.random() < .9:
+            properties["elevation"] = r.choice([r.uniform(-500, 7000), None, "high", "", 100.])
+        if protocol == "sky_conditions":
+            if r.random() < .9:
+                properties[prefix + "CloudCover"] = r.choice(["none", "clear", "few", "isolated", "scattered", "broken",
+                                                              "overcast", "obscured", "-99", "weird"])
+            for key in ["Cirrus", "Cumulus", "Stratus"]:
+                if r.random() < .3:
+                    properties[prefix + key] = r.choice(["true", "false"])
+            for key in ["Fog", "Haze", "Spray", "Dust"]:
+                if r.random() < .25:
+                    properties[prefix + key] = r.choice(["true", "true", "false"])
+            if r.random() < .5:
+                properties[prefix + "SkyClarity"] = r.choice(["extremely hazy", "clear", "somewhat hazy"])
+            for key in Observation._contrail_keys:
+                if r.random() < .3:
+                    properties[prefix + key] = r.choice(["0", "3", "15", "x", "", " "])
+        if protocol == "tree_heights" and r.random() < .9:
+            properties[prefix + "TreeHeightAvgM"] = r.choice(["12.5", "-99", "150", "tall", "-3", ""])
+        if protocol == "mosquito_habitat_mapper" and r.random() < .9:
+            properties[prefix + "LarvaeCount"] = r.choice(["5", "250", "1-25", "lots", "-1", "more than 100"])
+        result.append(dict(type="Feature", geometry=dict(type="Point", coordinates=[lon, lat]),
+                           properties=properties))
+    return result
+
+
+def write_geojson(fp: str, features: list):
+    """
+    Writes features to a GeoJSON file, as the API does.
+    :param fp: The path to the file.
+    :param features: The features.
+    """
+    with open(fp, "w", encoding="utf8") as f:
+        json.dump(dict(type="FeatureCollection", features=features), f)
+
+
+# The columns of the CSV files written by write_csv(), padded with spaces as in the satellite-match CSVs.
+_csv_columns = ["Observation Number", " Measurement Date (UTC)", "Measurement Time (UTC) ", "Observation Latitude",
+                "Observation Longitude", "Observation Elevation", "Total Cloud Cover", "Haze", "Spray", "Cirrus",
+                "SkyClarity", "ShortLivedContrails"]
+
+
+def write_csv(fp: str, features: list, encoding: str = "utf-8", newline: str = "\n"):
+    """
+    Writes the sky conditions features to a CSV file in the layout of the satellite-match CSVs.  Missing values are
+    left empty.
+    :param fp: The path to the file.
+    :param features: The features.
+    :param encoding: The text encoding of the file.  Default 'utf-8'.
+    :param newline: The line ending.  Default '\n'.
+    """
+    lines = [",".join(_csv_columns)]
+    for feature in features:
+        properties = feature["properties"]
+        if properties["protocol"] != "sky_conditions":
+            continue
+        value = {key[len("skyconditions"):]: v for key, v in properties.items() if key.startswith("skyconditions")}
+        date, _, time = value.get("MeasuredAt", "").partition("T")
+        lon, lat = feature["geometry"]["coordinates"]
+        row = [value["ObservationId"], date, time, lat, lon, properties.get("elevation"), value.get("CloudCover"),
+               value.get("Haze"), value.get("Spray"), value.get("Cirrus"), value.get("SkyClarity"),
+               value.get("ShortLivedContrails")]
+        lines.append(",".join("" if v is None else str(v) for v in row))
+    with open(fp, "w", encoding=encoding, newline="") as f:
+        f.write(newline.join(lines) + newline)
+
+
+def _ring(lon: float, lat: float, radius: float, points: int, clockwise: bool) -> list:
+    """
+    :return: A jagged ring of points around a centre, clockwise for an outer ring and anticlockwise for a hole, as
+    shapefiles require.
+    """
+    angles = np.linspace(0., 2 * np.pi, points, endpoint=False)
+    radii = radius * (1. + .3 * np.sin(5 * angles) + .1 * np.cos(13 * angles))
+    ring = [[lon + r * np.cos(a), lat + r * np.sin(a)] for r, a in zip(radii, angles)]
+    ring = ring[::-1] if clockwise else ring
+    return ring + ring[:1]
+
+
+def write_land(fp: str):
+    """
+    Writes a land shapefile: a jagged continent with a lake, an island, and a strip along the antimeridian.
+    :param fp: The path to the shapefile.
+    """
+    with shapefile.Writer(fp, shapeType=shapefile.POLYGON) as w:
+        w.field("name", "C")
+        w.poly([_ring(10., 20., 25., 97, True), _ring(12., 22., 5., 31, False)])
+        w.record("continent")
+        w.poly([_ring(-60.3, -33.7, 1.3, 23, True)])
+        w.record("island")
+        w.poly([[[170., -10.], [170., 10.], [180., 10.], [180., -10.], [170., -10.]]])
+        w.record("antimeridian")
+
+
+def near_land(features: list) -> list:
+    """
+    Moves the valid locations of features near the continent of write_land(), so that both LW and OP are raised.
+    Locations at 0 N, 0 E are kept, for LZ.
+    :param features: The features, which are changed.
+    :return: The features.
+    """
+    for feature in features:
+        lon, lat = feature["geometry"]["coordinates"]
+        if isinstance(lon, float) and isinstance(lat, float) and lon != 0.:
+            feature["geometry"]["coordinates"] = [10. + lon / 4., 20. + lat / 3.]
+    return features
+
+
+def checked(obs):
+    """
+    :param obs: Observations, as a list or an ObservationTable.
+    :return: The same observations, once tools.do_quality_check() has raised their flags.
+    """
+    tools.do_quality_check(obs, tqdm=quiet)
+    return obs
+
+
+def assert_tables_equal(test: unittest.TestCase, a: ObservationTable, b: ObservationTable):
+    """
+    Asserts that two tables hold the same rows: the same columns, codes, vocabularies, raw properties and flags.
+    :param test: The test case.
+    :param a: One table.
+    :param b: The other table.
+    """
+    test.assertEqual(a.columns, b.columns)
+    for name in a.columns:
+        np.testing.assert_array_equal(a[name], b[name], err_msg=name)
+        if name in ObservationTable._encoded_columns:
+            test.assertEqual(list(a.vocabulary(name)), list(b.vocabulary(name)), name)
+    test.assertEqual([a.records[i] for i in range(len(a))], [b.records[i] for i in range(len(b))])
+    test.assertEqual(a.flag_masks.tolist(), b.flag_masks.tolist())
+
+
+def assert_observations_equal(test: unittest.TestCase, a: list, b: list):
+    """
+    Asserts that two lists hold the same observations: the same raw properties, source, and flags.
+    :param test: The test case.
+    :param a: One list.
+    :param b: The other list.
+    """
+    test.assertEqual([(ob.fromAPI, ob.as_dict(), ob.flag_mask) for ob in a],
+                     [(ob.fromAPI, ob.as_dict(), ob.flag_mask) for ob in b])
@@ -0,0 +1,47 @@
+"""
+Tests that the cloud cover categories of cloud fractions are the ones the original loops over the thresholds gave.
+"""
+
+from globeqa import categories, tools
+from globeqa.observation import CloudCover, Observation
+import numpy as np
+import unittest
+
+
+def _reference_category(fraction: float):
+    """
+    The original Observation.bin_cloud_fraction(), kept to check the categories against.
+    """
+    fraction = min(max(fraction, 0.0), 1.0)
+    bins = dict(none=0.00, few=0.10, isolated=0.25, scattered=0.50, broken=0.90, overcast=1.00)
+    for k, v in bins.items():
+        if fraction <= v:
+            return k
+
+
+class TestBinCloudFraction(unittest.TestCase):
+    fractions = [-1., -0., 0., 1e-9, .05, .1, .1 + 1e-9, .25, .3, .5, .5 + 1e-9, .7, .9, .9 + 1e-9, .95, 1., 1.5,
+                 float("inf"), float("-inf")] + np.random.RandomState(0).uniform(-.1, 1.1, 1000).tolist()
+
+    def test_scalar_matches_reference(self):
+        for fraction in self.fractions + [float("nan")]:
+            expected = _reference_category(fraction)
+            self.assertEqual(categories.bin_cloud_fraction(fraction), expected, fraction)
+            self.assertEqual(Observation.bin_cloud_fraction(fraction), expected, fraction)
+            self.assertEqual(tools.bin_cloud_fraction(fraction, clip=True), expected, fraction)
+        self.assertIsNone(categories.bin_cloud_fraction(None))
+
+    def test_scalar_matches_array(self):
+        codes = categories.bin_cloud_fractions(self.fractions + [float("nan")])
+        self.assertEqual([categories.bin_cloud_fraction(f) for f in self.fractions + [float("nan")]],
+                         categories.tcc_categories(codes).tolist())
+
+    def test_cloud_cover_of_nan_is_overcast(self):
+        cover = CloudCover(float("nan"))
+        self.assertEqual(cover.cat, "overcast")
+        self.assertEqual(cover.mid, .95)
+        self.assertEqual(CloudCover(.3).cat, "scattered")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Tests that the filters give the same observations whether they are given a list or an ObservationTable.
+"""
+
+from datetime import datetime
+import fixtures
+from globeqa import tools
+from globeqa.ingest import IngestFilter
+from globeqa.observation import Observation
+from globeqa.table import ObservationTable
+from os.path import join
+import tempfile
+import unittest
+
+
+class TestFilterByDatetime(unittest.TestCase):
+    def test_list_and_table_filters_match(self):
+        features = fixtures.features(3000)
+        ranges = [(datetime(2019, 6, 3, 10, 30), datetime(2019, 6, 6, 7)), (None, datetime(2019, 6, 5)),
+                  (datetime(2019, 6, 5), None), (datetime(1990, 1, 1, 10), datetime(1990, 1, 1, 10, 0, 1))]
+        for earliest, latest in ranges:
+            obs = [Observation(feature=feature) for feature in features]
+            table = ObservationTable.from_observations(obs, tqdm=fixtures.quiet)
+            expected = [ob.id for ob in obs if ob.measured_dt is not None
+                        and (earliest is None or ob.measured_dt >= earliest)
+                        and (latest is None or ob.measured_dt < latest)]
+            self.assertGreater(len(expected), 0)
+            self.assertEqual([ob.id for ob in tools.filter_by_datetime(obs, earliest, latest)], expected)
+            self.assertEqual([ob.id for ob in tools.filter_by_datetime(table, earliest, latest).observations], expected)
+
+
+class TestIngestFilterRequire(unittest.TestCase):
+    def test_require_rejects_null_values(self):
+        features = [f for f in fixtures.features(1000) if f["properties"]["protocol"] == "sky_conditions"]
+        for i, feature in enumerate(features):
+            properties = feature["properties"]
+            if i % 5 == 0:
+                properties["skyconditionsCloudCover"] = [None, "null", "", " NULL "][i // 5 % 4]
+            elif i % 5 == 1:
+                properties.pop("skyconditionsCloudCover", None)
+        expected = [f["properties"]["skyconditionsObservationId"] for f in features
+                    if f["properties"].get("skyconditionsCloudCover") not in [None, "null", "", " NULL "]]
+        self.assertGreater(len(expected), 100)
+
+        with tempfile.TemporaryDirectory() as folder:
+            json, csv = join(folder, "observations.json"), join(folder, "observations.csv")
+            fixtures.write_geojson(json, features)
+            fixtures.write_csv(csv, features)
+            for parse, fp in [(tools.parse_json, json), (tools.parse_csv, csv)]:
+                where = IngestFilter(require=["tcc"])
+                self.assertEqual([ob.id for ob in parse(fp, where=where, tqdm=fixtures.quiet)], expected)
+                self.assertEqual(where.dropped["require"], len(features) - len(expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
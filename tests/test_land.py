@@ -0,0 +1,82 @@
+"""
+Tests that a LandMask classifies points exactly as the prepared land geometry does, including near coastlines.
+"""
+
+import fixtures
+from globeqa import tools
+from globeqa.land import LandMask, load_land_geometry, prepared_land
+from globeqa.observation import Observation
+import numpy as np
+from os.path import join
+import shapely.geometry as sgeom
+import tempfile
+import unittest
+
+
+class TestLandMask(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.shapefile = join(cls.folder.name, "land.shp")
+        fixtures.write_land(cls.shapefile)
+        cls.cache = join(cls.folder.name, "cache")
+        cls.geometry = load_land_geometry(cls.shapefile, cls.cache)
+        cls.exact = prepared_land(shapefile=cls.shapefile, cache=cls.cache)
+        cls.mask = LandMask.open(shapefile=cls.shapefile, cells_per_degree=12, cache=cls.cache, tqdm=fixtures.quiet)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
+
+    def points(self):
+        """
+        :return: The longitude and latitude of points all over the globe, on and near the coastlines, on the edges of
+        cells, and on the edges of the grid.
+        """
+        r = np.random.RandomState(0)
+        lon, lat = list(r.uniform(-180., 180., 5000)), list(r.uniform(-90., 90., 5000))
+        boundary = self.geometry.boundary
+        for t in r.uniform(0., boundary.length, 5000):
+            point = boundary.interpolate(t)
+            lon += [point.x, point.x + r.uniform(-.05, .05)]
+            lat += [point.y, point.y + r.uniform(-.05, .05)]
+        for x, y in r.uniform(-1., 1., (2000, 2)):
+            lon.append(np.round((10. + 30. * x) * 12) / 12)
+            lat.append(np.round((20. + 30. * y) * 12) / 12)
+        lon += [-180., 180., 179.999, 0., 175., 175.]
+        lat += [0., 0., 0., -90., 90., 10.]
+        return np.array(lon), np.array(lat)
+
+    def test_mask_matches_geometry(self):
+        lon, lat = self.points()
+        expected = np.array([self.exact.contains(sgeom.Point(x, y)) for x, y in zip(lon, lat)])
+        self.assertEqual(np.flatnonzero(self.mask.contains_points(lon, lat) != expected).tolist(), [])
+        single = np.array([self.mask.contains(sgeom.Point(x, y)) for x, y in zip(lon[:500], lat[:500])])
+        self.assertEqual(np.flatnonzero(single != expected[:500]).tolist(), [])
+
+        # Both the raster and the exact geometry decided some of the points.
+        land, mixed = self.mask.cells(lon, lat)
+        self.assertGreater(np.count_nonzero(land & ~mixed), 1000)
+        self.assertGreater(np.count_nonzero(mixed), 5000)
+
+    def test_cached_mask_matches_geometry(self):
+        lon, lat = self.points()
+        cached = LandMask.open(shapefile=self.shapefile, cells_per_degree=12, cache=self.cache, tqdm=fixtures.quiet)
+        self.assertIsInstance(cached._land, np.memmap)
+        differ = cached.contains_points(lon, lat) != self.mask.contains_points(lon, lat)
+        self.assertEqual(np.flatnonzero(differ).tolist(), [])
+
+    def test_quality_check_with_mask_matches_geometry(self):
+        features = fixtures.near_land(fixtures.features(3000))
+        with_mask = [Observation(feature=feature) for feature in features]
+        tools.do_quality_check(with_mask, self.mask, tqdm=fixtures.quiet)
+        with_geometry = [Observation(feature=feature) for feature in features]
+        tools.do_quality_check(with_geometry, self.exact, tqdm=fixtures.quiet)
+        differ = [o for o, (a, b) in enumerate(zip(with_mask, with_geometry)) if a.flag_mask != b.flag_mask]
+        self.assertEqual(differ, [])
+        self.assertGreater(sum(ob.has_flag("LW") for ob in with_mask), 100)
+        self.assertGreater(sum(ob.has_flag("OP") for ob in with_mask), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+Tests that the faster ways of parsing a file give the same observations as parsing it serially.
+"""
+
+import fixtures
+from globeqa import tools
+from globeqa.ingest import IngestFilter
+from os.path import join
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+
+class _ParseTestCase(unittest.TestCase):
+    """
+    Writes the generated features to a GeoJSON file and their sky conditions to a CSV file in a temporary folder.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.features = fixtures.features(3000)
+        self.json = join(self.folder.name, "observations.json")
+        fixtures.write_geojson(self.json, self.features)
+        self.csv = join(self.folder.name, "observations.csv")
+        fixtures.write_csv(self.csv, self.features)
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+
+class TestSnapshotCache(_ParseTestCase):
+    def test_snapshot_matches_fresh_parse(self):
+        cache = join(self.folder.name, "cache")
+        for parse, fp in [(tools.parse_json, self.json), (tools.parse_csv, self.csv)]:
+            fresh = fixtures.checked(parse(fp, tqdm=fixtures.quiet, as_table=True))
+            fresh_list = fixtures.checked(parse(fp, tqdm=fixtures.quiet))
+            built = parse(fp, tqdm=fixtures.quiet, as_table=True, cache=cache)
+            fixtures.assert_tables_equal(self, fixtures.checked(built), fresh)
+            self.assertNotEqual(os.listdir(cache), [])
+
+            # The second parse is loaded from the snapshot, without reading the file again.
+            with mock.patch.object(tools, "iter_json", side_effect=AssertionError), \
+                    mock.patch.object(tools, "_iter_csv", side_effect=AssertionError):
+                loaded = parse(fp, tqdm=fixtures.quiet, as_table=True, cache=cache)
+                loaded_list = parse(fp, tqdm=fixtures.quiet, cache=cache)
+            fixtures.assert_tables_equal(self, fixtures.checked(loaded), fresh)
+            fixtures.assert_observations_equal(self, fixtures.checked(loaded_list), fresh_list)
+
+    def test_snapshot_is_rebuilt_when_file_changes(self):
+        cache = join(self.folder.name, "cache")
+        tools.parse_json(self.json, tqdm=fixtures.quiet, as_table=True, cache=cache)
+        fixtures.write_geojson(self.json, self.features[:100])
+        loaded = tools.parse_json(self.json, tqdm=fixtures.quiet, as_table=True, cache=cache)
+        fixtures.assert_tables_equal(self, loaded, tools.parse_json(self.json, tqdm=fixtures.quiet, as_table=True))
+
+
+class TestShardedJSON(_ParseTestCase):
+    def test_sharded_parse_matches_serial(self):
+        # The file is split, rather than falling back to a serial parse.
+        self.assertIsNotNone(tools._parse_json_parallel(self.json, 3, None, tqdm=fixtures.quiet))
+
+        serial = fixtures.checked(tools.parse_json(self.json, tqdm=fixtures.quiet, as_table=True))
+        sharded = tools.parse_json(self.json, tqdm=fixtures.quiet, as_table=True, workers=3)
+        fixtures.assert_tables_equal(self, fixtures.checked(sharded), serial)
+
+        serial = fixtures.checked(tools.parse_json(self.json, tqdm=fixtures.quiet))
+        sharded = tools.parse_json(self.json, tqdm=fixtures.quiet, workers=3)
+        fixtures.assert_observations_equal(self, fixtures.checked(sharded), serial)
+
+    def test_sharded_parse_with_options_matches_serial(self):
+        options = dict(columns=["measured_dt", "tcc", "lat", "lon"], as_table=True, tqdm=fixtures.quiet)
+        serial, sharded = IngestFilter(protocols=["sky_conditions"]), IngestFilter(protocols=["sky_conditions"])
+        fixtures.assert_tables_equal(self, tools.parse_json(self.json, where=sharded, workers=3, **options),
+                                     tools.parse_json(self.json, where=serial, **options))
+        self.assertEqual(sharded.dropped, serial.dropped)
+
+
+class TestParallelCSV(_ParseTestCase):
+    def assert_parallel_matches_serial(self, fp: str, **options):
+        serial = fixtures.checked(tools.parse_csv(fp, tqdm=fixtures.quiet, as_table=True, **options))
+        parallel = tools.parse_csv(fp, tqdm=fixtures.quiet, as_table=True, workers=3, **options)
+        fixtures.assert_tables_equal(self, fixtures.checked(parallel), serial)
+
+    def test_parallel_parse_matches_serial(self):
+        # The file is split, rather than falling back to a serial parse.
+        self.assertIsNotNone(tools._parse_csv_parallel(self.csv, 10 ** 9, "sky_conditions", 3, None,
+                                                          tqdm=fixtures.quiet))
+        self.assert_parallel_matches_serial(self.csv)
+
+        serial = fixtures.checked(tools.parse_csv(self.csv, tqdm=fixtures.quiet))
+        parallel = tools.parse_csv(self.csv, tqdm=fixtures.quiet, workers=3)
+        fixtures.assert_observations_equal(self, fixtures.checked(parallel), serial)
+
+    def test_parallel_parse_keeps_count_limit(self):
+        self.assert_parallel_matches_serial(self.csv, count=100)
+
+    def test_parallel_parse_of_other_line_endings_and_encodings(self):
+        for encoding, newline in [("utf-8-sig", "\r\n"), ("utf-8", "\r"), ("utf-16", "\n")]:
+            fp = join(self.folder.name, "observations_{}.csv".format(encoding))
+            fixtures.write_csv(fp, self.features, encoding, newline)
+            self.assert_parallel_matches_serial(fp)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+Tests that checking observations in worker processes raises the same flags as checking them in this process.
+"""
+
+import fixtures
+from globeqa import tools
+from globeqa.flagstore import FlagStore
+from globeqa.land import LandMask, prepared_land
+from globeqa.observation import Observation
+from globeqa.table import ObservationTable
+from os.path import join
+import tempfile
+import unittest
+from unittest import mock
+
+
+class TestParallelQualityCheck(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.folder = tempfile.TemporaryDirectory()
+        cls.shapefile = join(cls.folder.name, "land.shp")
+        fixtures.write_land(cls.shapefile)
+        cls.cache = join(cls.folder.name, "cache")
+        cls.lands = [None, prepared_land(shapefile=cls.shapefile, cache=cls.cache),
+                     LandMask.open(shapefile=cls.shapefile, cells_per_degree=12, cache=cls.cache, tqdm=fixtures.quiet)]
+        cls.features = fixtures.near_land(fixtures.features(3000))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.folder.cleanup()
+
+    def observations(self, as_table: bool):
+        obs = [Observation(feature=feature) for feature in self.features]
+        return ObservationTable.from_observations(obs, tqdm=fixtures.quiet) if as_table else obs
+
+    def assert_same_flags(self, land, **options):
+        serial = self.observations(False)
+        tools.do_quality_check(serial, land, tqdm=fixtures.quiet)
+        expected = tools.get_flag_masks(serial).tolist()
+        for as_table in [False, True]:
+            parallel = self.observations(as_table)
+            tools.do_quality_check(parallel, land, tqdm=fixtures.quiet, workers=3, **options)
+            self.assertEqual(tools.get_flag_masks(parallel).tolist(), expected)
+            self.assertEqual([ob.flag_mask for ob in parallel], expected)
+
+    def test_parallel_check_matches_serial(self):
+        for land in self.lands:
+            self.assert_same_flags(land)
+
+    def test_workers_that_load_land_from_cache_match_serial(self):
+        # Workers that are not forked load the land from its source instead of inheriting it.
+        with mock.patch.object(tools.multiprocessing, "get_start_method", return_value="spawn"):
+            for land in self.lands:
+                self.assert_same_flags(land)
+
+    def test_parallel_check_with_store_matches_serial(self):
+        for land in self.lands[1:]:
+            with FlagStore(join(self.folder.name, "flags.db")) as store:
+                self.assert_same_flags(land, store=store)
+
+
+if __name__ == "__main__":
+    unittest.main()
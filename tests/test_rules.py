@@ -0,0 +1,132 @@
+"""
+Tests that the rules in globeqa.rules raise the same flags as the per-observation checks they replaced.
+"""
+
+import fixtures
+from globeqa import rules, tools
+from globeqa.observation import Observation
+from globeqa.table import ObservationTable
+import shapely.geometry as sgeom
+from shapely.prepared import prep
+import unittest
+
+
+def _reference_flags(ob: Observation, land=None):
+    """
+    Raises flags on an observation the way Observation.check_for_flags() did before the checks were declared as rules,
+    one property at a time.
+    :param ob: The observation.
+    :param land: The PreparedGeometry for checking whether the location is over land, or None.
+    """
+    _ = ob.elevation
+
+    dt = ob.measured_dt
+    if dt is not None:
+        if dt > dt.now():
+            ob.flag("DF")
+        if dt.year < 1995:
+            ob.flag("DO")
+        if dt.hour == 0 and dt.minute == 0:
+            ob.flag("DZ")
+
+    if ob.lat is not None and ob.lon is not None:
+        if land is not None:
+            if not land.contains(sgeom.Point(ob.lon, ob.lat)):
+                ob.flag("LW")
+            elif ob.soft_get("Spray") == "true":
+                ob.flag("OP")
+        if ob.lat == 0. and ob.lon == 0.:
+            ob.flag("LZ")
+    else:
+        ob.flag("LI")
+
+    if ob["protocol"] == "sky_conditions":
+        num_obscurations = bin(ob.obscuration_mask).count("1")
+        if num_obscurations == 2:
+            ob.flag("OD")
+        elif num_obscurations > 2:
+            ob.flag("OR")
+        if (num_obscurations > 0) and (ob.tcc != "obscured"):
+            ob.flag("OO")
+        elif (num_obscurations == 0) and (ob.tcc == "obscured"):
+            ob.flag("OX")
+        elif ((num_obscurations > 0) or (ob.tcc == "obscured")) and (ob.cloud_type_mask != 0):
+            ob.flag("OC")
+        haze = ob.soft_get("Haze")
+        sky_clarity = ob.soft_get("SkyClarity")
+        if (haze == "true") and (sky_clarity != "extremely hazy"):
+            ob.flag("HO")
+        elif (haze != "true") and (sky_clarity == "extremely hazy"):
+            ob.flag("HC")
+
+    if ob["protocol"] == "tree_heights":
+        ob.check_key_in_range("TreeHeightAvgM", 0., 99., "T", -99.)
+    if ob["protocol"] == "mosquito_habitat_mapper":
+        val = ob.soft_get("LarvaeCount")
+        if val is not None:
+            try:
+                val = float(val)
+                if not (0 <= val <= 199):
+                    ob.flag("MR")
+            except ValueError:
+                if val not in ob._larvae_count_ranges:
+                    ob.flag("MI")
+    contrails = 0
+    for key in ob._contrail_keys:
+        val = ob.soft_get(key)
+        try:
+            if (val is not None) and (val.strip() != ""):
+                contrails += float(val)
+        except ValueError:
+            ob.flag("NI")
+    if contrails >= 20:
+        ob.flag("NR")
+
+
+class TestRules(unittest.TestCase):
+    features = fixtures.features(2000)
+    land = prep(sgeom.box(-60, -30, 60, 40).union(sgeom.box(100, 10, 150, 60)))
+
+    def reference(self, land=None) -> list:
+        obs = [Observation(feature=feature) for feature in self.features]
+        for ob in obs:
+            _reference_flags(ob, land)
+        return [ob.flag_mask for ob in obs]
+
+    def assert_same_flags(self, expected: list, masks):
+        for i, (e, m) in enumerate(zip(expected, masks)):
+            self.assertEqual(Observation.decode_flags(e), Observation.decode_flags(int(m)),
+                             "feature {}: {}".format(i, self.features[i]["properties"]))
+
+    def test_rules_match_reference(self):
+        for land in [None, self.land]:
+            obs = [Observation(feature=feature) for feature in self.features]
+            table = ObservationTable.from_observations(obs, tqdm=fixtures.quiet)
+            self.assert_same_flags(self.reference(land), rules.evaluate(table, land))
+
+    def test_flag_bits_are_stable(self):
+        # Masks are saved, exported and packed, so the bit of a flag must never change.
+        flags = ["CI", "CM", "CX", "DF", "DI", "DO", "DX", "DZ", "EI", "EM", "ER", "EX", "HC", "HO", "LI", "LW", "LZ",
+                 "MI", "MR", "NI", "NR", "OC", "OD", "OO", "OP", "OR", "OX", "TI", "TM", "TR", "TX", "PI", "LM"]
+        self.assertEqual([Observation.flag_bit(flag) for flag in flags], [1 << i for i in range(len(flags))])
+
+    def test_check_for_flags_matches_reference(self):
+        obs = [Observation(feature=feature) for feature in self.features]
+        for ob in obs:
+            ob.check_for_flags(self.land)
+        self.assert_same_flags(self.reference(self.land), [ob.flag_mask for ob in obs])
+
+    def test_quality_check_of_table_raises_flags_on_the_table(self):
+        obs = [Observation(feature=feature) for feature in self.features]
+        tools.do_quality_check(obs, self.land, tqdm=fixtures.quiet)
+        table = ObservationTable.from_observations([Observation(feature=feature) for feature in self.features],
+                                                   tqdm=fixtures.quiet)
+        tools.do_quality_check(table, self.land, tqdm=fixtures.quiet)
+        self.assertEqual(len(table._views), 0)
+        self.assertEqual(tools.get_flag_masks(table).tolist(), [ob.flag_mask for ob in obs])
+        self.assertEqual([ob.flag_mask for ob in table], [ob.flag_mask for ob in obs])
+        self.assertEqual(tools.get_flag_masks(table[10:20]).tolist(), [ob.flag_mask for ob in obs[10:20]])
+
+
+if __name__ == "__main__":
+    unittest.main()
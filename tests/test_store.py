@@ -0,0 +1,175 @@
+"""
+Tests ObservationStore against a local HTTP server that stands in for the GLOBE API.
+"""
+
+from datetime import date, datetime, timedelta
+from globeqa import tools
+from globeqa.store import ObservationStore
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from os.path import isdir, isfile, join
+import tempfile
+import threading
+import time
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+
+class _FakeAPI(BaseHTTPRequestHandler):
+    """
+    Answers API queries with one sky conditions observation per day in the requested range, or with an error while
+    the server's fail attribute is set or if the range starts on a day in its fail_starts attribute.  Every query is
+    recorded in the server's requests attribute.  Each answer takes the server's delay attribute in seconds, and the
+    most queries answered at once is kept in its concurrency attribute.
+    """
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        with self.server.lock:
+            self.server.requests.append(query)
+            self.server.in_flight += 1
+            self.server.concurrency = max(self.server.concurrency, self.server.in_flight)
+        try:
+            time.sleep(self.server.delay)
+            self.answer(query)
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def answer(self, query: dict):
+        if self.server.fail or query["startdate"][0] in self.server.fail_starts:
+            self.send_error(500)
+            return
+
+        start = datetime.strptime(query["startdate"][0], "%Y-%m-%d").date()
+        end = datetime.strptime(query["enddate"][0], "%Y-%m-%d").date()
+        features = []
+        day = start
+        while day <= end:
+            features.append(dict(type="Feature", geometry=dict(type="Point", coordinates=[-75., 40.]), properties={
+                "protocol": "sky_conditions",
+                "skyconditionsMeasuredAt": day.strftime("%Y-%m-%dT12:00:00"),
+                "skyconditionsUserid": day.toordinal(),
+            }))
+            day += timedelta(1)
+        body = json.dumps(dict(type="FeatureCollection", features=features)).encode("utf8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+class _FakeAPITestCase(unittest.TestCase):
+    """
+    Starts a _FakeAPI server and a temporary folder for each test.
+    """
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeAPI)
+        self.server.requests = []
+        self.server.fail = False
+        self.server.fail_starts = set()
+        self.server.delay = 0.
+        self.server.lock = threading.Lock()
+        self.server.in_flight = 0
+        self.server.concurrency = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = "http://127.0.0.1:{}/".format(self.server.server_port)
+        self.folder = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.folder.cleanup()
+
+
+def _features(fp: str) -> list:
+    """
+    :param fp: The path to a GeoJSON file.
+    :return: Its features.
+    """
+    with open(fp, "r", encoding="utf8") as f:
+        return json.load(f)["features"]
+
+
+class TestObservationStore(_FakeAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = ObservationStore(join(self.folder.name, "store"), retries=0, base_url=self.base_url)
+
+    def download(self, start: date, end: date) -> str:
+        return self.store.download(["sky_conditions"], start, end, join(self.folder.name, "%P_%S_%E.json"),
+                                   today=date(2019, 7, 1))
+
+    def test_download_splits_range_into_partitions(self):
+        fp = self.download(date(2019, 6, 1), date(2019, 6, 3))
+        self.assertEqual(len(self.server.requests), 1)
+        for key in ["2019-06-01", "2019-06-02", "2019-06-03"]:
+            self.assertTrue(isfile(self.store.path("sky_conditions", key)))
+        obs = tools.parse_json(fp, tqdm=lambda iterable, *_, **__: iterable)
+        self.assertEqual([ob["skyconditionsUserid"] for ob in obs],
+                         [date(2019, 6, d).toordinal() for d in [1, 2, 3]])
+
+    def test_only_missing_partitions_are_downloaded(self):
+        self.download(date(2019, 6, 1), date(2019, 6, 3))
+        self.download(date(2019, 6, 2), date(2019, 6, 5))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(self.server.requests[1]["startdate"], ["2019-06-04"])
+        self.assertEqual(self.server.requests[1]["enddate"], ["2019-06-05"])
+
+        self.download(date(2019, 6, 1), date(2019, 6, 5))
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_failed_download_leaves_store_unchanged(self):
+        self.server.fail = True
+        with self.assertRaises(IOError):
+            self.download(date(2019, 6, 1), date(2019, 6, 1))
+        self.assertEqual(self.store.missing(["sky_conditions"], date(2019, 6, 1), date(2019, 6, 1)),
+                         [("sky_conditions", "2019-06-01")])
+
+        self.server.fail = False
+        self.download(date(2019, 6, 1), date(2019, 6, 1))
+        self.assertEqual(self.store.missing(["sky_conditions"], date(2019, 6, 1), date(2019, 6, 1)), [])
+
+
+class TestChunkedDownload(_FakeAPITestCase):
+    def download(self, dest: str, chunk_months=None) -> str:
+        return tools.download_from_api(["sky_conditions"], date(2019, 1, 15), date(2019, 3, 10),
+                                       download_dest=join(self.folder.name, dest), base_url=self.base_url,
+                                       chunk_months=chunk_months, retries=0, tqdm=lambda iterable, *_, **__: iterable)
+
+    def test_chunks_merge_into_single_download(self):
+        fp = self.download("chunked.json", chunk_months=1)
+        self.assertEqual([(q["startdate"][0], q["enddate"][0]) for q in sorted(
+                             self.server.requests, key=lambda q: q["startdate"])],
+                         [("2019-01-15", "2019-01-31"), ("2019-02-01", "2019-02-28"), ("2019-03-01", "2019-03-10")])
+        self.assertTrue(isfile(fp))
+        self.assertEqual(_features(fp), _features(self.download("single.json")))
+
+    def test_chunks_are_downloaded_concurrently(self):
+        self.server.delay = 0.2
+        self.download("chunked.json", chunk_months=1)
+        self.assertEqual(self.server.concurrency, 3)
+
+    def test_only_failed_chunks_are_downloaded_again(self):
+        self.server.fail_starts = {"2019-02-01"}
+        fp = self.download("chunked.json", chunk_months=1)
+        self.assertFalse(isfile(fp))
+        self.assertEqual(len(self.server.requests), 3)
+
+        self.server.fail_starts = set()
+        self.server.requests.clear()
+        fp = self.download("chunked.json", chunk_months=1)
+        self.assertEqual([(q["startdate"][0], q["enddate"][0]) for q in self.server.requests],
+                         [("2019-02-01", "2019-02-28")])
+        self.assertFalse(isdir(fp + ".chunks"))
+        self.assertEqual(_features(fp), _features(self.download("single.json")))
+
+
+if __name__ == "__main__":
+    unittest.main()